@@ -1,6 +1,7 @@
 """Admin configuration for conversations app."""
 from django.contrib import admin
 from .models import Conversation, Message
+from .search import search_conversations, search_messages
 
 
 class MessageInline(admin.TabularInline):
@@ -14,14 +15,27 @@ class MessageInline(admin.TabularInline):
 class ConversationAdmin(admin.ModelAdmin):
     list_display = ['client', 'platform', 'lawyer', 'status', 'created_at']
     list_filter = ['status', 'platform', 'created_at']
-    search_fields = ['client__name', 'subject']
-    readonly_fields = ['id', 'created_at', 'updated_at', 'closed_at']
+    # Shows the search box; get_search_results does the matching
+    search_fields = ['client__name', 'client__cedula', 'subject', 'messages__content']
+    readonly_fields = ['id', 'created_at', 'updated_at', 'closed_at', 'platform_user_read_at', 'lawyer_read_at']
     inlines = [MessageInline]
 
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text search (see search.py) instead of an ILIKE scan per search field
+        if not search_term.strip():
+            return queryset, False
+        return search_conversations(queryset, search_term.strip()), False
+
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ['conversation', 'sender_name', 'sender_type', 'is_read', 'sent_at']
-    list_filter = ['sender_type', 'is_read', 'sent_at']
-    search_fields = ['content', 'sender_name']
-    readonly_fields = ['id', 'sent_at']
\ No newline at end of file
+    list_filter = ['sender_type', 'sent_at']
+    list_select_related = ['conversation__platform', 'conversation__client']
+    search_fields = ['content']
+    readonly_fields = ['id', 'sent_at']
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search_messages(queryset, search_term.strip()), False
\ No newline at end of file
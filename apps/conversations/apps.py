@@ -5,3 +5,6 @@ class ConversationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.conversations'
     verbose_name = 'Conversaciones'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,119 @@
+"""
+Native async views for the widget's hot endpoints: message polling, message sending
+and conversation creation. They are routed ahead of ConversationViewSet on its URLs
+and run on the event loop with the async ORM instead of taking a worker thread per
+request through DRF. The parsing and side effects live in views.py (conversation
+opening, message page parsing, post-send side effects); benchmark_urls.py serves the
+same messages page through DRF as the sync reference the widget benchmark compares against.
+"""
+import json
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST, require_safe
+from apps.platforms.authentication import async_platform_required
+from .models import Conversation, Message
+from .serializers import ConversationCreateSerializer, MessageCreateSerializer, MessageSerializer
+from .views import (
+    ConversationViewSet, conversation_created_body, message_page_body, message_page_params, message_sent,
+    messages_after, open_conversation,
+)
+
+conversation_list = ConversationViewSet.as_view({'get': 'list'})
+
+
+def error_response(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def request_data(request):
+    """The request body as DRF would parse it: (data, None), or (None, error response)."""
+    if request.content_type != 'application/json':
+        return request.POST, None
+    try:
+        return json.loads(request.body or b'{}'), None
+    except ValueError as exc:
+        return None, JsonResponse({'detail': f'JSON parse error - {exc}'}, status=400)
+
+
+async def get_conversation(request, pk):
+    try:
+        return await Conversation.objects.filter(platform=request.platform).aget(pk=pk)
+    except Conversation.DoesNotExist:
+        return None
+
+
+def not_found():
+    return JsonResponse({'detail': 'No Conversation matches the given query.'}, status=404)
+
+
+@csrf_exempt
+async def conversations(request):
+    """POST creates a conversation on the event loop; anything else is ConversationViewSet.list."""
+    if request.method == 'POST':
+        return await create_conversation(request)
+    return await sync_to_async(conversation_list)(request)
+
+
+@async_platform_required
+async def create_conversation(request):
+    data, error = request_data(request)
+    if error:
+        return error
+    serializer = ConversationCreateSerializer(data=data)
+    # Validating the client, loan and platform_user ids reads them from the database
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=400)
+
+    # Client upsert, welcome message and assignment in one thread hop, through the viewset's code
+    conversation = await sync_to_async(open_conversation)(
+        request.platform, serializer.validated_data, data.get('client_data', {})
+    )
+    return JsonResponse(conversation_created_body(conversation), status=201)
+
+
+@csrf_exempt
+@require_POST
+@async_platform_required
+async def send_message(request, pk):
+    conversation = await get_conversation(request, pk)
+    if conversation is None:
+        return not_found()
+    data, error = request_data(request)
+    if error:
+        return error
+    serializer = MessageCreateSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    message = await Message.objects.acreate(conversation=conversation, **serializer.validated_data)
+    await sync_to_async(message_sent)(message)
+    return JsonResponse(MessageSerializer(message).data, status=201)
+
+
+@require_safe
+@async_platform_required
+async def messages(request, pk):
+    """Full history, or the page after ?after= (message id or sent_at) with up to ?limit= messages and a next_cursor."""
+    conversation = await get_conversation(request, pk)
+    if conversation is None:
+        return not_found()
+    # Related-manager rows come back with this conversation attached, so is_read needs no query
+    messages = conversation.messages.order_by('sent_at', 'id')
+    if 'after' not in request.GET and 'limit' not in request.GET:
+        history = [message async for message in messages]
+        return JsonResponse(MessageSerializer(history, many=True).data, safe=False)
+
+    try:
+        after, cursor, limit = message_page_params(request.GET)
+    except ValueError as exc:
+        return error_response(str(exc))
+    if cursor is not None:
+        message_id, sent_at = cursor
+        if message_id is not None:
+            sent_at = await conversation.messages.filter(id=message_id).values_list('sent_at', flat=True).afirst()
+            if sent_at is None:
+                return error_response('Invalid cursor')
+        messages = messages.filter(messages_after(sent_at, message_id))
+
+    return JsonResponse(message_page_body([message async for message in messages[:limit + 1]], limit, after))
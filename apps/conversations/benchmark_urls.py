@@ -0,0 +1,46 @@
+"""
+URLconf for the sync phase of benchmark_widget_api: the widget's messages poll served
+through DRF, one worker thread per request, as it was before async_views.py. It is not
+routed in config/urls.py.
+"""
+from django.shortcuts import get_object_or_404
+from django.urls import path
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from apps.platforms.authentication import APIKeyAuthentication, PlatformPermission
+from .models import Conversation
+from .serializers import MessageSerializer
+from .views import message_page_body, message_page_params, messages_after
+
+
+class MessagesView(APIView):
+    """Same contract as async_views.messages, on the sync ORM."""
+    authentication_classes = [APIKeyAuthentication]
+    permission_classes = [PlatformPermission]
+
+    def get(self, request, pk):
+        conversation = get_object_or_404(Conversation, platform=request.platform, pk=pk)
+        messages = conversation.messages.order_by('sent_at', 'id')
+        if 'after' not in request.query_params and 'limit' not in request.query_params:
+            return Response(MessageSerializer(messages, many=True).data)
+
+        try:
+            after, cursor, limit = message_page_params(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if cursor is not None:
+            message_id, sent_at = cursor
+            if message_id is not None:
+                sent_at = conversation.messages.filter(id=message_id).values_list('sent_at', flat=True).first()
+                if sent_at is None:
+                    return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            messages = messages.filter(messages_after(sent_at, message_id))
+
+        # Fetch one extra row to know whether there are more pages without a COUNT
+        return Response(message_page_body(list(messages[:limit + 1]), limit, after))
+
+
+urlpatterns = [
+    path('api/v1/conversations/<uuid:pk>/messages/', MessagesView.as_view(), name='conversation-messages'),
+]
@@ -0,0 +1,56 @@
+"""Helpers shared by the benchmark commands: in-process ASGI requests and latency summaries."""
+import asyncio
+import math
+from django.conf import settings
+
+
+def host_header():
+    return (b'host', settings.ALLOWED_HOSTS[0].lstrip('.').encode())
+
+
+async def asgi_request(app, path, method='GET', query_string='', headers=(), body=b''):
+    """Run one HTTP request through an ASGI application; returns (status, body)."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': query_string.encode(),
+        'headers': [host_header(), *headers], 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    requested = asyncio.Event()
+    response = {'body': b''}
+
+    async def receive():
+        if not requested.is_set():
+            requested.set()
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # The client never disconnects; Django cancels this wait once the response is sent
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await app(scope, receive, send)
+    return response['status'], response['body']
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Latency percentiles (ms) and throughput for `latencies` measured over `elapsed` seconds."""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0,
+    }
@@ -1,19 +1,128 @@
 """WebSocket consumers for real-time chat."""
+import asyncio
 import json
+import logging
+import time
+import uuid
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+from apps.notifications.dispatch import lawyer_group_name
+from .persistence import MessageBufferFull, message_buffer
+from .realtime import QUEUE_GROUP, QUEUE_SNAPSHOT_LIMIT, chat_group_name, message_payload, queue_cases, read_payload
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters for typing events, see typing_stats()
+_typing_counters = {'received': 0, 'forwarded': 0, 'suppressed': 0, 'expired': 0}
+
+
+def typing_stats():
+    """Typing events received from sockets, forwarded to rooms, suppressed, and expired starts."""
+    return dict(_typing_counters)
+
+
+class TypingThrottle:
+    """
+    Typing state of one connection. Only start/stop changes reach the room, at most one
+    every `min_interval` seconds (changes in between are coalesced into one trailing
+    send), and a start without a refresh or stop within `timeout` seconds becomes a stop.
+    """
+
+    def __init__(self, publish, min_interval, timeout):
+        self.publish = publish
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.sent = False
+        self.sent_at = float('-inf')
+        self.wanted = False
+        self.sender_name = ''
+        self._trailing = None
+        self._expiry = None
+
+    async def update(self, is_typing, sender_name):
+        _typing_counters['received'] += 1
+        self.sender_name = sender_name
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        if is_typing:
+            self._expiry = asyncio.create_task(self._expire())
+        if not await self._set(is_typing):
+            _typing_counters['suppressed'] += 1
+
+    async def close(self):
+        """Cancel timers and tell the room this connection stopped typing."""
+        for task in (self._trailing, self._expiry):
+            if task is not None:
+                task.cancel()
+        self._trailing = self._expiry = None
+        if self.sent:
+            self.wanted = False
+            await self._send()
+
+    async def _set(self, is_typing):
+        self.wanted = is_typing
+        if self._trailing is not None:
+            return False
+        if is_typing == self.sent:
+            return False
+        wait = self.sent_at + self.min_interval - time.monotonic()
+        if wait > 0:
+            self._trailing = asyncio.create_task(self._send_later(wait))
+        else:
+            await self._send()
+        return True
+
+    async def _send_later(self, wait):
+        await asyncio.sleep(wait)
+        self._trailing = None
+        if self.wanted == self.sent:
+            # Started and stopped again (or the reverse) within the interval
+            _typing_counters['suppressed'] += 1
+        else:
+            await self._send()
+
+    async def _send(self):
+        self.sent = self.wanted
+        self.sent_at = time.monotonic()
+        _typing_counters['forwarded'] += 1
+        await self.publish(self.sent, self.sender_name)
+
+    async def _expire(self):
+        await asyncio.sleep(self.timeout)
+        self._expiry = None
+        _typing_counters['expired'] += 1
+        await self._set(False)
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer for real-time chat in a conversation."""
 
     async def connect(self):
-        self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
-        self.room_group_name = f'chat_{self.conversation_id}'
+        self.conversation_id = await self.get_conversation_id(self.scope['url_route']['kwargs']['conversation_id'])
+        if self.conversation_id is None:
+            await self.close(code=4404)
+            return
+        self.room_group_name = chat_group_name(self.conversation_id)
+        self.reader = await self.get_reader()
+        self.typing = TypingThrottle(
+            self.publish_typing, settings.CHAT_TYPING_MIN_INTERVAL, settings.CHAT_TYPING_TIMEOUT
+        )
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
 
     async def disconnect(self, close_code):
+        if self.conversation_id is None:
+            return
+        await self.typing.close()
+        # Messages from this socket are in the database before the disconnect completes
+        try:
+            await message_buffer.flush()
+        except DatabaseError:
+            logger.exception('Could not flush chat messages for conversation %s', self.conversation_id)
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
     async def receive(self, text_data):
@@ -23,41 +132,77 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.handle_chat_message(data)
         elif message_type == 'typing':
             await self.handle_typing(data)
+        elif message_type == 'read':
+            await self.handle_read(data)
 
     async def handle_chat_message(self, data):
-        content = data.get('content', '')
+        """
+        Broadcast the message right away; message_buffer saves it shortly after, or sends
+        message_failed for it if the row cannot be written.
+        """
+        from .models import Message, SenderType
         sender_type = data.get('sender_type', '')
-        sender_id = data.get('sender_id', '')
-        sender_name = data.get('sender_name', '')
-        message = await self.save_message(content, sender_type, sender_id, sender_name)
+        if sender_type not in SenderType.values:
+            await self.send(text_data=json.dumps({'type': 'error', 'error': 'Invalid sender_type'}))
+            return
+        try:
+            sender_id = uuid.UUID(str(data.get('sender_id')))
+        except ValueError:
+            sender_id = None
+        message = Message(
+            conversation_id=self.conversation_id,
+            content=data.get('content', ''),
+            sender_type=sender_type,
+            sender_id=sender_id,
+            sender_name=data.get('sender_name', ''),
+        )
+        try:
+            message_buffer.add(message)
+        except MessageBufferFull:
+            logger.error('Chat write buffer is full; rejected a message for conversation %s', self.conversation_id)
+            await self.send(text_data=json.dumps({'type': 'error', 'error': 'Message not saved, try again'}))
+            return
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': {
-                    'id': str(message.id),
-                    'content': content,
-                    'sender_type': sender_type,
-                    'sender_id': sender_id,
-                    'sender_name': sender_name,
-                    'sent_at': message.sent_at.isoformat(),
-                }
-            }
+            {'type': 'chat_message', 'message': message_payload(message)}
         )
 
     async def handle_typing(self, data):
+        await self.typing.update(bool(data.get('is_typing', False)), data.get('sender_name', ''))
+
+    async def publish_typing(self, is_typing, sender_name):
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                'type': 'typing_indicator',
-                'sender_name': data.get('sender_name', ''),
-                'is_typing': data.get('is_typing', False),
-            }
+            {'type': 'typing_indicator', 'sender_name': sender_name, 'is_typing': is_typing}
         )
 
+    async def handle_read(self, data):
+        """
+        Advance this connection's read watermark ({"message_id": ...}) and tell the room.
+        The side comes from the session, never from the payload: the widget socket is
+        unauthenticated, so only a lawyer's session may move the lawyer watermark.
+        """
+        reader = self.reader
+        try:
+            message_id = uuid.UUID(str(data['message_id'])) if data.get('message_id') else None
+        except ValueError:
+            message_id = None
+        read_at = await self.mark_read(reader, message_id)
+        if read_at is None and message_id is not None:
+            # The message may still be waiting in the write-behind buffer
+            await message_buffer.flush()
+            read_at = await self.mark_read(reader, message_id)
+        if read_at is None:
+            await self.send(text_data=json.dumps({'type': 'error', 'error': 'Invalid message'}))
+            return
+        await self.channel_layer.group_send(self.room_group_name, read_payload(reader, read_at))
+
     async def chat_message(self, event):
         await self.send(text_data=json.dumps({'type': 'chat_message', 'message': event['message']}))
 
+    async def message_failed(self, event):
+        await self.send(text_data=json.dumps({'type': 'message_failed', 'message_id': event['message_id']}))
+
     async def typing_indicator(self, event):
         await self.send(text_data=json.dumps({
             'type': 'typing',
@@ -65,29 +210,77 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'is_typing': event['is_typing']
         }))
 
+    async def read_receipt(self, event):
+        await self.send(text_data=json.dumps({'type': 'read', 'reader': event['reader'], 'read_at': event['read_at']}))
+
     @database_sync_to_async
-    def save_message(self, content, sender_type, sender_id, sender_name):
-        from .models import Message, Conversation
-        conversation = Conversation.objects.get(id=self.conversation_id)
-        return Message.objects.create(
-            conversation=conversation,
-            content=content,
-            sender_type=sender_type,
-            sender_id=sender_id if sender_id else None,
-            sender_name=sender_name
-        )
+    def mark_read(self, reader, message_id):
+        from .models import READ_WATERMARK_FIELDS, Conversation
+        conversation = Conversation.objects.only(READ_WATERMARK_FIELDS[reader]).get(pk=self.conversation_id)
+        return conversation.mark_read(reader, message_id)
+
+    @database_sync_to_async
+    def get_reader(self):
+        from .models import SenderType
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated and hasattr(user, 'lawyer_profile'):
+            return SenderType.LAWYER
+        return SenderType.PLATFORM_USER
+
+    @database_sync_to_async
+    def get_conversation_id(self, conversation_id):
+        """Checked once per connection instead of once per message."""
+        from .models import Conversation
+        try:
+            return Conversation.objects.filter(id=conversation_id).values_list('id', flat=True).first()
+        except ValidationError:
+            return None
 
 
 class LawyerQueueConsumer(AsyncWebsocketConsumer):
-    """WebSocket consumer for lawyer queue notifications."""
+    """
+    WebSocket consumer for lawyer queue notifications.
+    Sends the newest QUEUE_SNAPSHOT_LIMIT cases of the queue on connect (also after
+    reconnecting), flagged `truncated` when more are waiting, then new_case and
+    case_assigned events so panels patch their lists instead of reloading, plus the
+    lawyer's own notification pushes.
+    """
 
     async def connect(self):
-        self.room_group_name = 'lawyers_queue'
+        self.room_group_name = QUEUE_GROUP
+        self.lawyer_id = await self.get_lawyer_id()
+        if self.lawyer_id is None:
+            await self.close(code=4403)
+            return
+        # Join first so no case published while the snapshot is read gets lost
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        # Personal group for notification pushes (apps/notifications/dispatch.py)
+        self.lawyer_group_name = lawyer_group_name(self.lawyer_id)
+        await self.channel_layer.group_add(self.lawyer_group_name, self.channel_name)
         await self.accept()
+        # One case past the limit tells the panels that the queue goes on
+        cases = await database_sync_to_async(queue_cases)(limit=QUEUE_SNAPSHOT_LIMIT + 1)
+        await self.send(text_data=json.dumps({
+            'type': 'queue_snapshot',
+            'cases': cases[:QUEUE_SNAPSHOT_LIMIT],
+            'truncated': len(cases) > QUEUE_SNAPSHOT_LIMIT,
+        }))
 
     async def disconnect(self, close_code):
+        if self.lawyer_id is None:
+            return
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.channel_layer.group_discard(self.lawyer_group_name, self.channel_name)
+
+    @database_sync_to_async
+    def get_lawyer_id(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated or not hasattr(user, 'lawyer_profile'):
+            return None
+        return user.lawyer_profile.pk
+
+    async def notification(self, event):
+        await self.send(text_data=json.dumps({'type': 'notification', 'notification': event['notification']}))
 
     async def new_case(self, event):
         await self.send(text_data=json.dumps({'type': 'new_case', 'case': event['case']}))
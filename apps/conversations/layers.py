@@ -0,0 +1,336 @@
+"""
+Channel layer on top of PostgreSQL LISTEN/NOTIFY, so several Daphne processes can
+share group fan-out without running an extra service.
+
+Each layer instance (one per process) LISTENs on its own notification channel and
+its new_channel() names embed that process id, so a message is routed with one
+NOTIFY to the process that owns the receiving channel. Group memberships live in
+the channel_layer_group table with an expiry; group_send sends one NOTIFY per
+member process. Payloads too large for a NOTIFY go to the channel_layer_spill table
+and the notification carries only the row id.
+
+Delivery is at most once, like the other channel layers. Only process-specific
+channels (the ones consumers get) are supported, not worker channels for
+runworker. Messages are encoded as JSON.
+"""
+import asyncio
+import copy
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from channels.layers import BaseChannelLayer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+GROUP_TABLE = 'channel_layer_group'
+SPILL_TABLE = 'channel_layer_spill'
+NOTIFY_PREFIX = 'channel_layer_'
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_BYTES = 7900
+# Keeps the channel list of one notification well under the payload limit
+CHANNELS_PER_NOTIFY = 100
+
+
+class PostgresChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(
+        self,
+        database='default',
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        cleanup_interval=60,
+        listen_timeout=10,
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.database = database
+        self.group_expiry = group_expiry
+        self.cleanup_interval = cleanup_interval
+        self.listen_timeout = listen_timeout
+        self.process_id = uuid.uuid4().hex[:16]
+        self.notify_channel = f'{NOTIFY_PREFIX}{self.process_id}'
+        self.channels = {}
+        # Publishing runs on one thread that owns the publisher connection, so it works
+        # from any event loop (async_to_sync callers get a fresh loop per call)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='channel-layer')
+        self._publisher = None
+        self._next_cleanup = 0
+        self._listener = None
+        self._listener_loop = None
+        self._listener_conn = None
+        self._listening = None
+
+    # Channel layer API
+
+    async def new_channel(self, prefix='specific'):
+        await self._ensure_listener()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._listening.wait()), timeout=self.listen_timeout)
+        except asyncio.TimeoutError:
+            logger.warning('Channel layer is not listening yet; messages may be missed until it connects')
+        return f'{prefix}.{self.process_id}!{uuid.uuid4().hex[:12]}'
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+        await self._call(self._notify, {self._process_of(channel): [channel]}, self._encode(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        await self._ensure_listener()
+        self._clean_expired()
+        queue = self._queue(channel)
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires >= time.time():
+                    return message
+        finally:
+            if queue.empty():
+                self.channels.pop(channel, None)
+
+    async def flush(self):
+        self.channels = {}
+        await self._call(self._flush)
+
+    async def close(self):
+        if self._listener is not None:
+            if self._listener_loop is asyncio.get_running_loop():
+                self._listener.cancel()
+                try:
+                    await self._listener
+                except asyncio.CancelledError:
+                    pass
+            else:
+                self._stop_listener()
+            self._listener = None
+            self._listener_loop = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_publisher)
+        self._executor.shutdown(wait=False)
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._process_of(channel)
+        await self._call(self._group_add, group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._call(self._group_discard, group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+        await self._call(self._group_send, group, self._encode(message))
+
+    # Publishing (runs on the executor thread)
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._execute, fn, *args)
+
+    def _execute(self, fn, *args):
+        try:
+            return self._run(fn, *args)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The server dropped the connection (restart, idle timeout); retry once on a new one
+            self._close_publisher()
+            return self._run(fn, *args)
+
+    def _run(self, fn, *args):
+        if self._publisher is None or self._publisher.closed:
+            self._publisher = self._connect()
+        with self._publisher.cursor() as cursor:
+            if time.monotonic() >= self._next_cleanup:
+                self._next_cleanup = time.monotonic() + self.cleanup_interval
+                cursor.execute(f'DELETE FROM {GROUP_TABLE} WHERE expires_at < now()')
+                cursor.execute(f'DELETE FROM {SPILL_TABLE} WHERE expires_at < now()')
+            return fn(cursor, *args)
+
+    def _close_publisher(self):
+        if self._publisher is not None:
+            self._publisher.close()
+            self._publisher = None
+
+    def _notify(self, cursor, by_process, body):
+        expires = time.time() + self.expiry
+        spill_id = None
+        notify_channels, payloads = [], []
+        for process_id, channels in by_process.items():
+            for start in range(0, len(channels), CHANNELS_PER_NOTIFY):
+                targets = json.dumps(channels[start:start + CHANNELS_PER_NOTIFY])
+                payload = f'{{"c":{targets},"e":{expires},"m":{body}}}'
+                if len(payload.encode()) > MAX_NOTIFY_BYTES:
+                    if spill_id is None:
+                        cursor.execute(
+                            f'INSERT INTO {SPILL_TABLE} (payload, expires_at) '
+                            'VALUES (%s, now() + make_interval(secs => %s)) RETURNING id',
+                            [body, self.expiry],
+                        )
+                        spill_id = cursor.fetchone()[0]
+                    payload = f'{{"c":{targets},"e":{expires},"s":{spill_id}}}'
+                notify_channels.append(f'{NOTIFY_PREFIX}{process_id}')
+                payloads.append(payload)
+        if payloads:
+            cursor.execute(
+                'SELECT pg_notify(c, p) FROM unnest(%s::text[], %s::text[]) AS t(c, p)',
+                [notify_channels, payloads],
+            )
+
+    def _group_add(self, cursor, group, channel):
+        cursor.execute(
+            f'INSERT INTO {GROUP_TABLE} (group_name, channel, expires_at) '
+            'VALUES (%s, %s, now() + make_interval(secs => %s)) '
+            'ON CONFLICT (group_name, channel) DO UPDATE SET expires_at = EXCLUDED.expires_at',
+            [group, channel, self.group_expiry],
+        )
+
+    def _group_discard(self, cursor, group, channel):
+        cursor.execute(f'DELETE FROM {GROUP_TABLE} WHERE group_name = %s AND channel = %s', [group, channel])
+
+    def _group_send(self, cursor, group, body):
+        cursor.execute(
+            f'SELECT channel FROM {GROUP_TABLE} WHERE group_name = %s AND expires_at > now()', [group]
+        )
+        by_process = defaultdict(list)
+        for (channel,) in cursor.fetchall():
+            by_process[self._process_of(channel)].append(channel)
+        self._notify(cursor, by_process, body)
+
+    def _read_spill(self, cursor, spill_id):
+        cursor.execute(f'SELECT payload FROM {SPILL_TABLE} WHERE id = %s', [spill_id])
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _flush(self, cursor):
+        cursor.execute(f'DELETE FROM {GROUP_TABLE}')
+        cursor.execute(f'DELETE FROM {SPILL_TABLE}')
+
+    # Receiving (runs on the event loop that called receive/new_channel)
+
+    async def _ensure_listener(self):
+        loop = asyncio.get_running_loop()
+        if self._listener_loop is loop and not self._listener.done():
+            return
+        # First use, or receive() moved to another event loop (async_to_sync callers, tests)
+        if self._listener is not None:
+            self._stop_listener()
+        self.channels = {}
+        self._listener_loop = loop
+        self._listening = asyncio.Event()
+        self._listener = loop.create_task(self._listen(self._listening))
+
+    def _stop_listener(self):
+        """Stop a listener that runs on another event loop, which may already be closed."""
+        if self._listener_loop.is_closed():
+            if self._listener_conn is not None:
+                self._listener_conn.close()
+        else:
+            self._listener_loop.call_soon_threadsafe(self._listener.cancel)
+
+    async def _listen(self, listening):
+        loop = asyncio.get_running_loop()
+        delay = 0.5
+        while True:
+            try:
+                conn = await loop.run_in_executor(None, self._connect_listener)
+            except psycopg2.Error:
+                logger.exception('Channel layer listener could not connect; retrying in %ss', delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+            delay = 0.5
+            self._listener_conn = conn
+            lost = loop.create_future()
+            loop.add_reader(conn.fileno(), self._on_readable, conn, lost)
+            listening.set()
+            try:
+                await lost
+            finally:
+                listening.clear()
+                loop.remove_reader(conn.fileno())
+                conn.close()
+            logger.warning('Channel layer listener lost its connection; reconnecting')
+
+    def _connect_listener(self):
+        conn = self._connect()
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.notify_channel}')
+        return conn
+
+    def _on_readable(self, conn, lost):
+        try:
+            conn.poll()
+        except psycopg2.Error as exc:
+            if not lost.done():
+                lost.set_result(exc)
+            return
+        while conn.notifies:
+            self._dispatch(conn.notifies.pop(0).payload)
+
+    def _dispatch(self, payload):
+        data = json.loads(payload)
+        if 's' in data:
+            asyncio.get_running_loop().create_task(self._deliver_spilled(data))
+        else:
+            self._deliver(data['c'], data['e'], data['m'])
+
+    async def _deliver_spilled(self, data):
+        try:
+            body = await self._call(self._read_spill, data['s'])
+        except psycopg2.Error:
+            logger.exception('Could not read spilled channel layer message %s', data['s'])
+            return
+        if body is not None:
+            self._deliver(data['c'], data['e'], json.loads(body))
+
+    def _deliver(self, channels, expires, message):
+        if expires < time.time():
+            return
+        for index, channel in enumerate(channels):
+            try:
+                self._queue(channel).put_nowait((expires, message if index == 0 else copy.deepcopy(message)))
+            except asyncio.QueueFull:
+                logger.warning('Channel %s is full; dropping message', channel)
+
+    def _queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def _clean_expired(self):
+        now = time.time()
+        for channel, queue in list(self.channels.items()):
+            while not queue.empty() and queue._queue[0][0] < now:
+                queue.get_nowait()
+                if queue.empty():
+                    self.channels.pop(channel, None)
+
+    # Helpers
+
+    def _connect(self):
+        conn = psycopg2.connect(**connections[self.database].get_connection_params())
+        conn.autocommit = True
+        return conn
+
+    def _process_of(self, channel):
+        if '!' not in channel:
+            raise ValueError(f'{channel!r} is not a process-specific channel; use new_channel() names')
+        return channel[:channel.index('!')].rsplit('.', 1)[-1]
+
+    def _encode(self, message):
+        return json.dumps(message, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
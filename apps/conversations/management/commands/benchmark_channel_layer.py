@@ -0,0 +1,78 @@
+"""Measure group fan-out latency and throughput of the in-memory and PostgreSQL channel layers."""
+import asyncio
+import statistics
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from channels.layers import InMemoryChannelLayer
+from apps.conversations.layers import PostgresChannelLayer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark group_send fan-out (latency and throughput) for the in-memory and PostgreSQL channel layers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receivers', type=int, default=50, help='Channels in the group.')
+        parser.add_argument('--messages', type=int, default=200, help='Messages sent per phase.')
+        parser.add_argument('--payload', type=int, default=200, help='Message body size in bytes.')
+        parser.add_argument('--layers', default='memory,postgres', help='Comma-separated: memory, postgres.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'layer':<10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'deliveries/s':>15}"
+        )
+        for name in options['layers'].split(','):
+            result = asyncio.run(self.run_layer(name.strip(), options))
+            self.stdout.write(
+                f"{name:<10}{result['p50']:>10.2f}{result['p95']:>10.2f}{result['max']:>10.2f}"
+                f"{result['throughput']:>15.0f}"
+            )
+
+    async def run_layer(self, name, options):
+        capacity = options['messages'] + 10
+        if name == 'memory':
+            publisher = receiver = InMemoryChannelLayer(capacity=capacity)
+        elif name == 'postgres':
+            # Two instances, so messages go through NOTIFY exactly as between two Daphne processes
+            publisher = PostgresChannelLayer(capacity=capacity)
+            receiver = PostgresChannelLayer(capacity=capacity)
+        else:
+            raise ValueError(f'Unknown layer {name!r}')
+
+        group = f'benchmark_{uuid.uuid4().hex[:8]}'
+        channels = [await receiver.new_channel() for _ in range(options['receivers'])]
+        for channel in channels:
+            await receiver.group_add(group, channel)
+        body = 'x' * options['payload']
+        try:
+            # Latency: one message at a time, until every member has received it
+            latencies = []
+            for n in range(options['messages']):
+                start = time.perf_counter()
+                await publisher.group_send(group, {'type': 'benchmark', 'n': n, 'body': body})
+                await asyncio.gather(*(receiver.receive(channel) for channel in channels))
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            # Throughput: send the whole burst while every member drains its channel
+            async def drain(channel):
+                for _ in range(options['messages']):
+                    await receiver.receive(channel)
+
+            start = time.perf_counter()
+            drains = [asyncio.create_task(drain(channel)) for channel in channels]
+            for n in range(options['messages']):
+                await publisher.group_send(group, {'type': 'benchmark', 'n': n, 'body': body})
+            await asyncio.gather(*drains)
+            elapsed = time.perf_counter() - start
+        finally:
+            for channel in channels:
+                await receiver.group_discard(group, channel)
+            for layer in {publisher, receiver}:
+                await layer.close()
+
+        return {
+            'p50': statistics.median(latencies),
+            'p95': statistics.quantiles(latencies, n=20)[-1],
+            'max': max(latencies),
+            'throughput': len(channels) * options['messages'] / elapsed,
+        }
@@ -0,0 +1,295 @@
+"""
+End-to-end load benchmark of one process through the ASGI stack Daphne runs: widget
+sessions (create a conversation, then send_message and poll in turns), lawyers loading
+the dashboard and conversation pages, and chat fan-out over WebSockets. Reports latency
+percentiles, throughput and SQL queries per request (from QueryBudgetMiddleware), and
+saves them as JSON with --output so releases can be compared.
+"""
+import asyncio
+import json
+import platform as python_platform
+import time
+import uuid
+from collections import Counter, defaultdict
+import django
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client as BrowserClient
+from django.urls import reverse
+from django.utils import timezone
+from apps.conversations.benchmarking import asgi_request, summarize
+from apps.conversations.models import Conversation, ConversationStatus, Message, SenderType
+from apps.conversations.routing import websocket_urlpatterns
+from apps.lawyers.models import Lawyer
+from apps.platforms.models import Platform
+from config.postgresql_pool import pool_stats
+from config.query_budget import view_query_stats
+
+SCENARIOS = ('widget', 'lawyers', 'websocket')
+
+# URL name each HTTP operation resolves to, for its queries per request
+OPERATION_VIEWS = {
+    'create': 'conversation-list',
+    'send_message': 'conversation-send-message',
+    'poll': 'conversation-messages',
+    'dashboard': 'lawyers:dashboard',
+    'conversation_detail': 'lawyers:conversation_detail',
+}
+
+
+class Timings:
+    """Latencies (ms) and failed requests per operation."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+
+    async def request(self, operation, app, path, expected_status=200, **kwargs):
+        start = time.perf_counter()
+        status, body = await asgi_request(app, path, **kwargs)
+        self.latencies[operation].append((time.perf_counter() - start) * 1000)
+        if status != expected_status:
+            self.errors[operation] += 1
+            return None
+        return body
+
+    def results(self, elapsed):
+        return {
+            operation: summarize(latencies, elapsed, errors=self.errors[operation])
+            for operation, latencies in self.latencies.items()
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the widget API, the lawyer panel and chat WebSockets: p50/p95/p99 latency, throughput and '
+        'queries per request. It creates (and then deletes) a platform, lawyers and conversations in the '
+        'configured database, and new widget conversations are auto-assigned, so run it against a local database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated: widget, lawyers, websocket.')
+        parser.add_argument('--sessions', type=int, default=20, help='Widget sessions running at the same time.')
+        parser.add_argument('--messages', type=int, default=5, help='Messages each widget session sends, each followed by a poll.')
+        parser.add_argument('--lawyers', type=int, default=5, help='Lawyers loading the panel at the same time.')
+        parser.add_argument('--page-loads', type=int, default=10, help='Dashboard and conversation loads per lawyer.')
+        parser.add_argument('--cases', type=int, default=10, help='Conversations assigned to each lawyer beforehand.')
+        parser.add_argument('--history', type=int, default=20, help='Messages in each of those conversations.')
+        parser.add_argument('--rooms', type=int, default=10, help='Chat rooms broadcasting at the same time.')
+        parser.add_argument('--room-size', type=int, default=5, help='WebSockets connected to each room.')
+        parser.add_argument('--broadcasts', type=int, default=20, help='Messages sent in each room.')
+        parser.add_argument('--label', default='', help='Free text saved with the results, e.g. the release.')
+        parser.add_argument('--output', help='Also write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        report = {
+            'label': options['label'],
+            'started_at': timezone.now().isoformat(),
+            'environment': {
+                'database': connection.vendor,
+                'db_pool': pool_stats() is not None,
+                'channel_layer': settings.CHANNEL_LAYERS['default']['BACKEND'],
+                'python': python_platform.python_version(),
+                'django': django.get_version(),
+            },
+            'options': {
+                key: options[key] for key in (
+                    'sessions', 'messages', 'lawyers', 'page_loads', 'cases', 'history',
+                    'rooms', 'room_size', 'broadcasts',
+                )
+            },
+            'scenarios': {},
+        }
+        run_id = uuid.uuid4().hex[:8]
+        platform = Platform.objects.create(name='Benchmark', domain=f'benchmark-{run_id}.invalid')
+        browsers = []
+        try:
+            app = get_asgi_application()
+            # Lawyers exist before the widget scenario so its new conversations are assigned to them
+            lawyers = self.create_lawyers(platform, run_id, browsers, options)
+            # async_to_sync rather than asyncio.run: database work outside a request (the chat
+            # write buffer, consumer lookups) then runs on this thread and its connection
+            for name in scenarios:
+                queries_before = view_query_stats.snapshot()
+                if name == 'widget':
+                    results = async_to_sync(self.run_widget)(app, platform, options)
+                elif name == 'lawyers':
+                    results = async_to_sync(self.run_lawyers)(app, lawyers, options)
+                else:
+                    results = async_to_sync(self.run_websocket)(self.create_rooms(platform, options), options)
+                self.add_queries_per_request(results, queries_before, view_query_stats.snapshot())
+                report['scenarios'][name] = results
+        finally:
+            platform.delete()
+            for browser in browsers:
+                browser.logout()
+            User.objects.filter(username__startswith=f'benchmark-{run_id}-').delete()
+
+        self.write_report(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results saved to {options['output']}")
+
+    def create_lawyers(self, platform, run_id, browsers, options):
+        """(session cookie, assigned conversation ids) of each benchmark lawyer."""
+        lawyers = []
+        for n in range(options['lawyers']):
+            username = f'benchmark-{run_id}-{n}'
+            user = User.objects.create_user(username=username)
+            lawyer = Lawyer.objects.create(
+                user=user, name=f'Abogado Benchmark {n}', email=f'{username}@benchmark.invalid',
+                is_on_shift=True, max_concurrent_cases=options['cases'] + options['sessions'],
+            )
+            cases = Conversation.objects.bulk_create([
+                Conversation(platform=platform, lawyer=lawyer, status=ConversationStatus.ACTIVE, subject='Benchmark')
+                for _ in range(options['cases'])
+            ])
+            Message.objects.bulk_create([
+                Message(
+                    conversation=case, content=f'Mensaje {i}',
+                    sender_type=SenderType.PLATFORM_USER if i % 2 else SenderType.LAWYER,
+                )
+                for case in cases for i in range(options['history'])
+            ])
+            Lawyer.objects.filter(pk=lawyer.pk).update(active_cases_count=len(cases))
+            browser = BrowserClient()
+            browser.force_login(user)
+            browsers.append(browser)
+            cookie = f'{settings.SESSION_COOKIE_NAME}={browser.cookies[settings.SESSION_COOKIE_NAME].value}'
+            lawyers.append((cookie, [case.pk for case in cases]))
+        return lawyers
+
+    def create_rooms(self, platform, options):
+        return [
+            conversation.pk for conversation in Conversation.objects.bulk_create([
+                Conversation(platform=platform, subject='Benchmark') for _ in range(options['rooms'])
+            ])
+        ]
+
+    async def run_widget(self, app, platform, options):
+        timings = Timings()
+        headers = [(b'authorization', f'Api-Key {platform.api_key}'.encode()), (b'content-type', b'application/json')]
+
+        async def session(n):
+            body = await timings.request(
+                'create', app, '/api/v1/conversations/', 201, method='POST', headers=headers,
+                body=json.dumps({
+                    'subject': 'Consulta benchmark',
+                    'client_data': {'name': f'Cliente Benchmark {n}', 'cedula': f'{n:011d}'},
+                }).encode(),
+            )
+            if body is None:
+                return
+            conversation_id = json.loads(body)['id']
+            cursor = ''
+            for i in range(options['messages']):
+                await timings.request(
+                    'send_message', app, f'/api/v1/conversations/{conversation_id}/send_message/', 201,
+                    method='POST', headers=headers,
+                    body=json.dumps({'sender_type': SenderType.PLATFORM_USER, 'content': f'Mensaje {i}'}).encode(),
+                )
+                body = await timings.request(
+                    'poll', app, f'/api/v1/conversations/{conversation_id}/messages/',
+                    query_string=f'limit=50&after={cursor}', headers=headers,
+                )
+                if body is not None:
+                    cursor = json.loads(body)['next_cursor'] or cursor
+
+        start = time.perf_counter()
+        await asyncio.gather(*(session(n) for n in range(options['sessions'])))
+        return timings.results(time.perf_counter() - start)
+
+    async def run_lawyers(self, app, lawyers, options):
+        timings = Timings()
+        dashboard = reverse('lawyers:dashboard')
+
+        async def lawyer_session(cookie, cases):
+            headers = [(b'cookie', cookie.encode())]
+            for n in range(options['page_loads']):
+                await timings.request('dashboard', app, dashboard, headers=headers)
+                if cases:
+                    await timings.request(
+                        'conversation_detail', app,
+                        reverse('lawyers:conversation_detail', args=[cases[n % len(cases)]]), headers=headers,
+                    )
+
+        start = time.perf_counter()
+        await asyncio.gather(*(lawyer_session(cookie, cases) for cookie, cases in lawyers))
+        return timings.results(time.perf_counter() - start)
+
+    async def run_websocket(self, rooms, options):
+        """Latency of a chat message until every socket in the room has it; rooms broadcast concurrently."""
+        router = URLRouter(websocket_urlpatterns)
+        connects, latencies = [], []
+        errors = Counter()
+
+        async def room(conversation_id):
+            sockets = []
+            try:
+                for _ in range(options['room_size']):
+                    socket = WebsocketCommunicator(router, f'/ws/chat/{conversation_id}/')
+                    start = time.perf_counter()
+                    connected, _ = await socket.connect(timeout=10)
+                    connects.append((time.perf_counter() - start) * 1000)
+                    if not connected:
+                        errors['connect'] += 1
+                        return
+                    sockets.append(socket)
+                for n in range(options['broadcasts']):
+                    start = time.perf_counter()
+                    await sockets[0].send_json_to({
+                        'type': 'chat_message', 'sender_type': SenderType.PLATFORM_USER, 'content': f'Mensaje {n}',
+                    })
+                    try:
+                        await asyncio.gather(*(socket.receive_json_from(timeout=10) for socket in sockets))
+                    except asyncio.TimeoutError:
+                        errors['broadcast'] += 1
+                        return
+                    latencies.append((time.perf_counter() - start) * 1000)
+            finally:
+                # The first disconnect saves the room's buffered messages
+                for socket in sockets:
+                    await socket.disconnect()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(room(conversation_id) for conversation_id in rooms))
+        elapsed = time.perf_counter() - start
+        broadcast = summarize(latencies, elapsed, errors=errors['broadcast'])
+        broadcast['deliveries_per_second'] = broadcast['throughput'] * options['room_size']
+        return {'connect': summarize(connects, elapsed, errors=errors['connect']), 'broadcast': broadcast}
+
+    def add_queries_per_request(self, results, before, after):
+        for operation, result in results.items():
+            view = OPERATION_VIEWS.get(operation)
+            if view is None or view not in after:
+                continue
+            previous = before.get(view, {'requests': 0, 'queries': 0})
+            requests = after[view]['requests'] - previous['requests']
+            if requests:
+                result['queries_per_request'] = (after[view]['queries'] - previous['queries']) / requests
+
+    def write_report(self, report):
+        self.stdout.write(
+            f"{'operation':<30}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'max ms':>9}{'queries':>9}{'errors':>8}"
+        )
+        for scenario, results in report['scenarios'].items():
+            for operation, result in results.items():
+                queries = result.get('queries_per_request')
+                self.stdout.write(
+                    f"{f'{scenario}.{operation}':<30}{result['requests']:>9}{result['throughput']:>9.1f}"
+                    f"{result['p50']:>9.2f}{result['p95']:>9.2f}{result['p99']:>9.2f}{result['max']:>9.2f}"
+                    f"{'-' if queries is None else f'{queries:.1f}':>9}{result['errors']:>8}"
+                )
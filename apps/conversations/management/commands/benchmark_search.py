@@ -0,0 +1,118 @@
+"""
+Compare ILIKE scans with the full-text search of search.py on a large message table.
+Seeds a platform with --conversations cases and --messages generated Spanish messages
+(through bulk_create, so the search_vector trigger fills them as in production), runs
+VACUUM ANALYZE, then times each term: the first page and the count of matching messages
+by ILIKE and by tsvector, and the ranked conversation search the API serves.
+"""
+import random
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.conversations.benchmarking import percentile
+from apps.conversations.models import Conversation, ConversationStatus, Message, SenderType
+from apps.conversations.search import search_conversations, search_messages
+from apps.platforms.models import Client, Platform
+
+# Everyday words of a collections chat, drawn uniformly; the rare ones go in about 1 in 1000 messages
+VOCABULARY = (
+    'hola', 'buenas', 'tardes', 'gracias', 'necesito', 'ayuda', 'con', 'mi', 'prestamo', 'pago', 'cuota',
+    'atrasada', 'interes', 'mora', 'banco', 'cuenta', 'deuda', 'abogado', 'contrato', 'firma', 'plazo',
+    'semana', 'mes', 'monto', 'saldo', 'pesos', 'llamada', 'cobro', 'oficina', 'documento', 'copia',
+    'cedula', 'garantia', 'vehiculo', 'casa', 'acuerdo', 'embargo', 'demanda', 'tribunal', 'notificacion',
+)
+RARE_TERMS = ('desalojo', 'hipotecario', 'fiador')
+BATCH_SIZE = 5000
+PAGE_SIZE = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark ILIKE against PostgreSQL full-text search over --messages seeded messages (first page, count '
+        'and the ranked conversation search). It creates (and then deletes) a platform in the configured '
+        'database; seeding a million messages takes a few minutes, so run it against a local database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000, help='Messages to seed.')
+        parser.add_argument('--conversations', type=int, default=10_000, help='Conversations the messages are spread over.')
+        parser.add_argument('--words', type=int, default=12, help='Words per message.')
+        parser.add_argument('--terms', default='pago,embargo,desalojo', help='Comma-separated search terms.')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark platform and its data.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Full-text search needs PostgreSQL; other databases only have the icontains fallback.')
+        platform = Platform.objects.create(name=f'benchmark-{uuid.uuid4().hex[:8]}', domain='benchmark.local')
+        try:
+            self.seed(platform, options)
+            self.stdout.write(f"{'term':<14}{'query':<22}{'rows':>10}{'p50 ms':>10}{'p95 ms':>10}")
+            for term in options['terms'].split(','):
+                self.compare(platform, term.strip(), options['repeat'])
+        finally:
+            if not options['keep']:
+                platform.delete()
+
+    def seed(self, platform, options):
+        rng = random.Random(options['messages'])
+        clients = Client.objects.bulk_create([
+            Client(platform=platform, name=f'Cliente {i}', cedula=f'{i:011d}') for i in range(options['conversations'])
+        ], batch_size=BATCH_SIZE)
+        conversations = Conversation.objects.bulk_create([
+            Conversation(platform=platform, client=client, status=ConversationStatus.ACTIVE, subject='Consulta de prestamo')
+            for client in clients
+        ], batch_size=BATCH_SIZE)
+        start = time.perf_counter()
+        for offset in range(0, options['messages'], BATCH_SIZE):
+            count = min(BATCH_SIZE, options['messages'] - offset)
+            Message.objects.bulk_create([
+                Message(
+                    conversation=rng.choice(conversations), sender_type=SenderType.PLATFORM_USER,
+                    content=self.sentence(rng, options['words']),
+                )
+                for _ in range(count)
+            ])
+        self.stdout.write(f"Seeded {options['messages']} messages in {time.perf_counter() - start:.1f} s")
+        # VACUUM also merges the GIN pending lists, as autovacuum would in steady state
+        with connection.cursor() as cursor:
+            for model in (Message, Conversation, Client):
+                cursor.execute(f'VACUUM ANALYZE {model._meta.db_table}')
+
+    def sentence(self, rng, words):
+        sentence = rng.choices(VOCABULARY, k=words)
+        if rng.random() < 0.001:
+            sentence[rng.randrange(words)] = rng.choice(RARE_TERMS)
+        return ' '.join(sentence)
+
+    def compare(self, platform, term, repeat):
+        messages = Message.objects.filter(conversation__platform=platform)
+        matching_ilike = messages.filter(content__icontains=term)
+        matching_fts = search_messages(messages, term)
+        queries = [
+            ('ilike page', lambda: list(matching_ilike.order_by('-sent_at')[:PAGE_SIZE]), matching_ilike),
+            ('ilike count', matching_ilike.count, matching_ilike),
+            ('fts page', lambda: list(matching_fts[:PAGE_SIZE]), matching_fts),
+            ('fts count', matching_fts.count, matching_fts),
+            ('fts conversations', lambda: list(
+                search_conversations(Conversation.objects.filter(platform=platform), term)[:PAGE_SIZE]
+            ), None),
+        ]
+        medians = {}
+        for label, run, matching in queries:
+            latencies = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            medians[label] = percentile(latencies, 0.50)
+            rows = matching.count() if matching is not None else ''
+            self.stdout.write(
+                f'{term:<14}{label:<22}{rows:>10}{medians[label]:>10.1f}{percentile(latencies, 0.95):>10.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{term}: first page {medians['ilike page'] / medians['fts page']:.1f}x faster, "
+            f"count {medians['ilike count'] / medians['fts count']:.1f}x faster with full-text search"
+        ))
@@ -0,0 +1,98 @@
+"""
+Measure widget polling throughput of one process through the ASGI handler Daphne runs,
+for a DRF view (sync, one worker thread per request; see benchmark_urls.py) and the
+async views. With DB_POOL=true it also reports how the connection pool served each phase.
+"""
+import asyncio
+import time
+import uuid
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from apps.conversations.benchmarking import asgi_request, summarize
+from apps.conversations.models import Conversation, Message, SenderType
+from apps.platforms.models import Platform
+from config.postgresql_pool import pool_stats
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent widget polls of the messages endpoint on the sync (DRF) and async paths.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pollers', type=int, default=50, help='Widgets polling at the same time.')
+        parser.add_argument('--polls', type=int, default=20, help='Polls per widget in each phase.')
+        parser.add_argument('--history', type=int, default=20, help='Messages already in each conversation.')
+        parser.add_argument('--paths', default='sync,async', help='Comma-separated: sync, async.')
+
+    def handle(self, *args, **options):
+        platform = Platform.objects.create(name='Benchmark', domain=f'benchmark-{uuid.uuid4().hex[:8]}.invalid')
+        try:
+            conversations = Conversation.objects.bulk_create([
+                Conversation(platform=platform, subject='Benchmark') for _ in range(options['pollers'])
+            ])
+            Message.objects.bulk_create([
+                Message(conversation=conversation, sender_type=SenderType.LAWYER, content=f'Mensaje {i}')
+                for conversation in conversations for i in range(options['history'])
+            ])
+            # Widgets that are up to date poll with the id of the last message they have
+            cursors = {
+                conversation_id: str(message_id) for conversation_id, message_id in
+                Message.objects.filter(conversation__platform=platform).order_by('sent_at', 'id')
+                .values_list('conversation_id', 'id')
+            }
+
+            self.stdout.write(f"{'path':<8}{'requests/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'errors':>8}")
+            app = get_asgi_application()
+            for name in options['paths'].split(','):
+                name = name.strip()
+                pool_before = pool_stats()
+                if name == 'sync':
+                    with override_settings(ROOT_URLCONF='apps.conversations.benchmark_urls'):
+                        result = asyncio.run(self.run_path(app, platform.api_key, cursors, options))
+                elif name == 'async':
+                    result = asyncio.run(self.run_path(app, platform.api_key, cursors, options))
+                else:
+                    raise ValueError(f'Unknown path {name!r}')
+                self.stdout.write(
+                    f"{name:<8}{result['throughput']:>12.0f}{result['p50']:>10.2f}{result['p95']:>10.2f}"
+                    f"{result['max']:>10.2f}{result['errors']:>8}"
+                )
+                if pool_before is not None:
+                    self.write_pool_stats(pool_before, pool_stats())
+        finally:
+            platform.delete()
+
+    def write_pool_stats(self, before, after):
+        checkouts = after['checkouts'] - before['checkouts']
+        created = after['created'] - before['created']
+        waited = after['wait_seconds_total'] - before['wait_seconds_total']
+        self.stdout.write(
+            f"{'':<8}pool: {checkouts} checkouts, {1 - created / checkouts if checkouts else 0:.1%} reused, "
+            f"wait avg {waited / checkouts * 1000 if checkouts else 0:.2f} ms, "
+            f"{after['timeouts'] - before['timeouts']} timeouts, {after['open']} open"
+        )
+
+    async def run_path(self, app, api_key, cursors, options):
+        headers = [(b'authorization', f'Api-Key {api_key}'.encode())]
+
+        async def poll(conversation_id, cursor):
+            start = time.perf_counter()
+            status, _ = await asgi_request(
+                app, f'/api/v1/conversations/{conversation_id}/messages/',
+                query_string=f'limit=50&after={cursor}', headers=headers,
+            )
+            return status, (time.perf_counter() - start) * 1000
+
+        async def widget(conversation_id, cursor):
+            return [await poll(conversation_id, cursor) for _ in range(options['polls'])]
+
+        # Warm up: URL resolvers, the platform cache and one connection per worker thread
+        await asyncio.gather(*(poll(conversation_id, cursor) for conversation_id, cursor in cursors.items()))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(widget(conversation_id, cursor) for conversation_id, cursor in cursors.items()))
+        elapsed = time.perf_counter() - start
+
+        polls = [result for widget_results in results for result in widget_results]
+        return summarize(
+            [latency for _, latency in polls], elapsed, errors=sum(status != 200 for status, _ in polls)
+        )
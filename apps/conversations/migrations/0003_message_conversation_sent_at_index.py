@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0002_conversation_page_url'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'sent_at'], name='msg_conversation_sent_idx'),
+        ),
+    ]
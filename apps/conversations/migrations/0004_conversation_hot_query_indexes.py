@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0003_message_conversation_sent_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['platform', '-created_at'], name='conv_platform_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['lawyer', 'status', '-updated_at'], name='conv_lawyer_status_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(condition=models.Q(('lawyer__isnull', True), ('status', 'pending')), fields=['-created_at'], name='conv_queue_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0004_conversation_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelSpillMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.TextField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Mensaje de Canal Desbordado',
+                'verbose_name_plural': 'Mensajes de Canal Desbordados',
+                'db_table': 'channel_layer_spill',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChannelGroupMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=100)),
+                ('channel', models.CharField(max_length=100)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Miembro de Grupo de Canal',
+                'verbose_name_plural': 'Miembros de Grupos de Canal',
+                'db_table': 'channel_layer_group',
+                'constraints': [models.UniqueConstraint(fields=('group_name', 'channel'), name='channel_layer_group_member_uniq')],
+            },
+        ),
+    ]
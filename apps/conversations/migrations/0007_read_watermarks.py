@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0006_message_sent_at_default'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='read_at',
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='lawyer_read_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Leido por el Abogado Hasta'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='platform_user_read_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Leido por el Usuario Hasta'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# (table, source column) pairs whose search_vector a trigger keeps in step on every
+# INSERT or UPDATE of the column, bulk_create and raw SQL included
+SEARCH_SOURCES = (
+    ('conversations_conversation', 'subject'),
+    ('conversations_message', 'content'),
+)
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return  # Other databases leave search_vector empty and search with icontains
+    for table, column in SEARCH_SOURCES:
+        schema_editor.execute(
+            f'CREATE TRIGGER {table}_search_vector_trg BEFORE INSERT OR UPDATE OF {column} ON {table} '
+            f"FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.spanish', {column})"
+        )
+        schema_editor.execute(f"UPDATE {table} SET search_vector = to_tsvector('pg_catalog.spanish', {column})")
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, _column in SEARCH_SOURCES:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_search_vector_trg ON {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0007_read_watermarks'),
+        ('lawyers', '0002_lawyer_active_cases_count'),
+        ('loans', '0003_loan_client_external_id_unique'),
+        ('platforms', '0004_client_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Backfilled before the indexes are built, which is faster than updating them row by row
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='conv_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='msg_search_vector_idx'),
+        ),
+    ]
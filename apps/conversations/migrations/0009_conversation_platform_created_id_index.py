@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0008_search_vectors'),
+        ('lawyers', '0002_lawyer_active_cases_count'),
+        ('loans', '0003_loan_client_external_id_unique'),
+        ('platforms', '0004_client_search_vector'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='conversation',
+            name='conv_platform_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['platform', '-created_at', '-id'], name='conv_platform_created_idx'),
+        ),
+    ]
@@ -1,6 +1,12 @@
 """Conversation and Message models for AvocadoLegal."""
 import uuid
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import IsNull
+from django.utils import timezone
 
 
 class ConversationStatus(models.TextChoices):
@@ -28,25 +34,80 @@ class Conversation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     closed_at = models.DateTimeField(null=True, blank=True)
+    # Read watermarks: each side has read every message sent up to this instant
+    platform_user_read_at = models.DateTimeField(null=True, blank=True, verbose_name='Leido por el Usuario Hasta')
+    lawyer_read_at = models.DateTimeField(null=True, blank=True, verbose_name='Leido por el Abogado Hasta')
+    # Spanish tsvector of the subject, kept by a PostgreSQL trigger (see search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Conversacion'
         verbose_name_plural = 'Conversaciones'
         ordering = ['-created_at']
+        indexes = [
+            # With the id tiebreaker, a keyset page is one range of this index (PlatformAPIPagination)
+            models.Index(fields=['platform', '-created_at', '-id'], name='conv_platform_created_idx'),
+            models.Index(fields=['lawyer', 'status', '-updated_at'], name='conv_lawyer_status_upd_idx'),
+            # Unassigned queue (QueueView and the dashboard)
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(lawyer__isnull=True, status='pending'),
+                name='conv_queue_pending_idx',
+            ),
+            GinIndex(fields=['search_vector'], name='conv_search_vector_idx'),
+        ]
 
     def __str__(self):
         client_name = self.client.name if self.client else 'Sin cliente'
         return f'{client_name} - {self.platform.name} ({self.status})'
 
+    def save(self, *args, **kwargs):
+        """Save and keep the lawyer case counters in step with lawyer/status changes."""
+        from apps.lawyers.models import update_case_counters
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'lawyer', 'lawyer_id', 'status'} & set(update_fields):
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            previous = (None, None)
+            if not self._state.adding:
+                # Read the stored state under lock so concurrent transitions are counted once
+                previous = Conversation.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'lawyer_id', 'status'
+                ).first() or (None, None)
+            super().save(*args, **kwargs)
+            update_case_counters(*previous, self.lawyer_id, self.status)
+
+    def mark_read(self, reader, message_id=None):
+        """
+        Advance the reader's watermark to a message (by default the latest one) with a
+        single UPDATE; it never moves backwards. Returns the watermark, or None if
+        message_id is not in this conversation.
+        """
+        field = READ_WATERMARK_FIELDS[reader]
+        messages = self.messages.order_by('-sent_at')
+        if message_id is not None:
+            messages = messages.filter(id=message_id)
+        read_at = messages.values_list('sent_at', flat=True).first()
+        if read_at is None:
+            return getattr(self, field) if message_id is None else None
+        Conversation.objects.filter(pk=self.pk).update(**{field: Greatest(Coalesce(field, Value(read_at)), Value(read_at))})
+        current = getattr(self, field)
+        setattr(self, field, read_at if current is None else max(current, read_at))
+        return getattr(self, field)
+
+    def unread_count(self, reader):
+        """Messages the reader has not read yet, counted as a range over (conversation, sent_at)."""
+        messages = self.messages.filter(sender_type__in=SENDERS_READ_BY[reader])
+        watermark = getattr(self, READ_WATERMARK_FIELDS[reader])
+        if watermark is not None:
+            messages = messages.filter(sent_at__gt=watermark)
+        return messages.count()
+
     def close_case(self, notes=''):
-        from django.utils import timezone
         self.status = ConversationStatus.CLOSED
         self.resolution_notes = notes
         self.closed_at = timezone.now()
         self.save()
-        if self.lawyer:
-            self.lawyer.total_cases_handled += 1
-            self.lawyer.save(update_fields=['total_cases_handled'])
 
 
 class SenderType(models.TextChoices):
@@ -55,6 +116,56 @@ class SenderType(models.TextChoices):
     SYSTEM = 'system', 'Sistema'
 
 
+# Watermark field of each reading side, and whose messages that side reads
+READ_WATERMARK_FIELDS = {
+    SenderType.PLATFORM_USER: 'platform_user_read_at',
+    SenderType.LAWYER: 'lawyer_read_at',
+}
+SENDERS_READ_BY = {
+    SenderType.PLATFORM_USER: [SenderType.LAWYER, SenderType.SYSTEM],
+    SenderType.LAWYER: [SenderType.PLATFORM_USER],
+}
+
+
+def _count_messages(messages):
+    """
+    COUNT(*) of a Message queryset correlated with OuterRef('pk'), as a subquery: each
+    conversation reads one range of msg_conversation_sent_idx instead of the whole
+    queryset being joined to every message and grouped.
+    """
+    return Coalesce(Subquery(
+        messages.order_by().values('conversation').annotate(count=models.Count('pk')).values('count')
+    ), 0)
+
+
+def message_count_annotation():
+    """Count of messages for Conversation querysets, e.g. annotate(message_count=...)."""
+    return _count_messages(Message.objects.filter(conversation=OuterRef('pk')))
+
+
+def unread_count_annotation(reader):
+    """Count of unread messages for Conversation querysets, e.g. annotate(unread_count=...)."""
+    field = READ_WATERMARK_FIELDS[reader]
+    return _count_messages(Message.objects.filter(
+        Q(IsNull(OuterRef(field), True)) | Q(sent_at__gt=OuterRef(field)),
+        conversation=OuterRef('pk'),
+        sender_type__in=SENDERS_READ_BY[reader],
+    ))
+
+
+def message_is_read_annotation():
+    """Message.is_read as a query expression, for values() and exports."""
+    return models.Case(
+        models.When(
+            Q(sender_type=SenderType.PLATFORM_USER, conversation__lawyer_read_at__gte=F('sent_at'))
+            | Q(~Q(sender_type=SenderType.PLATFORM_USER), conversation__platform_user_read_at__gte=F('sent_at')),
+            then=Value(True),
+        ),
+        default=Value(False),
+        output_field=models.BooleanField(),
+    )
+
+
 class Message(models.Model):
     """Single message in a conversation."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -64,31 +175,74 @@ class Message(models.Model):
     sender_name = models.CharField(max_length=255, blank=True)
     content = models.TextField(verbose_name='Contenido')
     attachments = models.JSONField(default=list, blank=True)
-    is_read = models.BooleanField(default=False)
     is_system_message = models.BooleanField(default=False)
-    sent_at = models.DateTimeField(auto_now_add=True)
-    read_at = models.DateTimeField(null=True, blank=True)
+    # Set when the message object is built; message_buffer restamps it when the row is written
+    sent_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Spanish tsvector of the content, kept by a PostgreSQL trigger so bulk_create fills it too
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Mensaje'
         verbose_name_plural = 'Mensajes'
         ordering = ['sent_at']
+        indexes = [
+            models.Index(fields=['conversation', 'sent_at'], name='msg_conversation_sent_idx'),
+            GinIndex(fields=['search_vector'], name='msg_search_vector_idx'),
+        ]
 
     def __str__(self):
         preview = self.content[:50] + '...' if len(self.content) > 50 else self.content
         return f'{self.sender_name}: {preview}'
 
+    @property
+    def is_read(self):
+        """Whether the other side's read watermark has reached this message."""
+        if self._state.adding and not Message.conversation.is_cached(self):
+            return False  # Built by ChatConsumer and not saved yet
+        reader = SenderType.LAWYER if self.sender_type == SenderType.PLATFORM_USER else SenderType.PLATFORM_USER
+        watermark = getattr(self.conversation, READ_WATERMARK_FIELDS[reader])
+        return watermark is not None and self.sent_at <= watermark
+
     @classmethod
     def create_system_message(cls, conversation, content):
-        return cls.objects.create(
+        from .realtime import broadcast_message
+        message = cls.objects.create(
             conversation=conversation,
             sender_type=SenderType.SYSTEM,
             sender_name='Sistema',
             content=content,
             is_system_message=True
         )
+        broadcast_message(message)
+        return message
 
     @classmethod
     def create_welcome_message(cls, conversation):
         content = 'Hola! Ya tenemos los datos basicos del prestamo. Cual es tu consulta y que procedimiento te gustaria iniciar?'
-        return cls.create_system_message(conversation, content)
\ No newline at end of file
+        return cls.create_system_message(conversation, content)
+
+
+class ChannelGroupMembership(models.Model):
+    """Group membership for the PostgreSQL channel layer (see layers.py)."""
+    group_name = models.CharField(max_length=100)
+    channel = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'channel_layer_group'
+        verbose_name = 'Miembro de Grupo de Canal'
+        verbose_name_plural = 'Miembros de Grupos de Canal'
+        constraints = [
+            models.UniqueConstraint(fields=['group_name', 'channel'], name='channel_layer_group_member_uniq'),
+        ]
+
+
+class ChannelSpillMessage(models.Model):
+    """Channel layer message too large for a NOTIFY payload (see layers.py)."""
+    payload = models.TextField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'channel_layer_spill'
+        verbose_name = 'Mensaje de Canal Desbordado'
+        verbose_name_plural = 'Mensajes de Canal Desbordados'
@@ -0,0 +1,175 @@
+"""
+Write-behind persistence for chat messages received over WebSockets.
+ChatConsumer broadcasts a message as soon as it arrives and hands the unsaved
+instance to the buffer, which writes everything pending with one bulk_create once
+`max_batch` messages are waiting or `flush_interval` seconds have passed.
+Consumers flush on disconnect and whatever is left is written at interpreter exit.
+
+sent_at is stamped when a batch is written, not when the message arrived: readers page
+by (sent_at, id) and read watermarks compare sent_at, so a row must not appear later
+with a timestamp older than rows already visible. The broadcast carries the arrival
+time, which is never later than the stored one. A full buffer rejects new messages
+before they are broadcast instead of dropping queued ones, which the room has already
+seen; a queued message that cannot be written after all (its conversation was deleted,
+or the database is down at exit) is retracted with a message_failed event.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBufferFull(Exception):
+    """max_pending messages are waiting for the database; the message was not queued."""
+
+
+class MessageWriteBuffer:
+    def __init__(self, max_batch=100, flush_interval=0.25, max_pending=10000):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Guards _pending and _stats: writes run on the DB thread, and at exit on the main thread
+        self._lock = threading.Lock()
+        self._pending = []
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._flushing = None
+        self._last_sent_at = None
+        self._stats = {
+            'flushes': 0, 'messages_written': 0, 'failed_flushes': 0, 'rejected': 0,
+            'last_flush_size': 0, 'max_flush_size': 0, 'last_lag_ms': 0.0, 'max_lag_ms': 0.0,
+        }
+
+    def add(self, message):
+        """
+        Queue an unsaved Message; must be called from the event loop, before the message
+        is broadcast. Raises MessageBufferFull when the database has been unreachable
+        long enough for max_pending messages to pile up.
+        """
+        self._ensure_task()
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise MessageBufferFull(f'{len(self._pending)} chat messages are waiting for the database')
+            self._pending.append((time.monotonic(), message))
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Write everything pending and return once it is in the database."""
+        self._ensure_task()
+        async with self._flushing:
+            while batch := self._take():
+                await database_sync_to_async(self._write)(batch)
+
+    def flush_sync(self):
+        """Last-chance flush for interpreter exit, when no event loop is running."""
+        from .realtime import broadcast_message_failed
+        try:
+            while batch := self._take():
+                self._write(batch)
+        except DatabaseError:
+            with self._lock:
+                lost, self._pending = self._pending, []
+            logger.exception('Could not write %s pending chat messages at exit', len(lost))
+            for _, message in lost:
+                broadcast_message_failed(message)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, pending=len(self._pending))
+        stats['avg_flush_size'] = stats['messages_written'] / stats['flushes'] if stats['flushes'] else 0.0
+        return stats
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and not self._task.done():
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._flushing = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except DatabaseError:
+                logger.exception('Chat write buffer flush failed; retrying')
+                await asyncio.sleep(min(self.flush_interval * 4, 5))
+
+    def _take(self):
+        with self._lock:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+        return batch
+
+    def _stamp_sent_at(self, messages):
+        """Write time, strictly increasing in arrival order so (sent_at, id) keeps that order."""
+        sent_at = timezone.now()
+        if self._last_sent_at is not None and sent_at <= self._last_sent_at:
+            sent_at = self._last_sent_at + timedelta(microseconds=1)
+        for offset, message in enumerate(messages):
+            message.sent_at = sent_at + timedelta(microseconds=offset)
+        self._last_sent_at = messages[-1].sent_at
+
+    def _write(self, batch):
+        from apps.notifications.notify import notify_new_messages
+        from .models import Message
+        from .realtime import broadcast_message_failed
+        messages = [message for _, message in batch]
+        self._stamp_sent_at(messages)
+        try:
+            Message.objects.bulk_create(messages)
+        except IntegrityError:
+            # Usually a conversation deleted meanwhile; save the rest one by one
+            saved = []
+            for message in messages:
+                try:
+                    message.save(force_insert=True)
+                    saved.append(message)
+                except IntegrityError:
+                    logger.warning('Dropping chat message %s for conversation %s', message.pk, message.conversation_id)
+                    broadcast_message_failed(message)
+            messages = saved
+        except DatabaseError:
+            with self._lock:
+                self._pending[:0] = batch
+                self._stats['failed_flushes'] += 1
+            raise
+        try:
+            # One coalesced notification per conversation for the whole batch
+            notify_new_messages(messages)
+        except DatabaseError:
+            logger.exception('Could not create new-message notifications')
+        lag = (time.monotonic() - batch[0][0]) * 1000
+        with self._lock:
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['messages_written'] += len(batch)
+            stats['last_flush_size'] = len(batch)
+            stats['max_flush_size'] = max(stats['max_flush_size'], len(batch))
+            stats['last_lag_ms'] = lag
+            stats['max_lag_ms'] = max(stats['max_lag_ms'], lag)
+
+
+message_buffer = MessageWriteBuffer(
+    max_batch=settings.CHAT_WRITE_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_FLUSH_INTERVAL,
+)
+atexit.register(message_buffer.flush_sync)
@@ -0,0 +1,98 @@
+"""Publishing of conversation events to the channel layer."""
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+QUEUE_GROUP = 'lawyers_queue'
+# Most cases sent in a queue snapshot; the queue page lists the same number
+QUEUE_SNAPSHOT_LIMIT = 200
+
+
+def chat_group_name(conversation_id):
+    return f'chat_{conversation_id}'
+
+
+def message_payload(message):
+    """Serialize a message the same way the REST messages endpoint does."""
+    from .serializers import MessageSerializer
+    return dict(MessageSerializer(message).data)
+
+
+def group_send(group_name, event):
+    """Send an event to a group from sync code, never failing the caller."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(group_name, event)
+    except Exception:
+        logger.exception('Could not publish %s to %s', event.get('type'), group_name)
+
+
+def broadcast_message(message):
+    """Publish a saved message to its conversation's chat group once the transaction commits."""
+    event = {'type': 'chat_message', 'message': message_payload(message)}
+    group_name = chat_group_name(message.conversation_id)
+    transaction.on_commit(lambda: group_send(group_name, event))
+
+
+def broadcast_message_failed(message):
+    """Tell the chat group that a message it was already shown will never be saved."""
+    group_send(chat_group_name(message.conversation_id), {'type': 'message_failed', 'message_id': str(message.pk)})
+
+
+def read_payload(reader, read_at):
+    return {'type': 'read_receipt', 'reader': reader, 'read_at': read_at.isoformat()}
+
+
+def broadcast_read(conversation_id, reader, read_at):
+    """Tell the conversation's chat group that a side advanced its read watermark."""
+    event = read_payload(reader, read_at)
+    group_name = chat_group_name(conversation_id)
+    transaction.on_commit(lambda: group_send(group_name, event))
+
+
+def queue_cases(queryset=None, limit=QUEUE_SNAPSHOT_LIMIT):
+    """Unassigned pending cases as queue payloads, newest first, read with one query."""
+    from .models import Conversation, ConversationStatus
+    if queryset is None:
+        queryset = Conversation.objects.filter(lawyer__isnull=True, status=ConversationStatus.PENDING)
+    rows = queryset.order_by('-created_at', '-id').values(
+        'id', 'client__name', 'client__cedula', 'platform__name',
+        'loan__currency', 'loan__amount', 'loan__days_overdue', 'created_at',
+    )[:limit]
+    return [
+        {
+            'id': str(row['id']),
+            'client_name': row['client__name'],
+            'client_cedula': row['client__cedula'],
+            'platform_name': row['platform__name'],
+            'loan': None if row['loan__amount'] is None else {
+                'currency': row['loan__currency'],
+                'amount': str(row['loan__amount']),
+                'days_overdue': row['loan__days_overdue'],
+            },
+            'created_at': row['created_at'].isoformat(),
+        }
+        for row in rows
+    ]
+
+
+def publish_new_case(conversation):
+    """Add a case to every lawyer's live queue once the transaction commits."""
+    from .models import Conversation
+
+    def publish():
+        cases = queue_cases(Conversation.objects.filter(pk=conversation.pk, lawyer__isnull=True))
+        if cases:
+            group_send(QUEUE_GROUP, {'type': 'new_case', 'case': cases[0]})
+    transaction.on_commit(publish)
+
+
+def publish_case_assigned(conversation):
+    """Remove a case from the live queues once its assignment commits."""
+    event = {'type': 'case_assigned', 'case_id': str(conversation.pk), 'lawyer_id': str(conversation.lawyer_id)}
+    transaction.on_commit(lambda: group_send(QUEUE_GROUP, event))
@@ -0,0 +1,87 @@
+"""
+Ranked search over conversations for the API and the lawyer panel.
+On PostgreSQL a conversation matches when its subject, its client's name or any of its
+messages match a websearch query (quoted phrases, OR, -exclusion) against the Spanish
+tsvector columns that triggers keep up to date (migrations conversations 0008 and
+platforms 0004), all served by their GIN indexes; a cedula matches exactly. Results are
+ordered by the summed ts_rank of the parts that matched. Other databases fall back to
+unranked icontains matching.
+"""
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, Exists, F, FilteredRelation, FloatField, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from apps.platforms.normalization import normalize_cedula
+from .models import Message
+
+SEARCH_CONFIG = 'spanish'
+# Shortest query worth running; shorter ones match almost everything
+MIN_QUERY_LENGTH = 2
+# Marks around the matched words in headlines; plain text, so templates can escape it
+HEADLINE_START, HEADLINE_STOP = '«', '»'
+
+
+def search_query(text):
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def search_conversations(queryset, text):
+    """
+    Filter a Conversation queryset down to the matches for `text`, best first.
+    Each row gets `rank` and `headline`, a snippet of its best matching message (None
+    when only the subject or the client matched).
+    """
+    cedula = normalize_cedula(text)
+    if connections[queryset.db].vendor != 'postgresql':
+        return _search_conversations_icontains(queryset, text, cedula)
+
+    query = search_query(text)
+    best_message = Message.objects.filter(conversation=OuterRef('pk'), search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query),
+    ).order_by('-rank', '-sent_at')
+    # Message ranks come from one join against the GIN matches grouped per conversation,
+    # rather than a subquery that reads every message of every candidate conversation
+    return queryset.annotate(
+        matching_messages=FilteredRelation('messages', condition=Q(messages__search_vector=query)),
+    ).filter(
+        Q(matching_messages__isnull=False)
+        | Q(search_vector=query)
+        | Q(client__search_vector=query)
+        | Q(client__cedula=cedula)
+    ).annotate(
+        # Best message plus the subject, client and cedula parts, which are the same on every joined row
+        rank=Max(
+            Coalesce(SearchRank(F('matching_messages__search_vector'), query), 0.0)
+            + Coalesce(SearchRank(F('search_vector'), query), 0.0)
+            + Coalesce(SearchRank(F('client__search_vector'), query), 0.0)
+            + Case(When(client__cedula=cedula, then=Value(1.0)), default=Value(0.0))
+        ),
+        headline=Subquery(best_message.annotate(
+            headline=SearchHeadline(
+                'content', query, config=SEARCH_CONFIG, start_sel=HEADLINE_START, stop_sel=HEADLINE_STOP,
+            ),
+        ).values('headline')[:1]),
+    ).order_by('-rank', '-updated_at', 'pk')
+
+
+def _search_conversations_icontains(queryset, text, cedula):
+    matching_messages = Message.objects.filter(conversation=OuterRef('pk'), content__icontains=text)
+    return queryset.filter(
+        Exists(matching_messages)
+        | Q(subject__icontains=text)
+        | Q(client__name__icontains=text)
+        | Q(client__cedula=cedula)
+    ).annotate(
+        rank=Value(0.0, output_field=FloatField()),
+        headline=Subquery(matching_messages.order_by('-sent_at').values('content')[:1]),
+    ).order_by('-updated_at', 'pk')
+
+
+def search_messages(queryset, text):
+    """Filter a Message queryset to the matches for `text`, best first (admin search)."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.filter(content__icontains=text)
+    query = search_query(text)
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query),
+    ).order_by('-rank', '-sent_at')
@@ -30,9 +30,9 @@ class ConversationSerializer(serializers.ModelSerializer):
             'client', 'client_name', 'loan', 'lawyer', 'lawyer_name',
             'status', 'status_display', 'subject', 'procedure_requested',
             'resolution_notes', 'page_url', 'messages', 'message_count',
-            'created_at', 'closed_at'
+            'platform_user_read_at', 'lawyer_read_at', 'created_at', 'closed_at'
         ]
-        read_only_fields = ['id', 'created_at', 'closed_at']
+        read_only_fields = ['id', 'platform_user_read_at', 'lawyer_read_at', 'created_at', 'closed_at']
 
     def get_client_name(self, obj):
         return obj.client.name if obj.client else None
@@ -44,6 +44,60 @@ class ConversationSerializer(serializers.ModelSerializer):
         return obj.messages.count()
 
 
+class ConversationListSerializer(serializers.ModelSerializer):
+    """
+    Lightweight Conversation serializer for list pages.
+    Expects the message_count, unread_count and last_message_* annotations added by
+    ConversationViewSet.get_queryset; messages are served by the messages endpoint.
+    """
+    platform_name = serializers.CharField(source='platform.name', read_only=True)
+    client_name = serializers.CharField(source='client.name', read_only=True, default=None)
+    lawyer_name = serializers.CharField(source='lawyer.name', read_only=True, default=None)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    message_count = serializers.IntegerField(read_only=True)
+    unread_count = serializers.IntegerField(read_only=True)
+    last_message = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = [
+            'id', 'platform', 'platform_name', 'platform_user',
+            'client', 'client_name', 'loan', 'lawyer', 'lawyer_name',
+            'status', 'status_display', 'subject', 'procedure_requested',
+            'resolution_notes', 'page_url', 'message_count', 'unread_count', 'last_message',
+            'created_at', 'updated_at', 'closed_at'
+        ]
+        read_only_fields = fields
+
+    def get_last_message(self, obj):
+        if obj.last_message_at is None:
+            return None
+        return {
+            'content': obj.last_message_content,
+            'sender_type': obj.last_message_sender_type,
+            'sent_at': serializers.DateTimeField().to_representation(obj.last_message_at),
+        }
+
+
+class ConversationSearchSerializer(serializers.ModelSerializer):
+    """Search result row; expects the rank and headline annotations of search_conversations."""
+    client_name = serializers.CharField(source='client.name', read_only=True, default=None)
+    client_cedula = serializers.CharField(source='client.cedula', read_only=True, default=None)
+    lawyer_name = serializers.CharField(source='lawyer.name', read_only=True, default=None)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Conversation
+        fields = [
+            'id', 'client', 'client_name', 'client_cedula', 'lawyer', 'lawyer_name',
+            'status', 'status_display', 'subject', 'rank', 'headline',
+            'created_at', 'updated_at', 'closed_at'
+        ]
+        read_only_fields = fields
+
+
 class ConversationCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating a Conversation."""
     class Meta:
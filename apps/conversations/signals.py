@@ -0,0 +1,11 @@
+"""Signal handlers for conversations app."""
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from apps.lawyers.models import update_case_counters
+from .models import Conversation
+
+
+@receiver(post_delete, sender=Conversation)
+def release_lawyer_case(sender, instance, **kwargs):
+    """Deleted conversations (including cascades) stop counting against their lawyer."""
+    update_case_counters(instance.lawyer_id, instance.status, None, None)
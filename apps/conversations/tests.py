@@ -1,3 +1,988 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import tempfile
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.contrib.auth.models import AnonymousUser
+from django.test import AsyncClient, Client as BrowserClient, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from apps.lawyers.models import Lawyer
+from apps.loans.models import Loan, LoanStatus
+from apps.platforms.cache import platform_cache
+from apps.platforms.models import Client, Platform, PlatformUser
+from config.testing import QueryScalingMixin
+from .consumers import TypingThrottle, typing_stats
+from .layers import PostgresChannelLayer
+from .models import ChannelGroupMembership, Conversation, ConversationStatus, Message, SenderType
+from .persistence import MessageBufferFull, MessageWriteBuffer, message_buffer
+from .realtime import chat_group_name
+from .routing import websocket_urlpatterns
+from .search import search_conversations, search_messages
+from .views import MESSAGES_MAX_PAGE_SIZE, message_sent
 
-# Create your tests here.
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are only checked on PostgreSQL')
+class HotQueryPlanTests(TestCase):
+    """
+    EXPLAIN the hot querysets against realistic row counts and fail if the
+    planner falls back to a sequential scan of the filtered table.
+    """
+    PLATFORMS = 20
+    CLIENTS = 4000
+    LAWYERS = 40
+    CONVERSATIONS = 20000
+    MESSAGES = 60000
+    LOANS = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        now = timezone.now()
+        cls.platforms = Platform.objects.bulk_create([
+            Platform(name=f'Plataforma {i}', domain=f'p{i}.do', api_key=f'avl_plan_{i}') for i in range(cls.PLATFORMS)
+        ])
+        users = User.objects.bulk_create([User(username=f'abogado{i}') for i in range(cls.LAWYERS)])
+        cls.lawyers = Lawyer.objects.bulk_create([
+            Lawyer(user=user, name=user.username, email=f'{user.username}@jcj.do') for user in users
+        ])
+        cls.clients = Client.objects.bulk_create([
+            Client(platform=cls.platforms[i % cls.PLATFORMS], name=f'Cliente {i}', cedula=f'001-{i:07d}-1')
+            for i in range(cls.CLIENTS)
+        ], batch_size=2000)
+
+        conversations = []
+        for i in range(cls.CONVERSATIONS):
+            client = cls.clients[i % cls.CLIENTS]
+            roll = rng.random()
+            if roll < 0.01:
+                lawyer, status = None, ConversationStatus.PENDING
+            elif roll < 0.25:
+                lawyer, status = rng.choice(cls.lawyers), ConversationStatus.ACTIVE
+            else:
+                lawyer, status = rng.choice(cls.lawyers), ConversationStatus.CLOSED
+            conversations.append(Conversation(
+                platform_id=client.platform_id, client=client, lawyer=lawyer, status=status,
+            ))
+        cls.conversations = Conversation.objects.bulk_create(conversations, batch_size=2000)
+        Conversation.objects.filter(pk__in=[c.pk for c in cls.conversations[::3]]).update(
+            created_at=now - timedelta(days=30)
+        )
+
+        Message.objects.bulk_create([
+            Message(
+                conversation=cls.conversations[i % cls.CONVERSATIONS],
+                sender_type=SenderType.PLATFORM_USER,
+                content=f'Mensaje {i}',
+            )
+            for i in range(cls.MESSAGES)
+        ], batch_size=5000)
+
+        statuses = list(LoanStatus.values)
+        Loan.objects.bulk_create([
+            Loan(
+                client=cls.clients[i % cls.CLIENTS], amount=1000, balance=500,
+                status=rng.choice(statuses), days_overdue=rng.randint(0, 180),
+            )
+            for i in range(cls.LOANS)
+        ], batch_size=5000)
+
+        with connection.cursor() as cursor:
+            # Rows inserted after CREATE INDEX wait in the GIN pending lists until autovacuum merges them
+            cursor.execute("SELECT gin_clean_pending_list('msg_search_vector_idx'::regclass)")
+            for model in (Platform, Client, Lawyer, Conversation, Message, Loan):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+    def setUp(self):
+        platform_cache.clear()
+        cache.clear()
+        self.platform = self.platforms[3]
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        self.lawyer = self.lawyers[5]
+        self.browser = BrowserClient()
+        self.browser.force_login(self.lawyer.user)
+
+    def explain_request(self, send):
+        """(sql, plan) of every SELECT a real request runs, so the plans follow the views' querysets."""
+        with CaptureQueriesContext(connection) as queries:
+            response = send()
+        self.assertLess(response.status_code, 400)
+        plans = []
+        for query in queries.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {query['sql']}")
+                plan = cursor.fetchone()[0]
+            plans.append((query['sql'], (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']))
+        return response, plans
+
+    def assertNoSeqScan(self, send, *tables):
+        """Fail if any query of the request reads one of `tables` with a sequential scan."""
+        response, plans = self.explain_request(send)
+        read = {node.get('Relation Name') for _, plan in plans for node in plan_nodes(plan)}
+        self.assertTrue(read & set(tables), f'The request read none of {tables}')
+        for sql, plan in plans:
+            seq_scans = [
+                node['Relation Name'] for node in plan_nodes(plan)
+                if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in tables
+            ]
+            self.assertFalse(seq_scans, f'Sequential scan on {seq_scans}:\n{sql}\n{json.dumps(plan, indent=2)}')
+        return response
+
+    def test_platform_conversation_list(self):
+        self.assertNoSeqScan(lambda: self.api.get('/api/v1/conversations/'), 'conversations_conversation', 'conversations_message')
+
+    def test_platform_conversation_list_keyset_page(self):
+        cursor = self.api.get('/api/v1/conversations/', {'pagination': 'cursor', 'page_size': 300}).data['next_cursor']
+        _, plans = self.explain_request(lambda: self.api.get('/api/v1/conversations/', {'cursor': cursor}))
+        page_plans = [plan for sql, plan in plans if 'LIMIT 21' in sql]
+        self.assertEqual(len(page_plans), 1)
+        # One range of the composite index: the cursor is an index condition and nothing is sorted
+        plan = page_plans[0]
+        scans = [node for node in plan_nodes(plan) if node.get('Index Name') == 'conv_platform_created_idx']
+        self.assertTrue(scans and 'ROW(' in scans[0].get('Index Cond', ''), json.dumps(plan, indent=2))
+        self.assertNotIn('Sort', [node['Node Type'] for node in plan_nodes(plan) if node.get('Parent Relationship') != 'SubPlan'])
+
+    def test_lawyer_panel(self):
+        tables = ('conversations_conversation', 'conversations_message')
+        for url, params in (
+            (reverse('lawyers:dashboard'), {}),
+            (reverse('lawyers:conversation_list'), {}),
+            (reverse('lawyers:conversation_list'), {'status': 'closed'}),
+            (reverse('lawyers:queue'), {}),
+        ):
+            with self.subTest(url=url, **params):
+                self.assertNoSeqScan(lambda: self.browser.get(url, params), *tables)
+
+    def test_conversation_messages(self):
+        conversation = Conversation.objects.filter(lawyer=self.lawyer, platform=self.platform).first()
+        first = conversation.messages.order_by('sent_at', 'id').first()
+        url = f'/api/v1/conversations/{conversation.pk}/messages/'
+        self.assertNoSeqScan(lambda: self.api.get(url), 'conversations_message')
+        self.assertNoSeqScan(lambda: self.api.get(url, {'after': str(first.pk), 'limit': 50}), 'conversations_message')
+        self.assertNoSeqScan(
+            lambda: self.browser.get(reverse('lawyers:conversation_detail', args=[conversation.pk])), 'conversations_message',
+        )
+
+    def test_client_loans(self):
+        client = next(client for client in self.clients if client.platform_id == self.platform.pk)
+        self.assertNoSeqScan(lambda: self.api.get(f'/api/v1/platforms/clients/{client.pk}/loans/'), 'loans_loan')
+
+    def test_widget_finds_client_by_cedula(self):
+        client = next(client for client in self.clients if client.platform_id == self.platform.pk)
+        response = self.assertNoSeqScan(lambda: self.api.post('/api/v1/conversations/', {
+            'subject': 'Embargo', 'client_data': {'name': client.name, 'cedula': client.cedula},
+        }, format='json'), 'platforms_client')
+        self.assertEqual(response.json()['client_id'], str(client.pk))
+
+    def test_full_text_search(self):
+        self.assertNoSeqScan(lambda: self.api.get('/api/v1/conversations/search/', {'q': '4242'}), 'conversations_message')
+        self.assertNoSeqScan(lambda: self.browser.get(reverse('lawyers:search'), {'q': '4242'}), 'conversations_message')
+
+
+class ConversationQueryScalingTests(QueryScalingMixin, TestCase):
+    url = '/api/v1/conversations/'
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.lawyer = Lawyer.objects.create(
+            user=User.objects.create_user('ana'), name='Ana', email='ana@jcj.do', is_on_shift=True,
+            max_concurrent_cases=1000,
+        )
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        # Every measured request finds the platform cached, as in steady state
+        platform_cache.set(self.platform.api_key, self.platform)
+
+    def conversations(self, size):
+        """`size` conversations, each with its own user, client, loan, lawyer and two messages."""
+        users = PlatformUser.objects.bulk_create([
+            PlatformUser(platform=self.platform, external_id=uuid.uuid4().hex, name='Operador') for _ in range(size)
+        ])
+        clients = Client.objects.bulk_create([
+            Client(platform=self.platform, external_id=uuid.uuid4().hex, cedula=uuid.uuid4().hex[:13], name='Juan')
+            for _ in range(size)
+        ])
+        loans = Loan.objects.bulk_create([
+            Loan(client=client, external_id='P1', amount=1000, balance=500) for client in clients
+        ])
+        conversations = Conversation.objects.bulk_create([
+            Conversation(
+                platform=self.platform, platform_user=user, client=client, loan=loan, lawyer=self.lawyer,
+                status=ConversationStatus.ACTIVE,
+            )
+            for user, client, loan in zip(users, clients, loans)
+        ])
+        Message.objects.bulk_create([
+            Message(conversation=conversation, sender_type=sender_type, content='Hola')
+            for conversation in conversations for sender_type in (SenderType.PLATFORM_USER, SenderType.LAWYER)
+        ])
+
+    def conversation_with_messages(self, size):
+        client = Client.objects.create(platform=self.platform, name='Juan', cedula=uuid.uuid4().hex[:13])
+        conversation = Conversation.objects.create(
+            platform=self.platform, client=client, lawyer=self.lawyer, status=ConversationStatus.ACTIVE,
+        )
+        Message.objects.bulk_create([
+            Message(conversation=conversation, sender_type=SenderType.PLATFORM_USER, content=f'Mensaje {i}')
+            for i in range(size)
+        ])
+        return conversation
+
+    def test_collection_actions(self):
+        actions = {
+            'list': lambda _: self.api.get(self.url),
+            'list_cursor': lambda _: self.api.get(self.url, {'pagination': 'cursor'}),
+            'create': lambda _: self.api.post(self.url, {
+                'subject': 'Embargo', 'client_data': {'name': 'Maria', 'cedula': uuid.uuid4().hex[:11]},
+            }, format='json'),
+            'export': lambda _: self.api.get(f'{self.url}export/'),
+            'export_messages': lambda _: self.api.get(f'{self.url}export/messages/'),
+            'search': lambda _: self.api.get(f'{self.url}search/', {'q': 'Hola'}),
+        }
+        for action, request in actions.items():
+            with self.subTest(action):
+                self.assertConstantQueries(self.conversations, request)
+
+    def test_detail_actions(self):
+        detail = lambda conversation: f'{self.url}{conversation.pk}/'
+        actions = {
+            'retrieve': lambda c: self.api.get(detail(c)),
+            'update': lambda c: self.api.put(detail(c), {'platform': str(self.platform.pk), 'subject': 'Nuevo'}),
+            'partial_update': lambda c: self.api.patch(detail(c), {'subject': 'Nuevo'}),
+            'destroy': lambda c: self.api.delete(detail(c)),
+            'send_message': lambda c: self.api.post(
+                f'{detail(c)}send_message/', {'sender_type': SenderType.PLATFORM_USER, 'content': 'Hola'},
+            ),
+            'messages': lambda c: self.api.get(f'{detail(c)}messages/'),
+            'messages_page': lambda c: self.api.get(
+                f'{detail(c)}messages/', {'after': str(c.messages.earliest('sent_at').pk), 'limit': 5},
+            ),
+            'read': lambda c: self.api.post(f'{detail(c)}read/'),
+            'close': lambda c: self.api.post(f'{detail(c)}close/', {'notes': 'Resuelto'}),
+        }
+        for action, request in actions.items():
+            with self.subTest(action):
+                self.assertConstantQueries(self.conversation_with_messages, request)
+
+
+class MessageExportTests(TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        conversation = Conversation.objects.create(platform=self.platform)
+        for content in ('Hola', 'Necesito ayuda'):
+            Message.objects.create(conversation=conversation, sender_type=SenderType.PLATFORM_USER, content=content)
+
+    async def test_streams_under_asgi(self):
+        response = await AsyncClient().get(
+            '/api/v1/conversations/export/messages/', headers={'Authorization': f'Api-Key {self.platform.api_key}'}
+        )
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual([json.loads(line)['content'] for line in lines], ['Hola', 'Necesito ayuda'])
+
+
+class ConversationSearchTests(TestCase):
+    url = '/api/v1/conversations/search/'
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        client = Client.objects.create(platform=self.platform, name='Juan Perez', cedula='001-0000001-1')
+        self.by_subject = Conversation.objects.create(platform=self.platform, client=client, subject='Embargo del vehiculo')
+        self.by_message = Conversation.objects.create(platform=self.platform, subject='Consulta')
+        # bulk_create, like the chat write buffer, must be searchable too
+        Message.objects.bulk_create([
+            Message(
+                conversation=self.by_message, sender_type=SenderType.PLATFORM_USER, content='Me llego un embargo de la cuenta',
+            ),
+            Message(conversation=self.by_message, sender_type=SenderType.LAWYER, content='Revisaremos el desalojo'),
+        ])
+        other = Platform.objects.create(name='Otra', domain='otra.do')
+        Conversation.objects.create(platform=other, subject='Embargo ajeno')
+
+    def search(self, q, **params):
+        return self.api.get(self.url, {'q': q, **params})
+
+    def result_ids(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_matches_subject_messages_client_and_cedula_of_the_platform(self):
+        self.assertCountEqual(self.result_ids(self.search('embargo')), [str(self.by_subject.pk), str(self.by_message.pk)])
+        self.assertEqual(self.result_ids(self.search('desalojo')), [str(self.by_message.pk)])
+        self.assertEqual(self.result_ids(self.search('Perez')), [str(self.by_subject.pk)])
+        self.assertEqual(self.result_ids(self.search('00100000011')), [str(self.by_subject.pk)])
+        self.assertEqual(self.result_ids(self.search('tribunal')), [])
+
+    def test_rejects_short_queries_and_cursor_pagination(self):
+        self.assertEqual(self.search('a').json(), {'error': 'q must have at least 2 characters'})
+        self.assertEqual(self.search('embargo', pagination='cursor').status_code, 400)
+
+    def test_paginates(self):
+        response = self.search('embargo', page_size=1)
+        self.assertEqual(response.json()['count'], 2)
+        self.assertIsNotNone(response.json()['next'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Ranking needs PostgreSQL full-text search')
+    def test_ranks_stems_and_highlights(self):
+        Message.objects.create(conversation=self.by_subject, sender_type=SenderType.LAWYER, content='El embargo sigue')
+        rows = self.search('embargos').json()['results']
+        # Subject and message both match on by_subject, so it ranks first
+        self.assertEqual([row['id'] for row in rows], [str(self.by_subject.pk), str(self.by_message.pk)])
+        self.assertGreater(rows[0]['rank'], rows[1]['rank'])
+        self.assertEqual(rows[1]['headline'], 'Me llego un «embargo» de la cuenta')
+        # Exclusion applies to each message, subject and name on its own
+        self.assertEqual(self.result_ids(self.search('embargo -cuenta')), [str(self.by_subject.pk)])
+
+    @skipUnless(connection.vendor == 'postgresql', 'The search_vector triggers are PostgreSQL-only')
+    def test_triggers_follow_edits(self):
+        message = self.by_message.messages.get(sender_type=SenderType.LAWYER)
+        message.content = 'Revisaremos la hipoteca'
+        message.save()
+        Client.objects.filter(pk=self.by_subject.client_id).update(name='Pedro Gomez')
+        self.assertEqual(self.result_ids(self.search('hipoteca')), [str(self.by_message.pk)])
+        self.assertEqual(self.result_ids(self.search('desalojo')), [])
+        self.assertEqual(self.result_ids(self.search('Gomez')), [str(self.by_subject.pk)])
+
+
+class ConversationListTests(TestCase):
+    url = '/api/v1/conversations/'
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        self.conversation = Conversation.objects.create(
+            platform=self.platform, subject='Embargo', resolution_notes='Acuerdo de pago firmado',
+        )
+        start = timezone.now() - timedelta(minutes=10)
+        self.messages = [
+            Message.objects.create(
+                conversation=self.conversation, sender_type=sender_type, content=str(i), sent_at=start + timedelta(minutes=i)
+            )
+            for i, sender_type in enumerate([SenderType.LAWYER, SenderType.PLATFORM_USER, SenderType.SYSTEM])
+        ]
+        self.empty = Conversation.objects.create(platform=self.platform)
+
+    def test_list_fields(self):
+        empty, listed = self.api.get(self.url).data['results']
+        self.assertEqual(listed['id'], str(self.conversation.pk))
+        self.assertNotIn('messages', listed)
+        self.assertEqual(listed['resolution_notes'], 'Acuerdo de pago firmado')
+        self.assertEqual((listed['message_count'], listed['unread_count']), (3, 2))
+        self.assertEqual(
+            (listed['last_message']['content'], listed['last_message']['sender_type']), ('2', SenderType.SYSTEM),
+        )
+        self.assertEqual((empty['message_count'], empty['unread_count'], empty['last_message']), (0, 0, None))
+
+    def test_unread_count_follows_the_watermark(self):
+        self.conversation.mark_read(SenderType.PLATFORM_USER, self.messages[1].pk)
+        response = self.api.get(self.url, {'pagination': 'cursor'})
+        counts = {row['id']: (row['message_count'], row['unread_count']) for row in response.data['results']}
+        self.assertEqual(counts[str(self.conversation.pk)], (3, 1))
+
+    def test_counts_are_subqueries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.api.get(self.url)
+        # No join of the page against every message, grouped per conversation
+        grouped = [query['sql'] for query in queries.captured_queries if 'GROUP BY "conversations_conversation"' in query['sql']]
+        self.assertFalse(grouped)
+
+
+class ReadWatermarkTests(TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.conversation = Conversation.objects.create(platform=self.platform)
+        start = timezone.now() - timedelta(minutes=10)
+        self.messages = [
+            Message.objects.create(
+                conversation=self.conversation, sender_type=sender_type, content=str(i), sent_at=start + timedelta(minutes=i)
+            )
+            for i, sender_type in enumerate([SenderType.LAWYER, SenderType.PLATFORM_USER, SenderType.LAWYER])
+        ]
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+
+    def read(self, **data):
+        return self.api.post(f'/api/v1/conversations/{self.conversation.pk}/read/', data, format='json')
+
+    def test_read_is_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.read(message=str(self.messages[0].pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['unread_count'], 1)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries.captured_queries), 1)
+
+        messages = self.api.get(f'/api/v1/conversations/{self.conversation.pk}/messages/').json()
+        self.assertEqual([message['is_read'] for message in messages], [True, False, False])
+        listed = self.api.get('/api/v1/conversations/').data['results'][0]
+        self.assertEqual(listed['unread_count'], 1)
+
+    def test_watermark_never_moves_back(self):
+        self.assertEqual(self.read().data['unread_count'], 0)
+        self.read(message=str(self.messages[0].pk))
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.platform_user_read_at, self.messages[2].sent_at)
+        self.assertEqual(self.read(message='abc').status_code, 400)
+
+    def test_lawyer_side(self):
+        self.assertEqual(self.conversation.unread_count(SenderType.LAWYER), 1)
+        self.conversation.mark_read(SenderType.LAWYER)
+        self.assertEqual(self.conversation.unread_count(SenderType.LAWYER), 0)
+        export = self.api.get('/api/v1/conversations/export/messages/')
+        rows = [json.loads(line) for line in b''.join(export.streaming_content).decode().splitlines()]
+        self.assertEqual([row['is_read'] for row in rows], [False, True, False])
+
+
+class MessageCursorTests(TestCase):
+    """?after= and ?limit= on the messages endpoint, served by the async view."""
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.conversation = Conversation.objects.create(platform=self.platform)
+        start = timezone.now() - timedelta(minutes=10)
+        # 1, 2 and 3 share a sent_at, so only the id orders them
+        self.messages = Message.objects.bulk_create([
+            Message(
+                conversation=self.conversation, sender_type=SenderType.PLATFORM_USER, content=str(i),
+                sent_at=start + timedelta(minutes=minutes),
+            )
+            for i, minutes in enumerate((0, 1, 1, 1, 4, 5))
+        ])
+        self.messages.sort(key=lambda message: (message.sent_at, message.pk))
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+
+    def page(self, **params):
+        return self.api.get(f'/api/v1/conversations/{self.conversation.pk}/messages/', params)
+
+    def ids(self, page):
+        return [message['id'] for message in page['results']]
+
+    def expected(self, start, stop=None):
+        return [str(message.pk) for message in self.messages[start:stop]]
+
+    def test_after_id(self):
+        page = self.page(after=str(self.messages[0].pk)).json()
+        self.assertEqual(self.ids(page), self.expected(1))
+        self.assertEqual((page['next_cursor'], page['has_more']), (str(self.messages[-1].pk), False))
+
+    def test_after_timestamp(self):
+        sent_at = self.messages[1].sent_at
+        page = self.page(after=sent_at.isoformat()).json()
+        # Strictly after: the whole tie at that instant is skipped
+        self.assertEqual(self.ids(page), self.expected(4))
+        naive = timezone.make_naive(sent_at).isoformat()
+        self.assertEqual(self.ids(self.page(after=naive).json()), self.expected(4))
+
+    def test_walking_a_tie_one_by_one(self):
+        cursor, seen = str(self.messages[0].pk), []
+        while True:
+            page = self.page(after=cursor, limit=1).json()
+            seen += self.ids(page)
+            cursor = page['next_cursor']
+            if not page['has_more']:
+                break
+        self.assertEqual(seen, self.expected(1))
+        # Past the end the page is empty and the cursor stays put
+        page = self.page(after=cursor).json()
+        self.assertEqual((page['results'], page['next_cursor'], page['has_more']), ([], cursor, False))
+
+    def test_limit_without_cursor(self):
+        page = self.page(limit=2).json()
+        self.assertEqual(self.ids(page), self.expected(0, 2))
+        self.assertEqual((page['next_cursor'], page['has_more']), (str(self.messages[1].pk), True))
+        page = self.page(limit=len(self.messages)).json()
+        self.assertFalse(page['has_more'])
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(self.ids(self.page(limit=0).json()), self.expected(0, 1))
+        self.assertEqual(self.ids(self.page(limit=-5).json()), self.expected(0, 1))
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, sender_type=SenderType.LAWYER, content='x')
+            for _ in range(MESSAGES_MAX_PAGE_SIZE)
+        ])
+        page = self.page(limit=MESSAGES_MAX_PAGE_SIZE * 2).json()
+        self.assertEqual((len(page['results']), page['has_more']), (MESSAGES_MAX_PAGE_SIZE, True))
+
+    def test_invalid_cursor_and_limit(self):
+        other = Conversation.objects.create(platform=self.platform)
+        foreign = Message.objects.create(conversation=other, sender_type=SenderType.LAWYER, content='ajeno')
+        for after in ('ayer', str(uuid.uuid4()), str(foreign.pk)):
+            response = self.page(after=after)
+            self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid cursor'}))
+        for limit in ('x', '1.5'):
+            response = self.page(limit=limit)
+            self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid limit'}))
+
+
+@override_settings(ROOT_URLCONF='apps.conversations.benchmark_urls')
+class SyncMessageCursorTests(MessageCursorTests):
+    """The same contract on the DRF view benchmark_widget_api compares the async view against."""
+
+
+class AsyncWidgetViewTests(TransactionTestCase):
+    """Run in autocommit, as the async views do, so publishing after commit happens right away."""
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.conversation = Conversation.objects.create(platform=self.platform)
+        start = timezone.now() - timedelta(minutes=10)
+        self.messages = [
+            Message.objects.create(
+                conversation=self.conversation, sender_type=SenderType.LAWYER, content=str(i), sent_at=start + timedelta(minutes=i)
+            )
+            for i in range(3)
+        ]
+        self.url = f'/api/v1/conversations/{self.conversation.pk}/'
+
+    def get(self, path, data=None, api_key=None):
+        return AsyncClient().get(path, data, headers={'Authorization': f'Api-Key {api_key or self.platform.api_key}'})
+
+    def post(self, path, data):
+        return AsyncClient().post(
+            path, data, content_type='application/json', headers={'Authorization': f'Api-Key {self.platform.api_key}'}
+        )
+
+    async def test_polling(self):
+        response = await self.get(self.url + 'messages/')
+        self.assertEqual([message['content'] for message in response.json()], ['0', '1', '2'])
+        self.assertEqual(response.json()[0]['sent_at'], timezone.localtime(self.messages[0].sent_at).isoformat())
+
+        page = (await self.get(self.url + 'messages/', {'after': str(self.messages[0].pk), 'limit': 1})).json()
+        self.assertEqual((page['results'][0]['content'], page['has_more']), ('1', True))
+        page = (await self.get(self.url + 'messages/', {'after': page['next_cursor']})).json()
+        self.assertEqual(([message['content'] for message in page['results']], page['has_more']), (['2'], False))
+        response = await self.get(self.url + 'messages/', {'after': 'ayer'})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid cursor'}))
+
+    async def test_authentication_and_scoping(self):
+        self.assertEqual((await AsyncClient().get(self.url + 'messages/')).status_code, 401)
+        response = await self.get(self.url + 'messages/', api_key='nope')
+        self.assertEqual((response.status_code, response.json()['detail']), (401, 'Invalid API Key'))
+        other = await Platform.objects.acreate(name='Otra', domain='otra.do')
+        response = await self.get(self.url + 'messages/', api_key=other.api_key)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_send_message(self):
+        layer = get_channel_layer()
+        channel_name = await layer.new_channel()
+        await layer.group_add(chat_group_name(self.conversation.pk), channel_name)
+        response = await self.post(self.url + 'send_message/', {'content': 'Hola', 'sender_type': 'platform_user'})
+        self.assertEqual((response.status_code, response.json()['is_read']), (201, False))
+        event = await layer.receive(channel_name)
+        self.assertEqual(event['message']['id'], response.json()['id'])
+        conversation = await Conversation.objects.aget(pk=self.conversation.pk)
+        message = await Message.objects.aget(pk=response.json()['id'])
+        self.assertEqual(conversation.updated_at, message.sent_at)
+        response = await self.post(self.url + 'send_message/', {'content': 'Hola'})
+        self.assertIn('sender_type', response.json())
+        self.assertEqual((await self.get(self.url + 'send_message/')).status_code, 405)
+
+    async def test_create_then_list(self):
+        response = await self.post('/api/v1/conversations/', {
+            'subject': 'Embargo', 'client_data': {'name': 'Juan', 'cedula': '00112345671', 'phone': '809 555 1234'},
+        })
+        self.assertEqual(response.status_code, 201)
+        conversation = await Conversation.objects.select_related('client').aget(pk=response.json()['id'])
+        self.assertEqual((conversation.client.name, conversation.client.cedula), ('Juan', '001-1234567-1'))
+        self.assertTrue(await conversation.messages.filter(is_system_message=True).aexists())
+
+        listed = (await self.get('/api/v1/conversations/')).json()
+        self.assertEqual(listed['results'][0]['id'], str(conversation.pk))
+
+
+class ChatBroadcastTests(TestCase):
+    """Messages posted over HTTP reach the chat group's WebSockets only once their transaction commits."""
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.user = User.objects.create_user('ana', password='secret')
+        self.lawyer = Lawyer.objects.create(user=self.user, name='Ana', email='ana@jcj.do')
+        self.conversation = Conversation.objects.create(
+            platform=self.platform, lawyer=self.lawyer, status=ConversationStatus.ACTIVE
+        )
+        self.layer = get_channel_layer()
+        self.channel_name = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(chat_group_name(self.conversation.pk), self.channel_name)
+
+    def published(self):
+        """Events waiting on the test channel, without waiting for more."""
+        events = []
+        while True:
+            try:
+                events.append(async_to_sync(asyncio.wait_for)(self.layer.receive(self.channel_name), 0.05))
+            except asyncio.TimeoutError:
+                return events
+
+    def assertPublishedOnCommit(self, send):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = send()
+        self.assertEqual(self.published(), [])
+        for callback in callbacks:
+            callback()
+        events = self.published()
+        self.assertEqual([event['type'] for event in events], ['chat_message'])
+        return response, events[0]['message']
+
+    def test_rest_send_message(self):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        response, message = self.assertPublishedOnCommit(lambda: api.post(
+            f'/api/v1/conversations/{self.conversation.pk}/send_message/',
+            {'content': 'Hola', 'sender_type': 'platform_user'}, format='json',
+        ))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((message['id'], message['sender_type']), (response.json()['id'], 'platform_user'))
+
+    def test_lawyer_panel_send_message(self):
+        self.client.force_login(self.user)
+        response, message = self.assertPublishedOnCommit(lambda: self.client.post(
+            reverse('lawyers:send_message', args=[self.conversation.pk]), {'content': 'Buenas tardes'},
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((message['id'], message['sender_type']), (response.json()['message']['id'], 'lawyer'))
+
+    def test_nothing_published_on_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                message = Message.objects.create(
+                    conversation=self.conversation, sender_type=SenderType.PLATFORM_USER, content='Hola'
+                )
+                message_sent(message)
+                raise RuntimeError
+        self.assertEqual(self.published(), [])
+        self.assertFalse(Message.objects.exists())
+
+
+class ChatWriteBehindTests(TransactionTestCase):
+    def setUp(self):
+        self.conversation = Conversation.objects.create(
+            platform=Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        )
+
+    def communicator(self, conversation_id, user=None):
+        router = URLRouter(websocket_urlpatterns)
+
+        async def app(scope, receive, send):
+            return await router(dict(scope, user=user or AnonymousUser()), receive, send)
+        return WebsocketCommunicator(app, f'/ws/chat/{conversation_id}/')
+
+    async def test_broadcasts_and_saves_by_disconnect(self):
+        communicator = self.communicator(self.conversation.pk)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({'type': 'chat_message', 'content': 'Hola', 'sender_type': 'platform_user'})
+        payload = (await communicator.receive_json_from())['message']
+        await communicator.send_json_to({'type': 'chat_message', 'content': 'Hola', 'sender_type': 'cliente'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+        await communicator.disconnect()
+
+        message = await Message.objects.aget(conversation=self.conversation)
+        self.assertEqual(str(message.pk), payload['id'])
+        # The broadcast carries the arrival time; the row is stamped when it is written
+        self.assertLessEqual(payload['sent_at'], timezone.localtime(message.sent_at).isoformat())
+
+    async def test_widget_receives_lawyer_panel_messages(self):
+        user = await sync_to_async(User.objects.create_user)('ana', password='secret')
+        lawyer = await Lawyer.objects.acreate(user=user, name='Ana', email='ana@jcj.do')
+        await Conversation.objects.filter(pk=self.conversation.pk).aupdate(lawyer=lawyer)
+        communicator = self.communicator(self.conversation.pk)
+        await communicator.connect()
+        browser = BrowserClient()
+        await sync_to_async(browser.force_login)(user)
+        response = await sync_to_async(browser.post)(
+            reverse('lawyers:send_message', args=[self.conversation.pk]), {'content': 'Buenas tardes'}
+        )
+        event = await communicator.receive_json_from()
+        self.assertEqual(event['type'], 'chat_message')
+        self.assertEqual(event['message']['id'], response.json()['message']['id'])
+        await communicator.disconnect()
+
+    async def test_full_buffer_rejects_before_broadcasting(self):
+        communicator = self.communicator(self.conversation.pk)
+        await communicator.connect()
+        full = mock.patch.object(message_buffer, 'max_pending', 0)
+        with full, self.assertLogs('apps.conversations.consumers', 'ERROR'):
+            await communicator.send_json_to({'type': 'chat_message', 'content': 'Hola', 'sender_type': 'platform_user'})
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'error', 'error': 'Message not saved, try again'})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+        self.assertFalse(await Message.objects.filter(conversation=self.conversation).aexists())
+
+    async def test_unwritable_message_is_retracted(self):
+        communicator = self.communicator(self.conversation.pk)
+        await communicator.connect()
+        with self.assertLogs('apps.conversations.persistence', 'WARNING'):
+            await communicator.send_json_to({'type': 'chat_message', 'content': 'Hola', 'sender_type': 'platform_user'})
+            message_id = (await communicator.receive_json_from())['message']['id']
+            # Deleted before the buffer writes the message, so its row can never exist
+            await Conversation.objects.filter(pk=self.conversation.pk).adelete()
+            await message_buffer.flush()
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'message_failed', 'message_id': message_id})
+        await communicator.disconnect()
+        self.assertFalse(await Message.objects.filter(pk=message_id).aexists())
+
+    async def test_read_event_for_a_buffered_message(self):
+        user = await sync_to_async(User.objects.create_user)('ana', password='secret')
+        await Lawyer.objects.acreate(user=user, name='Ana', email='ana@jcj.do')
+        communicator = self.communicator(self.conversation.pk, user)
+        await communicator.connect()
+        await communicator.send_json_to({'type': 'chat_message', 'content': 'Hola', 'sender_type': 'platform_user'})
+        message_id = (await communicator.receive_json_from())['message']['id']
+        await communicator.send_json_to({'type': 'read', 'message_id': message_id})
+        event = await communicator.receive_json_from()
+        self.assertEqual((event['type'], event['reader']), ('read', 'lawyer'))
+        await communicator.disconnect()
+
+        message = await Message.objects.select_related('conversation').aget(pk=message_id)
+        self.assertTrue(message.is_read)
+
+    async def test_widget_cannot_move_the_lawyer_watermark(self):
+        message = await Message.objects.acreate(
+            conversation=self.conversation, sender_type=SenderType.PLATFORM_USER, content='Hola',
+        )
+        communicator = self.communicator(self.conversation.pk)
+        await communicator.connect()
+        await communicator.send_json_to({'type': 'read', 'reader': 'lawyer', 'message_id': str(message.pk)})
+        event = await communicator.receive_json_from()
+        self.assertEqual((event['type'], event['reader']), ('read', 'platform_user'))
+        await communicator.disconnect()
+
+        conversation = await Conversation.objects.aget(pk=self.conversation.pk)
+        self.assertIsNone(conversation.lawyer_read_at)
+        self.assertEqual(conversation.platform_user_read_at, message.sent_at)
+
+    async def test_unknown_conversation_is_rejected(self):
+        for conversation_id in ('00000000-0000-0000-0000-000000000000', 'abc'):
+            connected, code = await self.communicator(conversation_id).connect()
+            self.assertEqual((connected, code), (False, 4404))
+
+    async def test_flushes_in_batches(self):
+        buffer = MessageWriteBuffer(max_batch=3, flush_interval=60)
+        for i in range(7):
+            buffer.add(Message(conversation_id=self.conversation.pk, sender_type=SenderType.LAWYER, content=str(i)))
+        await buffer.flush()
+        stats = buffer.stats()
+        self.assertEqual((stats['flushes'], stats['messages_written'], stats['max_flush_size']), (3, 7, 3))
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(await Message.objects.filter(conversation=self.conversation).acount(), 7)
+
+    async def test_sent_at_is_the_write_time_in_arrival_order(self):
+        buffer = MessageWriteBuffer(max_batch=2, flush_interval=60, max_pending=3)
+        buffered = [
+            Message(conversation_id=self.conversation.pk, sender_type=SenderType.LAWYER, content=str(i)) for i in range(3)
+        ]
+        for message in buffered:
+            buffer.add(message)
+        with self.assertRaises(MessageBufferFull):
+            buffer.add(Message(conversation_id=self.conversation.pk, sender_type=SenderType.LAWYER, content='x'))
+        # Committed while the others wait: cursors past it must still reach the buffered ones
+        direct = await Message.objects.acreate(conversation=self.conversation, sender_type=SenderType.LAWYER, content='d')
+        await buffer.flush()
+
+        stored = [m async for m in Message.objects.filter(conversation=self.conversation).order_by('sent_at', 'id')]
+        self.assertEqual([m.content for m in stored], ['d', '0', '1', '2'])
+        self.assertEqual(await Message.objects.filter(sent_at__gt=direct.sent_at).acount(), 3)
+        self.assertEqual(buffer.stats()['rejected'], 1)
+
+
+class LawyerQueueConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.waiting = Conversation.objects.create(platform=self.platform)
+        user = User.objects.create_user('ana', password='secret')
+        self.lawyer = Lawyer.objects.create(user=user, name='Ana', email='ana@jcj.do')
+
+    def communicator(self, user):
+        router = URLRouter(websocket_urlpatterns)
+
+        async def app(scope, receive, send):
+            return await router(dict(scope, user=user), receive, send)
+        return WebsocketCommunicator(app, '/ws/lawyers/queue/')
+
+    async def test_snapshot_then_events(self):
+        communicator = self.communicator(self.lawyer.user)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual([case['id'] for case in snapshot['cases']], [str(self.waiting.pk)])
+        self.assertFalse(snapshot['truncated'])
+
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        response = await sync_to_async(api.post)('/api/v1/conversations/', {'subject': 'Embargo'}, format='json')
+        event = await communicator.receive_json_from()
+        self.assertEqual((event['type'], event['case']['id']), ('new_case', response.json()['id']))
+
+        self.lawyer.is_on_shift = True
+        await self.lawyer.asave()
+        browser = BrowserClient()
+        await sync_to_async(browser.force_login)(self.lawyer.user)
+        await sync_to_async(browser.post)(f'/lawyers/assign/{self.waiting.pk}/')
+        event = await communicator.receive_json_from()
+        self.assertEqual((event['type'], event['case_id']), ('case_assigned', str(self.waiting.pk)))
+        await communicator.disconnect()
+
+    async def test_snapshot_flags_a_truncated_queue(self):
+        newer = await Conversation.objects.acreate(platform=self.platform)
+        communicator = self.communicator(self.lawyer.user)
+        with mock.patch('apps.conversations.consumers.QUEUE_SNAPSHOT_LIMIT', 1):
+            await communicator.connect()
+            snapshot = await communicator.receive_json_from()
+        self.assertEqual([case['id'] for case in snapshot['cases']], [str(newer.pk)])
+        self.assertTrue(snapshot['truncated'])
+        await communicator.disconnect()
+
+    async def test_only_lawyers_connect(self):
+        connected, code = await self.communicator(AnonymousUser()).connect()
+        self.assertEqual((connected, code), (False, 4403))
+
+
+class LoadBenchmarkTests(TransactionTestCase):
+    def test_reports_every_scenario_and_cleans_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark_load', '--sessions', '1', '--messages', '2', '--lawyers', '1', '--page-loads', '2',
+                '--cases', '2', '--history', '3', '--rooms', '2', '--room-size', '2', '--broadcasts', '2',
+                '--label', 'v1', '--output', output, stdout=StringIO(),
+            )
+            with open(output, encoding='utf-8') as results:
+                report = json.load(results)
+
+        self.assertEqual(report['label'], 'v1')
+        operations = {
+            f'{scenario}.{operation}': result
+            for scenario, results in report['scenarios'].items() for operation, result in results.items()
+        }
+        self.assertEqual(set(operations), {
+            'widget.create', 'widget.send_message', 'widget.poll', 'lawyers.dashboard',
+            'lawyers.conversation_detail', 'websocket.connect', 'websocket.broadcast',
+        })
+        self.assertEqual([name for name, result in operations.items() if result['errors']], [])
+        self.assertEqual(operations['widget.poll']['requests'], 2)
+        self.assertEqual(operations['websocket.broadcast']['requests'], 4)
+        self.assertGreater(operations['lawyers.dashboard']['queries_per_request'], 0)
+        self.assertFalse(Platform.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Full-text search needs PostgreSQL')
+class SearchBenchmarkTests(TransactionTestCase):
+    def test_compares_ilike_with_full_text_search_and_cleans_up(self):
+        out = StringIO()
+        call_command(
+            'benchmark_search', '--messages', '300', '--conversations', '10', '--terms', 'pago', '--repeat', '1', stdout=out,
+        )
+        self.assertIn('fts conversations', out.getvalue())
+        self.assertIn('pago: first page', out.getvalue())
+        self.assertFalse(Platform.objects.exists())
+
+
+class TypingThrottleTests(SimpleTestCase):
+    def setUp(self):
+        self.published = []
+        self.typing = TypingThrottle(self.publish, min_interval=0.05, timeout=0.15)
+
+    async def publish(self, is_typing, sender_name):
+        self.published.append(is_typing)
+
+    async def test_forwards_only_changes(self):
+        before = typing_stats()
+        for _ in range(5):
+            await self.typing.update(True, 'Ana')
+        # Stop and start again within the interval: coalesced into nothing
+        await self.typing.update(False, 'Ana')
+        await self.typing.update(True, 'Ana')
+        await asyncio.sleep(0.08)
+        await self.typing.update(False, 'Ana')
+        await asyncio.sleep(0.08)
+        self.assertEqual(self.published, [True, False])
+        after = typing_stats()
+        self.assertEqual(after['received'] - before['received'], 8)
+        self.assertEqual(after['forwarded'] - before['forwarded'], 2)
+        self.assertEqual(after['suppressed'] - before['suppressed'], 6)
+
+    async def test_start_expires_without_stop(self):
+        await self.typing.update(True, 'Ana')
+        await asyncio.sleep(0.1)
+        await self.typing.update(True, 'Ana')
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.published, [True])
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.published, [True, False])
+
+    async def test_close_sends_stop(self):
+        await self.typing.update(True, 'Ana')
+        await self.typing.close()
+        self.assertEqual(self.published, [True, False])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'The LISTEN/NOTIFY channel layer needs PostgreSQL')
+class PostgresChannelLayerTests(TransactionTestCase):
+    """Two layer instances stand in for two Daphne processes."""
+
+    def setUp(self):
+        self.layer_a = PostgresChannelLayer()
+        self.layer_b = PostgresChannelLayer()
+
+    def tearDown(self):
+        async_to_sync(self.layer_a.close)()
+        async_to_sync(self.layer_b.close)()
+
+    async def receive(self, layer, channel, timeout=2):
+        return await asyncio.wait_for(layer.receive(channel), timeout)
+
+    async def test_group_fan_out_across_processes(self):
+        channel_a = await self.layer_a.new_channel()
+        channel_b = await self.layer_b.new_channel()
+        await self.layer_a.group_add('chat_1', channel_a)
+        await self.layer_b.group_add('chat_1', channel_b)
+        await self.layer_a.group_send('chat_1', {'type': 'chat.message', 'content': 'Hola'})
+        self.assertEqual((await self.receive(self.layer_a, channel_a))['content'], 'Hola')
+        self.assertEqual((await self.receive(self.layer_b, channel_b))['content'], 'Hola')
+
+        await self.layer_b.group_discard('chat_1', channel_b)
+        await self.layer_a.group_send('chat_1', {'type': 'chat.message', 'content': 'Adios'})
+        await self.receive(self.layer_a, channel_a)
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(self.layer_b, channel_b, timeout=0.3)
+
+    async def test_large_payload_spills_to_table(self):
+        channel = await self.layer_b.new_channel()
+        message = {'type': 'chat.message', 'content': 'ñ' * 20000}
+        await self.layer_a.send(channel, message)
+        self.assertEqual(await self.receive(self.layer_b, channel), message)
+
+    async def test_expired_membership_is_ignored(self):
+        channel = await self.layer_b.new_channel()
+        await self.layer_b.group_add('chat_2', channel)
+        await ChannelGroupMembership.objects.filter(channel=channel).aupdate(expires_at=timezone.now())
+        await self.layer_a.group_send('chat_2', {'type': 'chat.message'})
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(self.layer_b, channel, timeout=0.3)
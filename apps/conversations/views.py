@@ -1,108 +1,224 @@
 ﻿"""API views for conversations app."""
-from rest_framework import viewsets, status
+import uuid
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db.models import OuterRef, Q, Subquery
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from apps.platforms.authentication import APIKeyAuthentication, PlatformPermission
+from apps.platforms.export import EXPORT_RENDERERS, export_response
+from apps.platforms.pagination import PlatformAPIPagination
 from apps.platforms.models import Client
-from apps.lawyers.models import Lawyer
-from .models import Conversation, Message, ConversationStatus, SenderType
+from apps.platforms.normalization import normalize_cedula, normalize_phone
+from apps.lawyers.assignment import assign_conversation
+from apps.notifications.notify import notify_new_messages
+from .models import (
+    Conversation, Message, ConversationStatus, SenderType, message_count_annotation, message_is_read_annotation,
+    unread_count_annotation
+)
+from .realtime import broadcast_message, broadcast_read, publish_new_case
+from .search import MIN_QUERY_LENGTH, search_conversations
 from .serializers import (
-    ConversationSerializer, ConversationCreateSerializer,
-    MessageSerializer, MessageCreateSerializer
+    ConversationSerializer, ConversationListSerializer, ConversationSearchSerializer, MessageSerializer
 )
 
 
-class ConversationViewSet(viewsets.ModelViewSet):
-    """ViewSet for Conversation CRUD operations."""
+# Messages per page when ?limit= is missing, and the most a client can ask for
+MESSAGES_PAGE_SIZE = 100
+MESSAGES_MAX_PAGE_SIZE = 500
+
+
+def web_client_defaults(client_data):
+    """Fields of a Client created from the data the widget scraped from the page."""
+    return {
+        'name': client_data.get('name', 'Cliente Web'),
+        'phone': normalize_phone(client_data.get('phone', '')),
+        'email': client_data.get('email', ''),
+        'external_id': f"web_{timezone.now().timestamp()}"
+    }
+
+
+def update_web_client(client, client_data):
+    client.name = client_data.get('name', client.name)
+    client.phone = normalize_phone(client_data.get('phone', client.phone))
+    client.email = client_data.get('email', client.email)
+
+
+def upsert_web_client(platform, client_data):
+    """The client the widget scraped, created or refreshed; None without a name or cedula."""
+    if not client_data or not (client_data.get('name') or client_data.get('cedula')):
+        return None
+    client, created = Client.objects.get_or_create(
+        platform=platform,
+        cedula=normalize_cedula(client_data.get('cedula', '')),
+        defaults=web_client_defaults(client_data)
+    )
+    if not created and client_data.get('name'):
+        # Update existing client with new data
+        update_web_client(client, client_data)
+        client.save()
+    return client
+
+
+def open_conversation(platform, validated_data, client_data):
+    """
+    Create a widget conversation with its client and welcome message, then auto-assign
+    it to the least-loaded available lawyer or, failing that, publish it to the live queue.
+    """
+    client = upsert_web_client(platform, client_data)
+    conversation = Conversation.objects.create(**validated_data, platform=platform, client=client)
+    Message.create_welcome_message(conversation)
+    if assign_conversation(conversation) is None:
+        publish_new_case(conversation)
+    return conversation
+
+
+def conversation_created_body(conversation):
+    return {
+        'id': str(conversation.id),
+        'status': conversation.status,
+        'subject': conversation.subject,
+        'client_id': str(conversation.client_id) if conversation.client_id else None,
+        'created_at': conversation.created_at.isoformat(),
+        'message': 'Conversation created successfully'
+    }
+
+
+def message_sent(message):
+    """
+    Side effects of a message posted through the API: bump the conversation's updated_at
+    (one UPDATE; Conversation.save is for assignment changes), publish the message to the
+    chat group once committed, and notify the assigned lawyer.
+    """
+    Conversation.objects.filter(pk=message.conversation_id).update(updated_at=message.sent_at)
+    broadcast_message(message)
+    notify_new_messages([message])
+
+
+def parse_message_cursor(after):
+    """Split a messages cursor into (message id, None) or (None, sent_at); None if it is neither."""
+    try:
+        return uuid.UUID(after), None
+    except ValueError:
+        pass
+    sent_at = parse_datetime(after)
+    if sent_at is None:
+        return None
+    if timezone.is_naive(sent_at):
+        sent_at = timezone.make_aware(sent_at)
+    return None, sent_at
+
+
+def messages_after(sent_at, message_id=None):
+    """Keyset filter for the messages after a cursor, in (sent_at, id) order."""
+    if message_id is None:
+        return Q(sent_at__gt=sent_at)
+    return Q(sent_at__gt=sent_at) | Q(sent_at=sent_at, id__gt=message_id)
+
+
+def message_page_params(params):
+    """
+    (after, cursor, limit) of a messages page from ?after= and ?limit=, where cursor is
+    parse_message_cursor's result or None without ?after=. Raises ValueError with the
+    message for the client when either is invalid.
+    """
+    after = params.get('after', '').strip()
+    cursor = None
+    if after:
+        cursor = parse_message_cursor(after)
+        if cursor is None:
+            raise ValueError('Invalid cursor')
+    try:
+        limit = int(params.get('limit', MESSAGES_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('Invalid limit')
+    return after, cursor, max(1, min(limit, MESSAGES_MAX_PAGE_SIZE))
+
+
+def message_page_body(rows, limit, after):
+    """Body of a messages page; `rows` holds up to limit + 1 messages, the extra one only tells has_more."""
+    page = rows[:limit]
+    return {
+        'results': MessageSerializer(page, many=True).data,
+        'next_cursor': str(page[-1].id) if page else (after or None),
+        'has_more': len(rows) > limit,
+    }
+
+
+class ConversationViewSet(
+    mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    ViewSet for Conversation CRUD operations. Creating a conversation, sending a message
+    and polling messages are the async views in async_views.py, routed on the same URLs.
+    """
     authentication_classes = [APIKeyAuthentication]
     permission_classes = [PlatformPermission]
+    pagination_class = PlatformAPIPagination
+    keyset_ordering = ('-created_at',)
+    export_fields = (
+        'id', 'client_id', 'client__external_id', 'platform_user_id', 'loan_id', 'lawyer_id', 'lawyer__name',
+        'status', 'subject', 'procedure_requested', 'resolution_notes', 'page_url',
+        'created_at', 'updated_at', 'closed_at',
+    )
+    message_export_fields = (
+        'id', 'conversation_id', 'sender_type', 'sender_id', 'sender_name', 'content', 'attachments',
+        'is_read', 'is_system_message', 'sent_at',
+    )
 
     def get_serializer_class(self):
-        if self.action == 'create':
-            return ConversationCreateSerializer
+        if self.action == 'list':
+            return ConversationListSerializer
+        if self.action == 'search':
+            return ConversationSearchSerializer
         return ConversationSerializer
 
     def get_queryset(self):
-        return Conversation.objects.filter(platform=self.request.platform)
-
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        
-        # Create client from scraped data if provided
-        client = None
-        client_data = request.data.get('client_data', {})
-        if client_data and (client_data.get('name') or client_data.get('cedula')):
-            client, created = Client.objects.get_or_create(
-                platform=request.platform,
-                cedula=client_data.get('cedula', ''),
-                defaults={
-                    'name': client_data.get('name', 'Cliente Web'),
-                    'phone': client_data.get('phone', ''),
-                    'email': client_data.get('email', ''),
-                    'external_id': f"web_{timezone.now().timestamp()}"
-                }
-            )
-            if not created and client_data.get('name'):
-                # Update existing client with new data
-                client.name = client_data.get('name', client.name)
-                client.phone = client_data.get('phone', client.phone)
-                client.email = client_data.get('email', client.email)
-                client.save()
-        
-        conversation = serializer.save(platform=request.platform, client=client)
-        
-        # Create welcome message
-        Message.create_welcome_message(conversation)
-        
-        # Try to auto-assign to available lawyer
-        self._assign_lawyer(conversation)
-        
-        return Response({
-            'id': str(conversation.id),
-            'status': conversation.status,
-            'subject': conversation.subject,
-            'client_id': str(client.id) if client else None,
-            'created_at': conversation.created_at.isoformat(),
-            'message': 'Conversation created successfully'
-        }, status=status.HTTP_201_CREATED)
-
-    def _assign_lawyer(self, conversation):
-        """Auto-assign conversation to available lawyer."""
-        available_lawyer = Lawyer.objects.filter(
-            is_available=True,
-            is_on_shift=True
-        ).first()
-        if available_lawyer and available_lawyer.can_accept_new_case:
-            conversation.lawyer = available_lawyer
-            conversation.status = ConversationStatus.ACTIVE
-            conversation.save()
-            # Notify about assignment
-            Message.create_system_message(
-                conversation,
-                f'El abogado {available_lawyer.name} ha tomado este caso.'
+        qs = Conversation.objects.filter(platform=self.request.platform)
+        if self.action == 'list':
+            last_message = Message.objects.filter(conversation=OuterRef('pk')).order_by('-sent_at')
+            # Per-row subqueries, each an index probe, so the cost follows the page size
+            qs = qs.select_related('platform', 'client', 'lawyer').annotate(
+                message_count=message_count_annotation(),
+                unread_count=unread_count_annotation(SenderType.PLATFORM_USER),
+                last_message_content=Subquery(last_message.values('content')[:1]),
+                last_message_sender_type=Subquery(last_message.values('sender_type')[:1]),
+                last_message_at=Subquery(last_message.values('sent_at')[:1]),
             )
+        elif self.action == 'retrieve':
+            qs = qs.select_related('platform', 'client', 'lawyer').prefetch_related('messages')
+        elif self.action in ('update', 'partial_update'):
+            # The response is a ConversationSerializer; messages are re-read after the save anyway
+            qs = qs.select_related('platform', 'client', 'lawyer')
+        elif self.action == 'search':
+            text = self.request.query_params.get('q', '').strip()
+            qs = search_conversations(qs.select_related('client', 'lawyer'), text)
+        return qs
 
     @action(detail=True, methods=['post'])
-    def send_message(self, request, pk=None):
-        """Send a message in the conversation."""
-        conversation = self.get_object()
-        serializer = MessageCreateSerializer(data=request.data)
-        if serializer.is_valid():
-            message = serializer.save(conversation=conversation)
-            conversation.updated_at = timezone.now()
-            conversation.save()
-            return Response(MessageSerializer(message).data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-    @action(detail=True, methods=['get'])
-    def messages(self, request, pk=None):
-        """Get all messages in the conversation."""
+    def read(self, request, pk=None):
+        """
+        Mark the conversation as read by the platform user up to {"message": <id>}, or up
+        to the latest message when no id is given. One UPDATE, regardless of length.
+        """
         conversation = self.get_object()
-        messages = conversation.messages.all()
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        message_id = request.data.get('message')
+        if message_id is not None:
+            try:
+                message_id = uuid.UUID(str(message_id))
+            except ValueError:
+                return Response({'error': 'Invalid message'}, status=status.HTTP_400_BAD_REQUEST)
+        read_at = conversation.mark_read(SenderType.PLATFORM_USER, message_id)
+        if read_at is None and message_id is not None:
+            return Response({'error': 'Invalid message'}, status=status.HTTP_400_BAD_REQUEST)
+        if read_at is not None:
+            broadcast_read(conversation.pk, SenderType.PLATFORM_USER, read_at)
+        return Response({
+            'read_at': read_at.isoformat() if read_at else None,
+            'unread_count': conversation.unread_count(SenderType.PLATFORM_USER),
+        })
 
     @action(detail=True, methods=['post'])
     def close(self, request, pk=None):
@@ -113,4 +229,35 @@ class ConversationViewSet(viewsets.ModelViewSet):
         return Response({
             'message': 'Conversation closed',
             'closed_at': conversation.closed_at.isoformat()
-        })
\ No newline at end of file
+        })
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked full-text search over message content, subject, client name and cedula.
+        ?q= takes websearch syntax ("frase exacta", OR, -palabra); results are paginated
+        by page number only, since keyset pages cannot follow the rank order.
+        """
+        if len(request.query_params.get('q', '').strip()) < MIN_QUERY_LENGTH:
+            return Response(
+                {'error': f'q must have at least {MIN_QUERY_LENGTH} characters'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if self.paginator.use_keyset_for(request):
+            return Response(
+                {'error': 'Search results only support page-number pagination'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request):
+        """Stream all conversations as NDJSON or CSV (?format=csv), optionally only those changed since ?updated_since."""
+        return export_response(request, self.get_queryset(), self.export_fields, 'conversations')
+
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERERS, url_path='export/messages')
+    def export_messages(self, request):
+        """Stream all messages as NDJSON or CSV; ?updated_since filters on sent_at."""
+        messages = Message.objects.filter(conversation__platform=request.platform).annotate(
+            is_read=message_is_read_annotation()
+        )
+        return export_response(request, messages, self.message_export_fields, 'messages', updated_field='sent_at')
@@ -13,5 +13,16 @@ class LawyerAdmin(admin.ModelAdmin):
     list_display = ['name', 'specialty', 'is_available', 'is_on_shift', 'active_cases_count', 'total_cases_handled']
     list_filter = ['specialty', 'is_available', 'is_on_shift']
     search_fields = ['name', 'email']
-    readonly_fields = ['id', 'created_at', 'updated_at', 'active_cases_count']
-    inlines = [LawyerScheduleInline]
\ No newline at end of file
+    readonly_fields = ['id', 'created_at', 'updated_at', 'active_cases_count', 'total_cases_handled']
+    inlines = [LawyerScheduleInline]
+    # Kept by F() updates on assignment and close (and reconcile_case_counters), never by the form
+    counter_fields = ('active_cases_count', 'total_cases_handled')
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # A full save would write back the counters as they were when the form was loaded
+        obj.save(update_fields=[
+            field.name for field in obj._meta.concrete_fields
+            if not field.primary_key and field.name not in self.counter_fields
+        ])
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Lawyer assignment engine.
+Picks the least-loaded eligible lawyer under a row lock so concurrent
+assignments can never push a lawyer past max_concurrent_cases.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from apps.conversations.models import ConversationStatus, Message
+from apps.conversations.realtime import publish_case_assigned
+from apps.notifications.models import NotificationType
+from apps.notifications.notify import notify
+from .models import Lawyer, LawyerSpecialty
+
+# Fragments of procedure_requested that map to a lawyer specialty
+PROCEDURE_KEYWORDS = {
+    LawyerSpecialty.COBRANZAS: ['cobr', 'deuda'],
+    LawyerSpecialty.EMBARGOS: ['embarg'],
+    LawyerSpecialty.INTIMACIONES: ['intima'],
+}
+
+
+def specialty_for_procedure(procedure):
+    """Return the specialty matching a requested procedure, or None."""
+    procedure = (procedure or '').lower()
+    for specialty, keywords in PROCEDURE_KEYWORDS.items():
+        if any(keyword in procedure for keyword in keywords):
+            return specialty
+    return None
+
+
+def _lock_least_loaded_lawyer(procedure=''):
+    specialty = specialty_for_procedure(procedure)
+    # The counter lives on the locked row itself, so Postgres re-checks it against
+    # the latest committed version when the lock is acquired
+    return (
+        Lawyer.objects
+        .select_for_update(skip_locked=True)
+        .filter(is_available=True, is_on_shift=True, active_cases_count__lt=F('max_concurrent_cases'))
+        .annotate(
+            specialty_rank=Case(When(specialty=specialty, then=Value(0)), default=Value(1), output_field=IntegerField()),
+        )
+        .order_by('specialty_rank', 'active_cases_count', 'total_cases_handled', 'pk')
+        .first()
+    )
+
+
+def _lock_lawyer(lawyer):
+    lawyer = Lawyer.objects.select_for_update().get(pk=lawyer.pk)
+    return lawyer if lawyer.can_accept_new_case else None
+
+
+def assign_conversation(conversation, lawyer=None):
+    """
+    Assign a conversation in a single transaction.
+    Without `lawyer` the least-loaded eligible lawyer is chosen, preferring one whose
+    specialty matches procedure_requested. Returns the assigned lawyer, or None when
+    no lawyer (or not the given lawyer) can take the case. Live lawyer queues get a
+    case_assigned event after commit, and an auto-assigned lawyer gets a notification.
+    """
+    with transaction.atomic():
+        auto_assigned = lawyer is None
+        if auto_assigned:
+            lawyer = _lock_least_loaded_lawyer(conversation.procedure_requested)
+        else:
+            lawyer = _lock_lawyer(lawyer)
+        if lawyer is None:
+            return None
+
+        conversation.lawyer = lawyer
+        conversation.status = ConversationStatus.ACTIVE
+        conversation.save()
+        Message.create_system_message(conversation, f'El abogado {lawyer.name} ha tomado este caso.')
+        publish_case_assigned(conversation)
+        if auto_assigned:
+            # Delivered by the dispatch_notifications worker
+            notify(
+                lawyer.pk,
+                NotificationType.CASE_ASSIGNED,
+                title='Nuevo caso asignado',
+                message=f'Se te asigno el caso: {conversation.subject or "Sin asunto"}.',
+                conversation_id=conversation.pk,
+            )
+    return lawyer
@@ -0,0 +1,47 @@
+"""
+Counters for the lawyer dashboard.
+They come from a single aggregate query and are cached per lawyer for
+LAWYER_DASHBOARD_CACHE_TTL seconds; any change to one of the lawyer's cases
+(assign, close, reassign, delete) drops the snapshot, see update_case_counters.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from apps.conversations.models import Conversation, ConversationStatus
+from .models import ACTIVE_CASE_STATUSES
+
+
+def today_range():
+    """[start, end) of the current local day (TIME_ZONE), as aware datetimes an index can range over."""
+    start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+
+def _cache_key(lawyer_id):
+    return f'lawyer_dashboard:{lawyer_id}'
+
+
+def dashboard_stats(lawyer):
+    """Return {'active_cases', 'pending_cases', 'resolved_today'} for the lawyer."""
+    start, end = today_range()
+    stats = cache.get(_cache_key(lawyer.pk))
+    if stats is not None and stats['day'] == start.date():
+        return stats
+
+    closed_today = Q(status=ConversationStatus.CLOSED, closed_at__gte=start, closed_at__lt=end)
+    stats = Conversation.objects.filter(
+        Q(status__in=ACTIVE_CASE_STATUSES) | closed_today, lawyer=lawyer,
+    ).aggregate(
+        active_cases=Count('pk', filter=Q(status__in=ACTIVE_CASE_STATUSES)),
+        pending_cases=Count('pk', filter=Q(status=ConversationStatus.PENDING)),
+        resolved_today=Count('pk', filter=closed_today),
+    )
+    stats['day'] = start.date()
+    cache.set(_cache_key(lawyer.pk), stats, settings.LAWYER_DASHBOARD_CACHE_TTL)
+    return stats
+
+
+def invalidate_dashboard(*lawyer_ids):
+    cache.delete_many([_cache_key(lawyer_id) for lawyer_id in set(lawyer_ids) if lawyer_id is not None])
@@ -0,0 +1,44 @@
+"""Reconcile the denormalized case counters on Lawyer with the conversations table."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from apps.conversations.models import ConversationStatus
+from apps.lawyers.models import ACTIVE_CASE_STATUSES, Lawyer
+
+
+class Command(BaseCommand):
+    help = 'Recompute Lawyer.active_cases_count (and optionally total_cases_handled) and fix any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing.')
+        parser.add_argument(
+            '--totals', action='store_true',
+            help='Also reset total_cases_handled to the number of closed conversations.'
+        )
+
+    def handle(self, *args, **options):
+        fixed = 0
+        with transaction.atomic():
+            # Every counter update touches the lawyer row, so holding these locks freezes the counters
+            # while we count (FOR UPDATE cannot be combined with the aggregate below)
+            list(Lawyer.objects.select_for_update().values_list('pk', flat=True))
+            lawyers = Lawyer.objects.annotate(
+                open_cases=Count('conversations', filter=Q(conversations__status__in=ACTIVE_CASE_STATUSES)),
+                closed_cases=Count('conversations', filter=Q(conversations__status=ConversationStatus.CLOSED)),
+            ).order_by('pk')
+            for lawyer in lawyers:
+                updates = {}
+                if lawyer.active_cases_count != lawyer.open_cases:
+                    updates['active_cases_count'] = lawyer.open_cases
+                if options['totals'] and lawyer.total_cases_handled != lawyer.closed_cases:
+                    updates['total_cases_handled'] = lawyer.closed_cases
+                if not updates:
+                    continue
+                fixed += 1
+                changes = ', '.join(f'{field}: {getattr(lawyer, field)} -> {value}' for field, value in updates.items())
+                self.stdout.write(f'{lawyer.name} ({lawyer.pk}): {changes}')
+                if not options['dry_run']:
+                    Lawyer.objects.filter(pk=lawyer.pk).update(**updates)
+
+        verb = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'{fixed} lawyer(s) {verb}.'))
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:28
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_active_cases_count(apps, schema_editor):
+    Lawyer = apps.get_model('lawyers', 'Lawyer')
+    lawyers = Lawyer.objects.annotate(
+        open_cases=Count('conversations', filter=Q(conversations__status__in=['active', 'pending']))
+    )
+    for lawyer in lawyers:
+        Lawyer.objects.filter(pk=lawyer.pk).update(active_cases_count=lawyer.open_cases)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lawyers', '0001_initial'),
+        ('conversations', '0003_message_conversation_sent_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lawyer',
+            name='active_cases_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Casos Activos'),
+        ),
+        migrations.RunPython(backfill_active_cases_count, migrations.RunPython.noop),
+    ]
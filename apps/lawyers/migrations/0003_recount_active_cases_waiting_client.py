@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count, Q
+
+
+def recount_active_cases(apps, schema_editor):
+    """Cases waiting on the client now count against a lawyer's capacity too."""
+    Lawyer = apps.get_model('lawyers', 'Lawyer')
+    lawyers = Lawyer.objects.annotate(
+        open_cases=Count('conversations', filter=Q(conversations__status__in=['active', 'pending', 'waiting_client']))
+    )
+    for lawyer in lawyers:
+        if lawyer.active_cases_count != lawyer.open_cases:
+            Lawyer.objects.filter(pk=lawyer.pk).update(active_cases_count=lawyer.open_cases)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lawyers', '0002_lawyer_active_cases_count'),
+        ('conversations', '0009_conversation_platform_created_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_active_cases, migrations.RunPython.noop),
+    ]
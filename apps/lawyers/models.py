@@ -1,7 +1,12 @@
 """Lawyer model for AvocadoLegal."""
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from apps.conversations.models import ConversationStatus
+
+# Open cases: they count against max_concurrent_cases and are the dashboard's active cases
+ACTIVE_CASE_STATUSES = [ConversationStatus.ACTIVE, ConversationStatus.PENDING, ConversationStatus.WAITING_CLIENT]
 
 
 class LawyerSpecialty(models.TextChoices):
@@ -23,6 +28,7 @@ class Lawyer(models.Model):
     is_on_shift = models.BooleanField(default=False, verbose_name='En Turno')
     max_concurrent_cases = models.PositiveIntegerField(default=5, verbose_name='Max Casos Simultaneos')
     total_cases_handled = models.PositiveIntegerField(default=0, verbose_name='Casos Atendidos')
+    active_cases_count = models.PositiveIntegerField(default=0, verbose_name='Casos Activos')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -35,15 +41,31 @@ class Lawyer(models.Model):
         status = 'ON' if self.is_available else 'OFF'
         return f'[{status}] {self.name} - {self.get_specialty_display()}'
 
-    @property
-    def active_cases_count(self):
-        return self.conversations.filter(status__in=['active', 'pending']).count()
-
     @property
     def can_accept_new_case(self):
         return self.is_available and self.is_on_shift and self.active_cases_count < self.max_concurrent_cases
 
 
+def update_case_counters(old_lawyer_id, old_status, new_lawyer_id, new_status):
+    """
+    Apply a conversation's (lawyer, status) transition to the denormalized
+    Lawyer counters with F() expressions and drop the dashboard snapshots of both
+    lawyers once it commits. Call inside the transaction that writes the conversation.
+    """
+    from .dashboard import invalidate_dashboard
+    transaction.on_commit(lambda: invalidate_dashboard(old_lawyer_id, new_lawyer_id))
+    was_open = old_lawyer_id is not None and old_status in ACTIVE_CASE_STATUSES
+    is_open = new_lawyer_id is not None and new_status in ACTIVE_CASE_STATUSES
+    if was_open and (not is_open or old_lawyer_id != new_lawyer_id):
+        Lawyer.objects.filter(pk=old_lawyer_id, active_cases_count__gt=0).update(
+            active_cases_count=F('active_cases_count') - 1
+        )
+    if is_open and (not was_open or old_lawyer_id != new_lawyer_id):
+        Lawyer.objects.filter(pk=new_lawyer_id).update(active_cases_count=F('active_cases_count') + 1)
+    if new_lawyer_id is not None and new_status == ConversationStatus.CLOSED and old_status != ConversationStatus.CLOSED:
+        Lawyer.objects.filter(pk=new_lawyer_id).update(total_cases_handled=F('total_cases_handled') + 1)
+
+
 class LawyerSchedule(models.Model):
     """Lawyer schedule/shift."""
     DAYS_OF_WEEK = [
@@ -1,3 +1,316 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from apps.conversations.models import Conversation, ConversationStatus, Message, SenderType
+from apps.loans.models import Loan
+from apps.platforms.models import Client, Platform
+from config.testing import QueryScalingMixin
+from .admin import LawyerAdmin
+from .assignment import assign_conversation, specialty_for_procedure
+from .dashboard import dashboard_stats, today_range
+from .models import Lawyer, LawyerSpecialty
 
-# Create your tests here.
+
+def create_lawyer(username, **kwargs):
+    user = User.objects.create_user(username=username, password='secret')
+    defaults = {'name': username, 'email': f'{username}@jcj.do', 'is_available': True, 'is_on_shift': True}
+    defaults.update(kwargs)
+    return Lawyer.objects.create(user=user, **defaults)
+
+
+class AssignmentEngineTests(TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+
+    def new_conversation(self, **kwargs):
+        return Conversation.objects.create(platform=self.platform, **kwargs)
+
+    def test_picks_least_loaded_lawyer(self):
+        busy = create_lawyer('busy')
+        idle = create_lawyer('idle')
+        self.new_conversation(lawyer=busy, status=ConversationStatus.ACTIVE)
+        self.assertEqual(assign_conversation(self.new_conversation()), idle)
+
+    def test_prefers_matching_specialty(self):
+        create_lawyer('general')
+        embargos = create_lawyer('embargos', specialty=LawyerSpecialty.EMBARGOS)
+        self.new_conversation(lawyer=embargos, status=ConversationStatus.ACTIVE)
+        conversation = self.new_conversation(procedure_requested='Embargo de vehiculo')
+        self.assertEqual(assign_conversation(conversation), embargos)
+
+    def test_full_or_off_shift_lawyers_are_skipped(self):
+        create_lawyer('off', is_on_shift=False)
+        full = create_lawyer('full', max_concurrent_cases=1)
+        self.new_conversation(lawyer=full, status=ConversationStatus.PENDING)
+        conversation = self.new_conversation()
+        self.assertIsNone(assign_conversation(conversation))
+        conversation.refresh_from_db()
+        self.assertIsNone(conversation.lawyer)
+        self.assertEqual(conversation.status, ConversationStatus.PENDING)
+
+    def test_explicit_lawyer_respects_capacity(self):
+        lawyer = create_lawyer('solo', max_concurrent_cases=1)
+        self.assertEqual(assign_conversation(self.new_conversation(), lawyer=lawyer), lawyer)
+        self.assertIsNone(assign_conversation(self.new_conversation(), lawyer=lawyer))
+
+    def test_specialty_for_procedure(self):
+        self.assertEqual(specialty_for_procedure('Intimacion de pago'), LawyerSpecialty.INTIMACIONES)
+        self.assertIsNone(specialty_for_procedure(''))
+
+
+class CaseCounterTests(TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.lawyer = create_lawyer('ana')
+        self.other = create_lawyer('luis')
+
+    def counters(self, lawyer):
+        lawyer.refresh_from_db()
+        return lawyer.active_cases_count, lawyer.total_cases_handled
+
+    def test_assign_close_and_reassign(self):
+        conversation = Conversation.objects.create(platform=self.platform)
+        assign_conversation(conversation, lawyer=self.lawyer)
+        self.assertEqual(self.counters(self.lawyer), (1, 0))
+
+        conversation.lawyer = self.other
+        conversation.save()
+        self.assertEqual(self.counters(self.lawyer), (0, 0))
+        self.assertEqual(self.counters(self.other), (1, 0))
+
+        conversation.close_case('Resuelto')
+        conversation.close_case('Resuelto otra vez')
+        self.assertEqual(self.counters(self.other), (0, 1))
+
+    def test_waiting_on_the_client_still_counts(self):
+        conversation = Conversation.objects.create(platform=self.platform)
+        assign_conversation(conversation, lawyer=self.lawyer)
+        conversation.status = ConversationStatus.WAITING_CLIENT
+        conversation.save()
+        self.assertEqual(self.counters(self.lawyer), (1, 0))
+        conversation.close_case()
+        self.assertEqual(self.counters(self.lawyer), (0, 1))
+
+    def test_stale_instances_do_not_double_count(self):
+        conversation = Conversation.objects.create(platform=self.platform, lawyer=self.lawyer, status=ConversationStatus.ACTIVE)
+        stale = Conversation.objects.get(pk=conversation.pk)
+        conversation.close_case()
+        stale.close_case()
+        self.assertEqual(self.counters(self.lawyer), (0, 1))
+
+    def test_delete_releases_case(self):
+        Conversation.objects.create(platform=self.platform, lawyer=self.lawyer, status=ConversationStatus.PENDING)
+        self.platform.delete()
+        self.assertEqual(self.counters(self.lawyer), (0, 0))
+
+    def test_reconcile_command_fixes_drift(self):
+        Conversation.objects.create(platform=self.platform, lawyer=self.lawyer, status=ConversationStatus.ACTIVE)
+        Lawyer.objects.filter(pk=self.lawyer.pk).update(active_cases_count=7)
+        call_command('reconcile_case_counters', '--dry-run', stdout=StringIO())
+        self.assertEqual(self.counters(self.lawyer), (7, 0))
+        call_command('reconcile_case_counters', stdout=StringIO())
+        self.assertEqual(self.counters(self.lawyer), (1, 0))
+
+    def test_admin_edit_keeps_concurrent_counter_updates(self):
+        admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(admin)
+        url = f'/admin/lawyers/lawyer/{self.lawyer.pk}/change/'
+        context = self.client.get(url).context
+        form, inline = context['adminform'].form, context['inline_admin_formsets'][0].formset
+        data = {name: value for name, value in form.initial.items() if name in form.fields and value is not None}
+        data.update({f'{inline.prefix}-{key}': value for key, value in inline.management_form.initial.items()})
+        data.update({'name': 'Ana Maria', 'is_available': 'on', 'is_on_shift': 'on'})
+
+        save_form = LawyerAdmin.save_form
+
+        def save_form_while_cases_move(admin, request, form, change):
+            # A case is assigned and another closed after the admin loaded the lawyer
+            assign_conversation(Conversation.objects.create(platform=self.platform), lawyer=self.lawyer)
+            Lawyer.objects.filter(pk=self.lawyer.pk).update(total_cases_handled=4)
+            return save_form(admin, request, form, change)
+
+        with mock.patch.object(LawyerAdmin, 'save_form', save_form_while_cases_move):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.counters(self.lawyer), (1, 4))
+        self.assertEqual(self.lawyer.name, 'Ana Maria')
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.lawyer = create_lawyer('ana')
+        start, _ = today_range()
+        for status, closed_at in [
+            (ConversationStatus.ACTIVE, None),
+            (ConversationStatus.PENDING, None),
+            (ConversationStatus.CLOSED, start + timedelta(minutes=1)),
+            (ConversationStatus.CLOSED, start - timedelta(minutes=1)),
+        ]:
+            Conversation.objects.create(platform=self.platform, lawyer=self.lawyer, status=status, closed_at=closed_at)
+
+    def counts(self):
+        stats = dashboard_stats(self.lawyer)
+        return stats['active_cases'], stats['pending_cases'], stats['resolved_today']
+
+    def test_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counts(), (2, 1, 1))
+        with self.assertNumQueries(0):
+            self.counts()
+
+    def test_case_changes_drop_the_snapshot(self):
+        self.counts()
+        conversation = Conversation.objects.filter(status=ConversationStatus.ACTIVE).get()
+        with self.captureOnCommitCallbacks(execute=True):
+            conversation.close_case()
+        self.assertEqual(self.counts(), (1, 1, 2))
+
+    def test_active_cases_match_the_capacity_counter(self):
+        Conversation.objects.create(platform=self.platform, lawyer=self.lawyer, status=ConversationStatus.WAITING_CLIENT)
+        self.lawyer.refresh_from_db()
+        self.assertEqual(self.counts()[0], self.lawyer.active_cases_count)
+
+    def test_dashboard_page(self):
+        self.client.force_login(self.lawyer.user)
+        response = self.client.get('/lawyers/')
+        self.assertEqual((response.context['active_cases'], response.context['resolved_today']), (2, 1))
+
+
+class PanelQueryScalingTests(QueryScalingMixin, TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.lawyer = create_lawyer('ana', max_concurrent_cases=1000)
+        self.client.force_login(self.lawyer.user)
+
+    def new_cases(self, size, **kwargs):
+        clients = Client.objects.bulk_create([
+            Client(platform=self.platform, name=f'Cliente {i}', cedula=f'{Client.objects.count() + i:011d}')
+            for i in range(size)
+        ])
+        loans = Loan.objects.bulk_create([Loan(client=client, amount=1000, balance=500) for client in clients])
+        return Conversation.objects.bulk_create([
+            Conversation(platform=self.platform, client=client, loan=loan, **kwargs) for client, loan in zip(clients, loans)
+        ])
+
+    def cases(self, size):
+        """`size` active cases of the lawyer with a message each, plus `size` waiting in the queue; returns one of those."""
+        cache.clear()  # Every measured page rebuilds the dashboard snapshot
+        active = self.new_cases(size, lawyer=self.lawyer, status=ConversationStatus.ACTIVE)
+        Message.objects.bulk_create([
+            Message(conversation=case, sender_type=SenderType.PLATFORM_USER, content='Hola') for case in active
+        ])
+        return self.new_cases(size)[0]
+
+    def case_with_messages(self, size):
+        cache.clear()
+        case = self.new_cases(1, lawyer=self.lawyer, status=ConversationStatus.ACTIVE)[0]
+        Message.objects.bulk_create([
+            Message(conversation=case, sender_type=SenderType.PLATFORM_USER, content=f'Mensaje {i}') for i in range(size)
+        ])
+        return case
+
+    def test_panel_views(self):
+        actions = {
+            'dashboard': (self.cases, lambda _: self.client.get('/lawyers/')),
+            'conversation_list': (self.cases, lambda _: self.client.get('/lawyers/conversations/')),
+            'conversation_list_all': (self.cases, lambda _: self.client.get('/lawyers/conversations/?status=all')),
+            'queue': (self.cases, lambda _: self.client.get('/lawyers/queue/')),
+            'search': (self.cases, lambda _: self.client.get('/lawyers/search/?q=Hola')),
+            'assign_case': (self.cases, lambda case: self.client.post(f'/lawyers/assign/{case.pk}/')),
+            'toggle_availability': (self.cases, lambda _: self.client.post('/lawyers/toggle-availability/')),
+            'toggle_shift': (self.cases, lambda _: self.client.post('/lawyers/toggle-shift/')),
+            'conversation_detail': (self.case_with_messages, lambda case: self.client.get(f'/lawyers/conversations/{case.pk}/')),
+            'send_message': (self.case_with_messages, lambda case: self.client.post(
+                f'/lawyers/send-message/{case.pk}/', {'content': 'Buenas tardes'},
+            )),
+            'close_case': (self.case_with_messages, lambda case: self.client.post(
+                f'/lawyers/close-case/{case.pk}/', {'notes': 'Resuelto'},
+            )),
+        }
+        for action, (seed, request) in actions.items():
+            with self.subTest(action):
+                self.assertConstantQueries(seed, request)
+
+
+class QueuePageTests(TestCase):
+    def setUp(self):
+        platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.cases = Conversation.objects.bulk_create([Conversation(platform=platform) for _ in range(5)])
+        self.cases.sort(key=lambda case: (case.created_at, case.id), reverse=True)
+        self.lawyer = create_lawyer('ana')
+        self.client.force_login(self.lawyer.user)
+
+    @mock.patch('apps.lawyers.views.QUEUE_SNAPSHOT_LIMIT', 2)
+    def test_pages_follow_the_cursor_past_taken_cases(self):
+        response = self.client.get('/lawyers/queue/')
+        self.assertEqual(response.context['cases'], self.cases[:2])
+        self.assertEqual(response.context['next_after'], self.cases[1].id)
+        self.assertContains(response, '2+')
+
+        assign_conversation(self.cases[1], lawyer=self.lawyer)
+        response = self.client.get(f'/lawyers/queue/?after={self.cases[1].id}')
+        self.assertEqual(response.context['cases'], self.cases[2:4])
+        response = self.client.get(f'/lawyers/queue/?after={self.cases[3].id}')
+        self.assertEqual((response.context['cases'], response.context['next_after']), (self.cases[4:], None))
+
+    def test_unknown_cursor(self):
+        self.assertEqual(self.client.get('/lawyers/queue/?after=nope').status_code, 404)
+
+
+class PanelSearchTests(TestCase):
+    def test_searches_only_the_lawyers_cases(self):
+        platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        ana, luis = create_lawyer('ana'), create_lawyer('luis')
+        own = Conversation.objects.create(platform=platform, lawyer=ana, subject='Embargo de cuenta')
+        Conversation.objects.create(platform=platform, lawyer=luis, subject='Embargo de casa')
+        self.client.force_login(ana.user)
+        response = self.client.get('/lawyers/search/', {'q': 'embargo'})
+        self.assertEqual(list(response.context['conversations']), [own])
+        self.assertContains(response, 'Embargo de cuenta')
+        self.assertFalse(self.client.get('/lawyers/search/', {'q': 'e'}).context['conversations'])
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class ConcurrentAssignmentTests(TransactionTestCase):
+    """Concurrent conversation creation must never exceed a lawyer's capacity."""
+
+    def test_capacity_never_exceeded(self):
+        platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        lawyers = [create_lawyer(f'lawyer{i}', max_concurrent_cases=3) for i in range(3)]
+        workers = 8
+        per_worker = 5
+        barrier = threading.Barrier(workers)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(per_worker):
+                    assign_conversation(Conversation.objects.create(platform=platform))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for lawyer in lawyers:
+            lawyer.refresh_from_db()
+            self.assertLessEqual(lawyer.active_cases_count, lawyer.max_concurrent_cases)
+            self.assertEqual(lawyer.active_cases_count, lawyer.conversations.count())
+        assigned = Conversation.objects.filter(lawyer__isnull=False).count()
+        self.assertLessEqual(assigned, sum(lawyer.max_concurrent_cases for lawyer in lawyers))
+        self.assertEqual(Conversation.objects.count(), workers * per_worker)
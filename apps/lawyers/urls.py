@@ -10,6 +10,7 @@ urlpatterns = [
     path('', views.DashboardView.as_view(), name='dashboard'),
     path('conversations/', views.ConversationListView.as_view(), name='conversation_list'),
     path('conversations/<uuid:pk>/', views.ConversationDetailView.as_view(), name='conversation_detail'),
+    path('search/', views.SearchView.as_view(), name='search'),
     path('queue/', views.QueueView.as_view(), name='queue'),
     path('assign/<uuid:pk>/', views.assign_case, name='assign_case'),
     path('send-message/<uuid:pk>/', views.send_message, name='send_message'),
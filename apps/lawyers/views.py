@@ -4,11 +4,16 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth import authenticate, login, logout
 from django.views.generic import ListView, DetailView, TemplateView
-from django.http import JsonResponse, HttpResponseForbidden
-from django.utils import timezone
+from django.core.exceptions import ValidationError
+from django.http import Http404, JsonResponse, HttpResponseForbidden
+from django.db import transaction
 from django.db.models import Count, Q
-from .models import Lawyer, LawyerSchedule
-from apps.conversations.models import Conversation, Message, ConversationStatus, SenderType
+from .assignment import assign_conversation
+from .dashboard import dashboard_stats
+from .models import ACTIVE_CASE_STATUSES, Lawyer, LawyerSchedule
+from apps.conversations.models import Conversation, Message, ConversationStatus, SenderType, unread_count_annotation
+from apps.conversations.realtime import QUEUE_SNAPSHOT_LIMIT, broadcast_message, broadcast_read
+from apps.conversations.search import MIN_QUERY_LENGTH, search_conversations
 
 
 def login_view(request):
@@ -68,27 +73,15 @@ class DashboardView(LawyerRequiredMixin, TemplateView):
         lawyer = self.get_lawyer()
         
         context['lawyer'] = lawyer
-        context['active_cases'] = Conversation.objects.filter(
-            lawyer=lawyer, 
-            status__in=[ConversationStatus.ACTIVE, ConversationStatus.PENDING, ConversationStatus.WAITING_CLIENT]
-        ).count()
-        context['pending_cases'] = Conversation.objects.filter(
-            lawyer=lawyer, 
-            status=ConversationStatus.PENDING
-        ).count()
-        context['resolved_today'] = Conversation.objects.filter(
-            lawyer=lawyer,
-            status=ConversationStatus.CLOSED,
-            closed_at__date=timezone.now().date()
-        ).count()
+        context.update(dashboard_stats(lawyer))
         context['total_resolved'] = lawyer.total_cases_handled
         context['recent_conversations'] = Conversation.objects.filter(
             lawyer=lawyer
-        ).order_by('-updated_at')[:5]
+        ).select_related('client', 'platform').order_by('-updated_at')[:5]
         context['unassigned_cases'] = Conversation.objects.filter(
             lawyer__isnull=True,
             status=ConversationStatus.PENDING
-        ).order_by('-created_at')[:10]
+        ).select_related('client', 'platform').order_by('-created_at')[:10]
         
         return context
 
@@ -104,14 +97,12 @@ class ConversationListView(LawyerRequiredMixin, ListView):
         status = self.request.GET.get('status', 'active')
         qs = Conversation.objects.filter(lawyer=lawyer)
         if status == 'active':
-            qs = qs.filter(status__in=[
-                ConversationStatus.ACTIVE, 
-                ConversationStatus.PENDING,
-                ConversationStatus.WAITING_CLIENT
-            ])
+            qs = qs.filter(status__in=ACTIVE_CASE_STATUSES)
         elif status == 'closed':
             qs = qs.filter(status=ConversationStatus.CLOSED)
-        return qs.order_by('-updated_at')
+        return qs.select_related('client', 'platform', 'loan').annotate(
+            unread_count=unread_count_annotation(SenderType.LAWYER)
+        ).order_by('-updated_at')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -132,22 +123,69 @@ class ConversationDetailView(LawyerRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         context['messages'] = self.object.messages.all().order_by('sent_at')
         context['lawyer'] = self.get_lawyer()
+        # Opening the conversation reads it up to the latest message
+        previous = self.object.lawyer_read_at
+        read_at = self.object.mark_read(SenderType.LAWYER)
+        if read_at is not None and read_at != previous:
+            broadcast_read(self.object.pk, SenderType.LAWYER, read_at)
+        return context
+
+
+class SearchView(LawyerRequiredMixin, ListView):
+    """Ranked search over the lawyer's cases: message content, subject, client name and cedula."""
+    template_name = 'lawyers/search.html'
+    context_object_name = 'conversations'
+    paginate_by = 20
+
+    def get_queryset(self):
+        query = self.request.GET.get('q', '').strip()
+        if len(query) < MIN_QUERY_LENGTH:
+            return Conversation.objects.none()
+        qs = Conversation.objects.filter(lawyer=self.get_lawyer()).select_related('client', 'platform')
+        return search_conversations(qs, query)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '').strip()
+        context['min_query_length'] = MIN_QUERY_LENGTH
+        context['lawyer'] = self.get_lawyer()
         return context
 
 
 class QueueView(LawyerRequiredMixin, ListView):
-    """View unassigned cases queue."""
+    """
+    View unassigned cases queue, newest first, QUEUE_SNAPSHOT_LIMIT cases per page.
+    `?after=<case id>` continues below that case (keyset, so cases taken meanwhile
+    do not shift the following pages).
+    """
     template_name = 'lawyers/queue.html'
     context_object_name = 'cases'
     
     def get_queryset(self):
-        return Conversation.objects.filter(
+        queryset = Conversation.objects.filter(
             lawyer__isnull=True,
             status=ConversationStatus.PENDING
-        ).order_by('-created_at')
+        ).select_related('client', 'platform', 'loan').order_by('-created_at', '-id')
+        after = self.request.GET.get('after')
+        if after:
+            try:
+                anchor = Conversation.objects.filter(pk=after).values('created_at', 'id').first()
+            except ValidationError:
+                anchor = None
+            if anchor is None:
+                raise Http404('Unknown queue cursor')
+            queryset = queryset.filter(
+                Q(created_at__lt=anchor['created_at']) | Q(created_at=anchor['created_at'], id__lt=anchor['id'])
+            )
+        # One row past the page tells whether another page follows
+        return queryset[:QUEUE_SNAPSHOT_LIMIT + 1]
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        cases = list(context['cases'])
+        context['cases'] = cases[:QUEUE_SNAPSHOT_LIMIT]
+        context['next_after'] = cases[QUEUE_SNAPSHOT_LIMIT - 1].id if len(cases) > QUEUE_SNAPSHOT_LIMIT else None
+        context['is_first_page'] = not self.request.GET.get('after')
         context['lawyer'] = self.get_lawyer()
         return context
 
@@ -159,16 +197,11 @@ def assign_case(request, pk):
         return JsonResponse({'error': 'Not a lawyer'}, status=403)
     
     lawyer = request.user.lawyer_profile
-    conversation = get_object_or_404(Conversation, pk=pk, lawyer__isnull=True)
-    
-    if not lawyer.can_accept_new_case:
-        return JsonResponse({'error': 'Cannot accept more cases'}, status=400)
-    
-    conversation.lawyer = lawyer
-    conversation.status = ConversationStatus.ACTIVE
-    conversation.save()
-    
-    Message.create_system_message(conversation, f'El abogado {lawyer.name} ha tomado este caso.')
+    with transaction.atomic():
+        # Lock the case so two lawyers cannot take it at the same time
+        conversation = get_object_or_404(Conversation.objects.select_for_update(), pk=pk, lawyer__isnull=True)
+        if not assign_conversation(conversation, lawyer=lawyer):
+            return JsonResponse({'error': 'Cannot accept more cases'}, status=400)
     
     return JsonResponse({'success': True, 'conversation_id': str(conversation.id)})
 
@@ -196,6 +229,7 @@ def send_message(request, pk):
     )
     conversation.status = ConversationStatus.WAITING_CLIENT
     conversation.save()
+    broadcast_message(message)
     
     return JsonResponse({
         'success': True,
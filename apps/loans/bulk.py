@@ -0,0 +1,110 @@
+"""
+Bulk loan upsert keyed by (client, external_id).
+Rows are validated and written in chunks, one transaction per chunk. Each row
+carries the loan's full data: fields left out take their defaults, as on create.
+"""
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+from apps.platforms.ingest import bulk_summary, chunked, count_results
+from apps.platforms.models import Client
+from .models import Loan
+from .serializers import LoanBulkRowSerializer
+
+DEFAULT_CHUNK_SIZE = 1000
+UPDATE_FIELDS = [
+    'amount', 'balance', 'currency', 'status', 'days_overdue',
+    'payment_history', 'full_data', 'loan_date', 'due_date', 'updated_at',
+]
+
+
+def upsert_loans(platform, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Upsert (row_number, data, error) tuples for a platform.
+    Returns a bulk_summary() of the rows.
+    """
+    summary = bulk_summary()
+    for chunk in chunked(rows, chunk_size):
+        count_results(summary, _upsert_chunk(platform, chunk))
+    return summary
+
+
+def _upsert_chunk(platform, chunk):
+    results = {}
+    valid = []
+    # One serializer validates every row, as ListSerializer does with its child,
+    # so the field set is built once per chunk instead of once per row
+    serializer = LoanBulkRowSerializer()
+    for row_number, data, error in chunk:
+        if error:
+            results[row_number] = {'row': row_number, 'status': 'error', 'errors': {'non_field_errors': [error]}}
+            continue
+        try:
+            valid.append((row_number, serializer.run_validation(data)))
+        except ValidationError as exc:
+            results[row_number] = {
+                'row': row_number, 'status': 'error',
+                'external_id': data.get('external_id'), 'errors': exc.detail,
+            }
+
+    # Resolve every client of the chunk in one query, scoped to the platform
+    client_ids = {values['client'] for _, values in valid}
+    known_clients = set(Client.objects.filter(platform=platform, pk__in=client_ids).values_list('pk', flat=True))
+
+    # Last row wins when the same loan appears twice in a chunk
+    latest = {}
+    for row_number, values in valid:
+        if values['client'] not in known_clients:
+            results[row_number] = {
+                'row': row_number, 'status': 'error', 'external_id': values['external_id'],
+                'errors': {'client': ['Client not found for this platform.']},
+            }
+            continue
+        key = (values['client'], values['external_id'])
+        if key in latest:
+            superseded = latest[key][0]
+            results[superseded] = {
+                'row': superseded, 'status': 'skipped', 'external_id': values['external_id'],
+                'errors': {'non_field_errors': [f'Superseded by row {row_number}.']},
+            }
+        latest[key] = (row_number, values)
+
+    if latest:
+        try:
+            results.update(_write(latest))
+        except IntegrityError:
+            # A concurrent sync inserted one of these loans; the retry sees it as an update
+            results.update(_write(latest))
+    return [results[row_number] for row_number, _, _ in chunk]
+
+
+def _write(latest):
+    """
+    Lock the chunk's existing loans, then write the whole chunk with one
+    INSERT ... ON CONFLICT (id) DO UPDATE: existing loans keep their primary key,
+    so they conflict and are updated, while new loans are inserted.
+    """
+    results = {}
+    with transaction.atomic():
+        existing = {
+            (client_id, external_id): pk
+            for pk, client_id, external_id in Loan.objects.select_for_update().filter(
+                client_id__in={client_id for client_id, _ in latest},
+                external_id__in={external_id for _, external_id in latest},
+            ).values_list('pk', 'client_id', 'external_id')
+            if (client_id, external_id) in latest
+        }
+        loans = []
+        for key, (row_number, values) in latest.items():
+            fields = {name: value for name, value in values.items() if name != 'client'}
+            if key in existing:
+                loan = Loan(pk=existing[key], client_id=key[0], **fields)
+                status = 'updated'
+            else:
+                loan = Loan(client_id=key[0], **fields)
+                status = 'created'
+            loans.append(loan)
+            results[row_number] = {
+                'row': row_number, 'status': status, 'id': str(loan.pk), 'external_id': key[1],
+            }
+        Loan.objects.bulk_create(loans, update_conflicts=True, unique_fields=['id'], update_fields=UPDATE_FIELDS)
+    return results
@@ -0,0 +1,83 @@
+"""Compare per-row loan creation with the bulk upsert endpoint against the configured database."""
+import json
+import random
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+from apps.loans.models import LoanStatus
+from apps.loans.views import LoanViewSet
+from apps.platforms.models import Client, Platform
+
+
+class Command(BaseCommand):
+    help = 'Benchmark POST /api/v1/loans/ one row at a time against POST /api/v1/loans/bulk/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help='Loans to ingest per path.')
+        parser.add_argument('--clients', type=int, default=50, help='Clients the loans are spread over.')
+        parser.add_argument('--ndjson', action='store_true', help='Send the bulk body as NDJSON instead of a JSON array.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark platform and its data.')
+
+    def handle(self, *args, **options):
+        platform = Platform.objects.create(name=f'benchmark-{uuid.uuid4().hex[:8]}', domain='benchmark.local')
+        clients = Client.objects.bulk_create([
+            Client(platform=platform, name=f'Cliente {i}', cedula=f'000-{i:07d}-0') for i in range(options['clients'])
+        ])
+        self.factory = APIRequestFactory()
+        self.auth = {'HTTP_AUTHORIZATION': f'Api-Key {platform.api_key}'}
+        try:
+            per_row = self.run_per_row(self.make_rows('row', clients, options['rows']))
+            bulk_rows = self.make_rows('bulk', clients, options['rows'])
+            bulk_create = self.run_bulk(bulk_rows, options['ndjson'])
+            bulk_update = self.run_bulk(bulk_rows, options['ndjson'])
+        finally:
+            if not options['keep']:
+                platform.delete()
+
+        self.stdout.write(f"{'path':<22}{'rows':>8}{'seconds':>10}{'rows/s':>12}")
+        for label, (rows, seconds) in [
+            ('per-row create', per_row), ('bulk create', bulk_create), ('bulk update', bulk_update),
+        ]:
+            self.stdout.write(f'{label:<22}{rows:>8}{seconds:>10.2f}{rows / seconds:>12.0f}')
+        self.stdout.write(self.style.SUCCESS(f'Bulk create speedup: {per_row[1] / bulk_create[1]:.1f}x'))
+
+    def make_rows(self, prefix, clients, count):
+        rng = random.Random(count)
+        return [
+            {
+                'client': str(clients[i % len(clients)].pk),
+                'external_id': f'{prefix}-{i}',
+                'amount': '50000.00',
+                'balance': f'{rng.randint(0, 50000)}.00',
+                'status': rng.choice(LoanStatus.values),
+                'days_overdue': rng.randint(0, 180),
+                'payment_history': [{'date': '2026-01-01', 'amount': 2500}],
+            }
+            for i in range(count)
+        ]
+
+    def run_per_row(self, rows):
+        view = LoanViewSet.as_view({'post': 'create'})
+        start = time.perf_counter()
+        for row in rows:
+            response = view(self.factory.post('/api/v1/loans/', row, format='json', **self.auth))
+            if response.status_code != 201:
+                raise RuntimeError(f'Per-row create failed: {response.data}')
+        return len(rows), time.perf_counter() - start
+
+    def run_bulk(self, rows, ndjson):
+        view = LoanViewSet.as_view({'post': 'bulk'})
+        if ndjson:
+            request = self.factory.generic(
+                'POST', '/api/v1/loans/bulk/', '\n'.join(json.dumps(row) for row in rows),
+                content_type='application/x-ndjson', **self.auth
+            )
+        else:
+            request = self.factory.post('/api/v1/loans/bulk/', rows, format='json', **self.auth)
+        start = time.perf_counter()
+        response = view(request)
+        elapsed = time.perf_counter() - start
+        if response.data['error']:
+            raise RuntimeError(f"Bulk upsert reported {response.data['error']} errors")
+        return len(rows), elapsed
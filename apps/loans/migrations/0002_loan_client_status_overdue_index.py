@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['client', 'status', '-days_overdue'], name='loan_client_status_overdue_idx'),
+        ),
+    ]
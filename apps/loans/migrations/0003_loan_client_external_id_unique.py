@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:34
+
+from collections import defaultdict
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def merge_duplicate_loans(apps, schema_editor):
+    """
+    Keep one loan per (client, external_id) so the constraint below can be added: the
+    most recently updated copy, which holds the latest synced balance, survives and the
+    conversations about the others move to it.
+    """
+    Loan = apps.get_model('loans', 'Loan')
+    Conversation = apps.get_model('conversations', 'Conversation')
+    groups = defaultdict(list)
+    rows = Loan.objects.exclude(external_id='').order_by('-updated_at', '-pk').values_list('pk', 'client_id', 'external_id')
+    for pk, client_id, external_id in rows.iterator(chunk_size=BATCH_SIZE):
+        groups[(client_id, external_id)].append(pk)
+    for survivor_id, *duplicate_ids in groups.values():
+        if duplicate_ids:
+            Conversation.objects.filter(loan_id__in=duplicate_ids).update(loan_id=survivor_id)
+            Loan.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_loan_client_status_overdue_index'),
+        # Merging clients moves their loans, which can make new duplicates
+        ('platforms', '0003_client_unique_identifiers'),
+        ('conversations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_loans, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='loan',
+            constraint=models.UniqueConstraint(condition=models.Q(('external_id', ''), _negated=True), fields=('client', 'external_id'), name='loan_client_external_id_uniq'),
+        ),
+    ]
@@ -35,6 +35,17 @@ class Loan(models.Model):
         verbose_name = 'Prestamo'
         verbose_name_plural = 'Prestamos'
         ordering = ['-days_overdue', '-created_at']
+        indexes = [
+            models.Index(fields=['client', 'status', '-days_overdue'], name='loan_client_status_overdue_idx'),
+        ]
+        constraints = [
+            # Upsert key for bulk syncs; loans without an external id are not deduplicated
+            models.UniqueConstraint(
+                fields=['client', 'external_id'],
+                condition=~models.Q(external_id=''),
+                name='loan_client_external_id_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.client.name} - ${self.amount} ({self.status})'
@@ -27,4 +27,18 @@ class LoanCreateSerializer(serializers.ModelSerializer):
             'external_id', 'client', 'amount', 'balance', 'currency',
             'status', 'days_overdue', 'loan_date', 'due_date',
             'payment_history', 'full_data'
-        ]
\ No newline at end of file
+        ]
+
+
+class LoanBulkRowSerializer(serializers.ModelSerializer):
+    """
+    Validates one row of a bulk loan upsert without touching the database.
+    The client is resolved per batch and uniqueness is handled by the upsert itself.
+    """
+    client = serializers.UUIDField()
+    external_id = serializers.CharField(max_length=255)
+
+    class Meta:
+        model = Loan
+        fields = LoanCreateSerializer.Meta.fields
+        validators = []
\ No newline at end of file
@@ -1,3 +1,194 @@
+import csv
+import io
+import json
+import uuid
+from importlib import import_module
+from unittest import skipUnless
+from django.apps import apps
+from django.db import connection
 from django.test import TestCase
+from rest_framework.test import APIClient
+from apps.conversations.models import Conversation
+from apps.platforms.cache import platform_cache
+from apps.platforms.models import Client, Platform
+from config.testing import QueryScalingMixin
+from .models import Loan
 
-# Create your tests here.
+
+class BulkLoanUpsertTests(TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.client_obj = Client.objects.create(platform=self.platform, name='Juan Perez', cedula='001-0000001-1')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+
+    def row(self, external_id, **kwargs):
+        data = {'client': str(self.client_obj.pk), 'external_id': external_id, 'amount': '1000.00', 'balance': '500.00'}
+        data.update(kwargs)
+        return data
+
+    def test_creates_updates_and_reports_failed_rows(self):
+        existing = Loan.objects.create(client=self.client_obj, external_id='L1', amount=1000, balance=900)
+        foreign = Client.objects.create(
+            platform=Platform.objects.create(name='Otra', domain='otra.do'), name='Ajeno', cedula='002-0000002-2'
+        )
+        rows = [
+            self.row('L1', balance='100.00'),
+            self.row('L2'),
+            self.row('L2', balance='250.00'),
+            self.row('L3', client=str(foreign.pk)),
+            {'client': str(self.client_obj.pk)},
+        ]
+        response = self.api.post('/api/v1/loans/bulk/', rows, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [response.data[status] for status in ('total', 'created', 'updated', 'skipped', 'error')], [5, 1, 1, 1, 2],
+        )
+        self.assertEqual(
+            [(result['row'], result['status']) for result in response.data['results']],
+            [(2, 'skipped'), (4, 'error'), (5, 'error')],
+        )
+        existing.refresh_from_db()
+        self.assertEqual(existing.balance, 100)
+        self.assertEqual(Loan.objects.get(external_id='L2').balance, 250)
+        self.assertFalse(Loan.objects.filter(external_id='L3').exists())
+
+    def test_ndjson_body(self):
+        body = '\n'.join([json.dumps(self.row('L1')), '{not json', json.dumps(self.row('L2'))])
+        response = self.api.generic(
+            'POST', '/api/v1/loans/bulk/', body, content_type='application/x-ndjson'
+        )
+        self.assertEqual((response.data['created'], response.data['error']), (2, 1))
+        self.assertEqual([result['row'] for result in response.data['results']], [2])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs transactional DDL to drop the constraint inside the test')
+class LoanMergeMigrationTests(TestCase):
+    """The data step loans 0003 runs before adding the (client, external_id) constraint."""
+    migration = import_module('apps.loans.migrations.0003_loan_client_external_id_unique')
+
+    def test_duplicates_merge_into_the_latest_copy(self):
+        constraint = next(c for c in Loan._meta.constraints if c.name == 'loan_client_external_id_uniq')
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(Loan, constraint)
+        platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        client = Client.objects.create(platform=platform, name='Juan Perez')
+        stale, latest, other = [
+            Loan.objects.create(client=client, external_id=external_id, amount=1000, balance=balance)
+            for external_id, balance in (('L1', 900), ('L1', 400), ('L2', 100))
+        ]
+        unnumbered = [Loan.objects.create(client=client, amount=1000, balance=500) for _ in range(2)]
+        conversation = Conversation.objects.create(platform=platform, client=client, loan=stale)
+
+        self.migration.merge_duplicate_loans(apps, None)
+
+        remaining = set(Loan.objects.values_list('pk', flat=True))
+        self.assertEqual(remaining, {latest.pk, other.pk, *(loan.pk for loan in unnumbered)})
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.loan_id, latest.pk)
+
+
+class LoanExportTests(TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        client = Client.objects.create(platform=self.platform, name='Juan Perez', external_id='C1')
+        self.loans = [
+            Loan.objects.create(client=client, external_id=f'L{i}', amount=1000, balance=500, full_data={'nota': 'señal'})
+            for i in range(3)
+        ]
+        other = Client.objects.create(platform=Platform.objects.create(name='Otra', domain='otra.do'), name='Ajeno')
+        Loan.objects.create(client=other, amount=1, balance=1)
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+
+    def export(self, query=''):
+        response = self.api.get(f'/api/v1/loans/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([row['external_id'] for row in rows], ['L0', 'L1', 'L2'])
+        self.assertEqual(rows[0]['client_external_id'], 'C1')
+        self.assertEqual(rows[0]['full_data'], {'nota': 'señal'})
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('?format=csv'))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(json.loads(rows[0]['full_data']), {'nota': 'señal'})
+
+    def test_updated_since(self):
+        self.loans[1].save()
+        since = self.loans[1].updated_at.isoformat()
+        rows = [json.loads(line) for line in self.export(f'?updated_since={since.replace("+", "%2B")}').splitlines()]
+        self.assertEqual([row['external_id'] for row in rows], ['L1'])
+        self.assertEqual(self.api.get('/api/v1/loans/export/?updated_since=ayer').status_code, 400)
+
+
+class LoanQueryScalingTests(QueryScalingMixin, TestCase):
+    url = '/api/v1/loans/'
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.client_obj = Client.objects.create(platform=self.platform, name='Juan Perez', cedula='001-0000001-1')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        platform_cache.set(self.platform.api_key, self.platform)
+
+    def loans(self, size):
+        """`size` loans in arrears, each of a different client."""
+        clients = Client.objects.bulk_create([
+            Client(platform=self.platform, name=f'Cliente {i}', cedula=uuid.uuid4().hex[:13]) for i in range(size)
+        ])
+        Loan.objects.bulk_create([
+            Loan(client=client, external_id='P1', amount=1000, balance=500, days_overdue=45) for client in clients
+        ])
+
+    def bulk_rows(self, size):
+        return [
+            {'client': str(self.client_obj.pk), 'external_id': uuid.uuid4().hex, 'amount': '100.00', 'balance': '50.00'}
+            for _ in range(size)
+        ]
+
+    def loan_with_cases(self, size):
+        """A loan discussed in `size` conversations."""
+        loan = Loan.objects.create(client=self.client_obj, external_id=uuid.uuid4().hex, amount=1000, balance=500)
+        Conversation.objects.bulk_create([
+            Conversation(platform=self.platform, client=self.client_obj, loan=loan) for _ in range(size)
+        ])
+        return loan
+
+    def test_collection_actions(self):
+        actions = {
+            'list': lambda _: self.api.get(self.url),
+            'irregular': lambda _: self.api.get(f'{self.url}irregular/'),
+            'export': lambda _: self.api.get(f'{self.url}export/'),
+            'create': lambda _: self.api.post(self.url, {
+                'client': str(self.client_obj.pk), 'external_id': uuid.uuid4().hex, 'amount': '100.00',
+                'balance': '50.00',
+            }),
+        }
+        for action, request in actions.items():
+            with self.subTest(action):
+                self.assertConstantQueries(self.loans, request)
+
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite splits bulk INSERTs at its parameter limit')
+    def test_bulk_upsert(self):
+        self.assertConstantQueries(self.bulk_rows, lambda rows: self.api.post(f'{self.url}bulk/', rows, format='json'))
+
+    def test_detail_actions(self):
+        detail = lambda loan: f'{self.url}{loan.pk}/'
+        actions = {
+            'retrieve': lambda loan: self.api.get(detail(loan)),
+            'update': lambda loan: self.api.put(detail(loan), {
+                'client': str(self.client_obj.pk), 'external_id': loan.external_id, 'amount': '900.00',
+                'balance': '10.00',
+            }),
+            'partial_update': lambda loan: self.api.patch(detail(loan), {'balance': '10.00'}),
+            'destroy': lambda loan: self.api.delete(detail(loan)),
+            'analyze': lambda loan: self.api.post(f'{detail(loan)}analyze/'),
+        }
+        for action, request in actions.items():
+            with self.subTest(action):
+                self.assertConstantQueries(self.loan_with_cases, request)
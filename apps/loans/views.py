@@ -3,6 +3,10 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from apps.platforms.authentication import APIKeyAuthentication, PlatformPermission
+from apps.platforms.export import EXPORT_RENDERERS, export_response
+from apps.platforms.ingest import iter_request_rows
+from apps.platforms.pagination import PlatformAPIPagination
+from .bulk import upsert_loans
 from .models import Loan
 from .serializers import LoanSerializer, LoanCreateSerializer
 
@@ -11,6 +15,13 @@ class LoanViewSet(viewsets.ModelViewSet):
     """ViewSet for Loan CRUD operations."""
     authentication_classes = [APIKeyAuthentication]
     permission_classes = [PlatformPermission]
+    pagination_class = PlatformAPIPagination
+    keyset_ordering = ('-days_overdue', '-created_at')
+    export_fields = (
+        'id', 'external_id', 'client_id', 'client__external_id', 'amount', 'balance', 'currency',
+        'status', 'days_overdue', 'loan_date', 'due_date', 'payment_history', 'full_data',
+        'created_at', 'updated_at',
+    )
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -18,7 +29,8 @@ class LoanViewSet(viewsets.ModelViewSet):
         return LoanSerializer
 
     def get_queryset(self):
-        return Loan.objects.filter(client__platform=self.request.platform)
+        # LoanSerializer reads client.name on every row
+        return Loan.objects.filter(client__platform=self.request.platform).select_related('client')
 
     @action(detail=False, methods=['get'])
     def irregular(self, request):
@@ -29,6 +41,20 @@ class LoanViewSet(viewsets.ModelViewSet):
         serializer = LoanSerializer(irregular_loans, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request):
+        """Stream all loans as NDJSON or CSV (?format=csv), optionally only those changed since ?updated_since."""
+        return export_response(request, self.get_queryset(), self.export_fields, 'loans')
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create or update many loans keyed by (client, external_id).
+        Accepts a JSON array or an NDJSON body (Content-Type: application/x-ndjson).
+        Returns the counts per status and lists only the rows that were not written.
+        """
+        return Response(upsert_loans(request.platform, iter_request_rows(request)))
+
     @action(detail=True, methods=['post'])
     def analyze(self, request, pk=None):
         """Analyze a loan and return its status."""
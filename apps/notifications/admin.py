@@ -5,7 +5,7 @@ from .models import Notification
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ['title', 'lawyer', 'notification_type', 'is_read', 'is_sent', 'created_at']
+    list_display = ['title', 'lawyer', 'notification_type', 'is_read', 'is_sent', 'attempts', 'created_at']
     list_filter = ['notification_type', 'channel', 'is_read', 'is_sent']
     search_fields = ['title', 'message', 'lawyer__name']
-    readonly_fields = ['id', 'created_at', 'sent_at', 'read_at']
\ No newline at end of file
+    readonly_fields = ['id', 'created_at', 'sent_at', 'read_at', 'attempts', 'next_attempt_at', 'last_error']
\ No newline at end of file
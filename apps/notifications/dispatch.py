@@ -0,0 +1,198 @@
+"""
+Batched delivery of Notification rows (run by the dispatch_notifications command).
+Each batch claims due, unsent rows with SELECT ... FOR UPDATE SKIP LOCKED, so several
+workers can run side by side, and leases them in the same short transaction (claimed_at,
+with next_attempt_at pushed `lease` seconds ahead). It then sends the emails over one
+SMTP connection and the push events over the channel layer with no transaction or row
+lock held, so notify() never waits on a delivery, and marks the batch with two bulk
+writes. Rows of a worker that died mid-batch become due again when their lease ends.
+Failed rows are retried with exponential backoff until max_attempts, after which
+next_attempt_at is cleared and last_error keeps the reason. Delivery is at least once:
+a retry or an expired lease resends every channel of the notification.
+"""
+import logging
+import time
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from .models import Notification, NotificationChannel
+
+logger = logging.getLogger(__name__)
+
+EMAIL_CHANNELS = (NotificationChannel.EMAIL, NotificationChannel.BOTH)
+PUSH_CHANNELS = (NotificationChannel.PUSH, NotificationChannel.BOTH)
+
+
+def lawyer_group_name(lawyer_id):
+    return f'lawyer_{lawyer_id}'
+
+
+def push_payload(notification):
+    return {
+        'type': 'notification',
+        'notification': {
+            'id': str(notification.id),
+            'notification_type': notification.notification_type,
+            'title': notification.title,
+            'message': notification.message,
+            'count': notification.count,
+            'conversation_id': str(notification.conversation_id) if notification.conversation_id else None,
+            'created_at': notification.created_at.isoformat(),
+        },
+    }
+
+
+class NotificationDispatcher:
+    def __init__(self, batch_size=100, max_attempts=5, retry_base=30, retry_max=3600, lease=300):
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.started = time.monotonic()
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.gave_up = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+
+    def dispatch_batch(self):
+        """Deliver one batch of due notifications and return how many rows it claimed."""
+        started = time.monotonic()
+        batch = self._claim()
+        if not batch:
+            return 0
+        errors = self._send_emails([n for n in batch if n.channel in EMAIL_CHANNELS])
+        errors.update(self._push([n for n in batch if n.channel in PUSH_CHANNELS and n.pk not in errors]))
+        self._record(batch, errors)
+
+        self.batches += 1
+        self.sent += len(batch) - len(errors)
+        self.failed += len(errors)
+        self.last_batch_size = len(batch)
+        self.last_batch_seconds = time.monotonic() - started
+        return len(batch)
+
+    def retry_delay(self, attempts):
+        return min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            'batches': self.batches,
+            'sent': self.sent,
+            'failed': self.failed,
+            'gave_up': self.gave_up,
+            'last_batch_size': self.last_batch_size,
+            'last_batch_seconds': self.last_batch_seconds,
+            'sent_per_second': self.sent / elapsed if elapsed else 0.0,
+            **backlog(),
+        }
+
+    def _claim(self):
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                Notification.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('lawyer')
+                .filter(is_sent=False, next_attempt_at__lte=now)
+                .order_by('next_attempt_at')[:self.batch_size]
+            )
+            if batch:
+                Notification.objects.filter(pk__in=[n.pk for n in batch]).update(
+                    claimed_at=now, next_attempt_at=now + timedelta(seconds=self.lease),
+                )
+        return batch
+
+    def _send_emails(self, notifications):
+        """Send over one SMTP connection; returns {pk: error} for the ones that failed."""
+        if not notifications:
+            return {}
+        errors = {}
+        try:
+            connection = get_connection()
+            connection.open()
+        except Exception as exc:
+            logger.exception('Could not open the email connection')
+            return {n.pk: f'email: {exc}' for n in notifications}
+        try:
+            for notification in notifications:
+                if not notification.lawyer.email:
+                    errors[notification.pk] = 'email: lawyer has no email address'
+                    continue
+                email = EmailMessage(
+                    subject=notification.title if notification.count == 1 else f'{notification.title} ({notification.count})',
+                    body=notification.message,
+                    to=[notification.lawyer.email],
+                    connection=connection,
+                )
+                try:
+                    email.send()
+                except Exception as exc:
+                    errors[notification.pk] = f'email: {exc}'
+        finally:
+            connection.close()
+        return errors
+
+    def _push(self, notifications):
+        channel_layer = get_channel_layer()
+        if not notifications or channel_layer is None:
+            return {}
+        return async_to_sync(self._group_send_all)(channel_layer, notifications)
+
+    async def _group_send_all(self, channel_layer, notifications):
+        errors = {}
+        for notification in notifications:
+            try:
+                await channel_layer.group_send(lawyer_group_name(notification.lawyer_id), push_payload(notification))
+            except Exception as exc:
+                errors[notification.pk] = f'push: {exc}'
+        return errors
+
+    def _record(self, batch, errors):
+        now = timezone.now()
+        sent_ids = [n.pk for n in batch if n.pk not in errors]
+        if sent_ids:
+            Notification.objects.filter(pk__in=sent_ids).update(
+                is_sent=True, sent_at=now, last_error='', claimed_at=None,
+            )
+        failed = [n for n in batch if n.pk in errors]
+        for notification in failed:
+            notification.claimed_at = None
+            notification.attempts += 1
+            notification.last_error = errors[notification.pk][:1000]
+            if notification.attempts >= self.max_attempts:
+                notification.next_attempt_at = None
+                self.gave_up += 1
+                logger.error('Giving up on notification %s: %s', notification.pk, notification.last_error)
+            else:
+                notification.next_attempt_at = now + timedelta(seconds=self.retry_delay(notification.attempts))
+        if failed:
+            Notification.objects.bulk_update(failed, ['attempts', 'next_attempt_at', 'last_error', 'claimed_at'])
+
+
+def backlog():
+    """Size and age of the unsent backlog (rows the dispatcher gave up on are not counted)."""
+    result = Notification.objects.filter(is_sent=False, next_attempt_at__isnull=False).aggregate(
+        backlog=Count('pk'), oldest=Min('created_at'),
+    )
+    oldest = result['oldest']
+    return {
+        'backlog': result['backlog'],
+        'backlog_age_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
+
+
+def default_dispatcher():
+    return NotificationDispatcher(
+        batch_size=settings.NOTIFICATION_BATCH_SIZE,
+        max_attempts=settings.NOTIFICATION_MAX_ATTEMPTS,
+        retry_base=settings.NOTIFICATION_RETRY_BASE,
+        lease=settings.NOTIFICATION_CLAIM_LEASE,
+    )
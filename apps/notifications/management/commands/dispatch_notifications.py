@@ -0,0 +1,42 @@
+"""Deliver pending lawyer notifications in batches (email and channel-layer push)."""
+import time
+from django.core.management.base import BaseCommand
+from apps.notifications.dispatch import default_dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Run the notification dispatcher: claim due notifications in batches and deliver them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows claimed per batch (NOTIFICATION_BATCH_SIZE).')
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when nothing is due.')
+        parser.add_argument('--stats-interval', type=float, default=60.0, help='Seconds between metric lines.')
+
+    def handle(self, *args, **options):
+        dispatcher = default_dispatcher()
+        if options['batch_size']:
+            dispatcher.batch_size = options['batch_size']
+        next_stats = time.monotonic() + options['stats_interval']
+        try:
+            while True:
+                claimed = dispatcher.dispatch_batch()
+                if not claimed and options['once']:
+                    break
+                if time.monotonic() >= next_stats:
+                    next_stats = time.monotonic() + options['stats_interval']
+                    self.write_stats(dispatcher)
+                if not claimed:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.write_stats(dispatcher)
+
+    def write_stats(self, dispatcher):
+        stats = dispatcher.stats()
+        self.stdout.write(
+            f"batches={stats['batches']} sent={stats['sent']} failed={stats['failed']} gave_up={stats['gave_up']} "
+            f"sent/s={stats['sent_per_second']:.1f} last_batch={stats['last_batch_size']} "
+            f"in {stats['last_batch_seconds'] * 1000:.0f}ms backlog={stats['backlog']} "
+            f"oldest={stats['backlog_age_seconds']:.0f}s"
+        )
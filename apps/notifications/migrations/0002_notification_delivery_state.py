@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Intentos'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='last_error',
+            field=models.TextField(blank=True, verbose_name='Ultimo Error'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True, verbose_name='Proximo Intento'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_sent', False)), fields=['next_attempt_at'], name='notif_unsent_due_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0007_read_watermarks'),
+        ('lawyers', '0002_lawyer_active_cases_count'),
+        ('notifications', '0002_notification_delivery_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='count',
+            field=models.PositiveIntegerField(default=1, verbose_name='Cantidad'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('attempts', 0), ('is_sent', False)), fields=['lawyer', 'conversation', 'notification_type'], name='notif_pending_key_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+def merge_pending_duplicates(apps, schema_editor):
+    """Fold pending coalesced rows that raced into one per key before the constraint is added."""
+    Notification = apps.get_model('notifications', 'Notification')
+    pending = Notification.objects.filter(
+        is_sent=False, attempts=0, notification_type='new_message', conversation__isnull=False,
+    ).order_by('created_at', 'id')
+    groups = {}
+    for notification in pending:
+        groups.setdefault(
+            (notification.lawyer_id, notification.conversation_id, notification.notification_type), [],
+        ).append(notification)
+    for rows in groups.values():
+        if len(rows) < 2:
+            continue
+        # The oldest row keeps its place in the queue; the latest preview wins, as in notify()
+        survivor, latest = rows[0], rows[-1]
+        survivor.count = sum(row.count for row in rows)
+        survivor.title, survivor.message = latest.title, latest.message
+        survivor.save(update_fields=['count', 'title', 'message'])
+        Notification.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0009_conversation_platform_created_id_index'),
+        ('lawyers', '0002_lawyer_active_cases_count'),
+        ('notifications', '0003_notification_coalescing'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_pending_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notif_pending_key_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('attempts', 0), ('is_sent', False), ('notification_type__in', ('new_message',))), fields=('lawyer', 'conversation', 'notification_type'), name='notif_pending_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0009_conversation_platform_created_id_index'),
+        ('lawyers', '0002_lawyer_active_cases_count'),
+        ('notifications', '0004_notification_pending_key_unique'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='notification',
+            name='notif_pending_key_uniq',
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Reclamada'),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('attempts', 0), ('claimed_at__isnull', True), ('is_sent', False), ('notification_type__in', ('new_message',))), fields=('lawyer', 'conversation', 'notification_type'), name='notif_pending_key_uniq'),
+        ),
+    ]
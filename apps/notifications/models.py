@@ -1,6 +1,7 @@
 """Notification model for AvocadoLegal."""
 import uuid
 from django.db import models
+from django.utils import timezone
 
 
 class NotificationType(models.TextChoices):
@@ -11,6 +12,10 @@ class NotificationType(models.TextChoices):
     REMINDER = 'reminder', 'Recordatorio'
 
 
+# Held for NOTIFICATION_COALESCE_WINDOW seconds and folded per (lawyer, conversation, type), see notify.py
+COALESCED_TYPES = (NotificationType.NEW_MESSAGE,)
+
+
 class NotificationChannel(models.TextChoices):
     EMAIL = 'email', 'Email'
     PUSH = 'push', 'Push'
@@ -31,17 +36,39 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, blank=True)
     read_at = models.DateTimeField(null=True, blank=True)
+    # Events folded into this row while its coalescing window was open (notify.py)
+    count = models.PositiveIntegerField(default=1, verbose_name='Cantidad')
+    # Delivery state for the dispatcher (dispatch.py); next_attempt_at is cleared when it gives up
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Intentos')
+    next_attempt_at = models.DateTimeField(null=True, blank=True, default=timezone.now, verbose_name='Proximo Intento')
+    # Set while a dispatcher delivers the row; next_attempt_at then holds the end of its lease
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name='Reclamada')
+    last_error = models.TextField(blank=True, verbose_name='Ultimo Error')
 
     class Meta:
         verbose_name = 'Notificacion'
         verbose_name_plural = 'Notificaciones'
         ordering = ['-created_at']
+        indexes = [
+            # Due, unsent rows claimed by the dispatcher
+            models.Index(fields=['next_attempt_at'], condition=models.Q(is_sent=False), name='notif_unsent_due_idx'),
+        ]
+        constraints = [
+            # One pending row per coalescing key, so concurrent notify() calls fold instead of
+            # both inserting; also serves notify()'s lookup
+            models.UniqueConstraint(
+                fields=['lawyer', 'conversation', 'notification_type'],
+                condition=models.Q(
+                    is_sent=False, attempts=0, claimed_at__isnull=True, notification_type__in=COALESCED_TYPES,
+                ),
+                name='notif_pending_key_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.title} - {self.lawyer.name}'
 
     def mark_as_read(self):
-        from django.utils import timezone
         self.is_read = True
         self.read_at = timezone.now()
         self.save(update_fields=['is_read', 'read_at'])
\ No newline at end of file
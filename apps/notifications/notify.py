@@ -0,0 +1,79 @@
+"""
+Creation of lawyer notifications, with coalescing of bursts.
+Types in COALESCED_TYPES are held for NOTIFICATION_COALESCE_WINDOW seconds before the
+dispatcher may send them; events for the same (lawyer, conversation, type) arriving
+meanwhile bump `count` and replace the preview on that pending row with one UPDATE
+instead of inserting new rows, so a chatty client produces one email per window.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import COALESCED_TYPES, Notification, NotificationType
+
+PREVIEW_LENGTH = 200
+
+
+def notify(lawyer_id, notification_type, title, message, conversation_id=None, count=1):
+    """Record `count` events for the lawyer; returns True if they were folded into a pending row."""
+    now = timezone.now()
+    row = {
+        'lawyer_id': lawyer_id, 'conversation_id': conversation_id, 'notification_type': notification_type,
+        'title': title, 'message': message, 'count': count,
+    }
+    if notification_type not in COALESCED_TYPES:
+        Notification.objects.create(**row, next_attempt_at=now)
+        return False
+
+    pending = Notification.objects.filter(
+        lawyer_id=lawyer_id,
+        conversation_id=conversation_id,
+        notification_type=notification_type,
+        is_sent=False,
+        attempts=0,
+        claimed_at__isnull=True,
+    )
+    fold = {'count': F('count') + count, 'title': title, 'message': message}
+    # Still inside its window, so the dispatcher cannot be sending it
+    if pending.filter(next_attempt_at__gt=now).update(**fold):
+        return True
+    try:
+        with transaction.atomic():
+            Notification.objects.create(
+                **row, next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_COALESCE_WINDOW)
+            )
+        return False
+    except IntegrityError:
+        pass
+    # notif_pending_key_uniq: a concurrent notify() inserted the pending row first, or one
+    # whose window has closed is still waiting for the dispatcher. Fold into it; a row the
+    # dispatcher has claimed is out of the constraint and this filter, so it never waits on a delivery.
+    if pending.update(**fold):
+        return True
+    Notification.objects.create(**row, next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_COALESCE_WINDOW))
+    return False
+
+
+def notify_new_messages(messages):
+    """NEW_MESSAGE notifications for client messages, one notify() per conversation with a lawyer."""
+    from apps.conversations.models import Conversation, SenderType
+    by_conversation = {}
+    for message in messages:
+        if message.sender_type == SenderType.PLATFORM_USER:
+            by_conversation.setdefault(message.conversation_id, []).append(message)
+    if not by_conversation:
+        return
+    lawyers = dict(
+        Conversation.objects.filter(pk__in=by_conversation, lawyer__isnull=False).values_list('pk', 'lawyer_id')
+    )
+    for conversation_id, lawyer_id in lawyers.items():
+        latest = by_conversation[conversation_id][-1]
+        notify(
+            lawyer_id,
+            NotificationType.NEW_MESSAGE,
+            title=f'Nuevo mensaje de {latest.sender_name or "el cliente"}',
+            message=latest.content[:PREVIEW_LENGTH],
+            conversation_id=conversation_id,
+            count=len(by_conversation[conversation_id]),
+        )
@@ -1,3 +1,238 @@
-from django.test import TestCase
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from apps.conversations.models import Conversation, ConversationStatus, Message, SenderType
+from apps.lawyers.models import Lawyer
+from apps.platforms.models import Platform
+from .dispatch import NotificationDispatcher, lawyer_group_name
+from .models import Notification, NotificationChannel, NotificationType
+from .notify import notify, notify_new_messages
 
-# Create your tests here.
+
+class NotificationDispatcherTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('ana', password='secret')
+        self.lawyer = Lawyer.objects.create(user=user, name='Ana', email='ana@jcj.do')
+        self.dispatcher = NotificationDispatcher(batch_size=10, max_attempts=2, retry_base=30)
+
+    def notify(self, channel=NotificationChannel.BOTH, lawyer=None, **kwargs):
+        return Notification.objects.create(
+            lawyer=lawyer or self.lawyer, notification_type=NotificationType.CASE_ASSIGNED,
+            channel=channel, title='Nuevo caso asignado', message='Embargo', **kwargs
+        )
+
+    def test_delivers_batch_and_marks_it_sent(self):
+        for channel in NotificationChannel.values:
+            self.notify(channel)
+        self.notify(next_attempt_at=timezone.now() + timedelta(minutes=5))
+        layer = get_channel_layer()
+        channel_name = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(lawyer_group_name(self.lawyer.pk), channel_name)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.dispatcher.dispatch_batch(), 3)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, ['ana@jcj.do'])
+        # The lease on the claimed rows, then marking them sent
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries.captured_queries), 2)
+        self.assertEqual(Notification.objects.filter(is_sent=True, sent_at__isnull=False).count(), 3)
+        event = async_to_sync(layer.receive)(channel_name)
+        self.assertEqual(event['notification']['title'], 'Nuevo caso asignado')
+        stats = self.dispatcher.stats()
+        self.assertEqual((stats['sent'], stats['backlog']), (3, 1))
+
+    def test_failures_back_off_then_give_up(self):
+        nobody = Lawyer.objects.create(user=User.objects.create_user('luis'), name='Luis', email='')
+        notification = self.notify(NotificationChannel.EMAIL, lawyer=nobody)
+        self.notify(NotificationChannel.EMAIL)
+        self.dispatcher.dispatch_batch()
+
+        notification.refresh_from_db()
+        self.assertEqual((notification.is_sent, notification.attempts), (False, 1))
+        self.assertGreater(notification.next_attempt_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(self.dispatcher.dispatch_batch(), 0)
+
+        Notification.objects.filter(pk=notification.pk).update(next_attempt_at=timezone.now())
+        with self.assertLogs('apps.notifications.dispatch', 'ERROR'):
+            self.dispatcher.dispatch_batch()
+        notification.refresh_from_db()
+        self.assertIsNone(notification.next_attempt_at)
+        self.assertIn('no email', notification.last_error)
+        stats = self.dispatcher.stats()
+        self.assertEqual((stats['sent'], stats['failed'], stats['gave_up'], stats['backlog']), (1, 2, 1, 0))
+
+
+class DispatcherLeaseTests(TransactionTestCase):
+    """Delivery runs after the claim commits, with no transaction or row lock held."""
+
+    def setUp(self):
+        user = User.objects.create_user('ana', password='secret')
+        self.lawyer = Lawyer.objects.create(user=user, name='Ana', email='ana@jcj.do')
+        self.conversation = Conversation.objects.create(
+            platform=Platform.objects.create(name='Prestamos RD', domain='prestamos.do'), lawyer=self.lawyer
+        )
+        self.dispatcher = NotificationDispatcher(batch_size=10, lease=120)
+
+    def notify(self, message):
+        return notify(
+            self.lawyer.pk, NotificationType.NEW_MESSAGE, 'Nuevo mensaje', message, conversation_id=self.conversation.pk
+        )
+
+    def test_messages_during_delivery_start_a_new_row(self):
+        self.notify('Primero')
+        Notification.objects.update(next_attempt_at=timezone.now())
+        send_emails = NotificationDispatcher._send_emails
+        during = {}
+
+        def send_while_the_client_writes(dispatcher, notifications):
+            during['in_transaction'] = connection.in_atomic_block
+            during['claimed'] = Notification.objects.get()
+            # Neither waits on the delivery nor folds into the row being sent
+            during['folded'] = self.notify('Segundo')
+            return send_emails(dispatcher, notifications)
+
+        with mock.patch.object(NotificationDispatcher, '_send_emails', send_while_the_client_writes):
+            self.assertEqual(self.dispatcher.dispatch_batch(), 1)
+        self.assertFalse(during['in_transaction'] or during['folded'])
+        self.assertIsNotNone(during['claimed'].claimed_at)
+        self.assertGreater(during['claimed'].next_attempt_at, timezone.now() + timedelta(seconds=100))
+        self.assertEqual(mail.outbox[0].body, 'Primero')
+        sent, pending = Notification.objects.order_by('created_at')
+        self.assertEqual((sent.is_sent, sent.claimed_at), (True, None))
+        self.assertEqual((pending.is_sent, pending.count, pending.message), (False, 1, 'Segundo'))
+
+    def test_expired_lease_is_claimed_again(self):
+        self.notify('Hola')
+        # A worker claimed the row and died before recording the result
+        Notification.objects.update(claimed_at=timezone.now() - timedelta(minutes=5), next_attempt_at=timezone.now())
+        self.assertEqual(self.dispatcher.dispatch_batch(), 1)
+        self.assertTrue(Notification.objects.get().is_sent)
+
+
+class NotificationCoalescingTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('ana', password='secret')
+        self.lawyer = Lawyer.objects.create(user=user, name='Ana', email='ana@jcj.do')
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.conversation = Conversation.objects.create(
+            platform=self.platform, lawyer=self.lawyer, status=ConversationStatus.ACTIVE
+        )
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+
+    def send(self, content):
+        self.api.post(
+            f'/api/v1/conversations/{self.conversation.pk}/send_message/',
+            {'content': content, 'sender_type': 'platform_user', 'sender_name': 'Juan'}, format='json'
+        )
+
+    def test_burst_folds_into_one_notification(self):
+        for i in range(5):
+            self.send(f'Mensaje {i}')
+        notification = Notification.objects.get()
+        self.assertEqual((notification.count, notification.message), (5, 'Mensaje 4'))
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+        # Once the window has closed the row is sent as is and new messages start another one
+        Notification.objects.update(next_attempt_at=timezone.now())
+        NotificationDispatcher().dispatch_batch()
+        self.assertEqual(mail.outbox[0].subject, 'Nuevo mensaje de Juan (5)')
+        self.send('Otro')
+        self.assertEqual(Notification.objects.filter(is_sent=False).get().count, 1)
+
+    def test_batch_of_messages_is_one_write(self):
+        messages = [
+            Message(conversation=self.conversation, sender_type=SenderType.PLATFORM_USER, content=str(i))
+            for i in range(3)
+        ]
+        messages.append(Message(conversation=self.conversation, sender_type=SenderType.LAWYER, content='Hola'))
+        notify_new_messages(messages)
+        with self.assertNumQueries(2):
+            notify_new_messages(messages)
+        self.assertEqual(Notification.objects.get().count, 6)
+
+    def notify(self, message='Hola'):
+        return notify(
+            self.lawyer.pk, NotificationType.NEW_MESSAGE, 'Nuevo mensaje', message, conversation_id=self.conversation.pk
+        )
+
+    def test_concurrent_insert_folds_into_the_winner(self):
+        # Another notify() inserts the pending row between this one's UPDATE and INSERT
+        real_update = QuerySet.update
+        raced = []
+
+        def race(queryset, **kwargs):
+            if raced:
+                return real_update(queryset, **kwargs)
+            raced.append(True)
+            self.notify('Primero')
+            return 0
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=race):
+            self.assertTrue(self.notify('Segundo'))
+        notification = Notification.objects.get()
+        self.assertEqual((notification.count, notification.message), (2, 'Segundo'))
+
+    def test_unclaimed_row_past_its_window_still_folds(self):
+        self.notify()
+        Notification.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(self.notify('Otra vez'))
+        self.assertEqual(Notification.objects.get().count, 2)
+
+    def test_one_pending_row_per_key(self):
+        self.notify()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Notification.objects.create(
+                lawyer=self.lawyer, conversation=self.conversation, notification_type=NotificationType.NEW_MESSAGE,
+                title='Nuevo mensaje', message='Duplicado',
+            )
+        # Sent rows and types that are not coalesced are outside the constraint
+        Notification.objects.update(is_sent=True)
+        self.notify()
+        for _ in range(2):
+            notify(self.lawyer.pk, NotificationType.CASE_ASSIGNED, 'Caso', 'Embargo', conversation_id=self.conversation.pk)
+        self.assertEqual(Notification.objects.count(), 4)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs transactional DDL to drop the constraint inside the test')
+class NotificationMergeMigrationTests(TestCase):
+    """The data step notifications 0004 runs before adding the pending-row constraint."""
+    migration = import_module('apps.notifications.migrations.0004_notification_pending_key_unique')
+
+    def test_pending_duplicates_fold_into_the_oldest(self):
+        constraint = next(c for c in Notification._meta.constraints if c.name == 'notif_pending_key_uniq')
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(Notification, constraint)
+        user = User.objects.create_user('ana', password='secret')
+        lawyer = Lawyer.objects.create(user=user, name='Ana', email='ana@jcj.do')
+        conversation = Conversation.objects.create(
+            platform=Platform.objects.create(name='Prestamos RD', domain='prestamos.do'), lawyer=lawyer
+        )
+        oldest, latest = [
+            Notification.objects.create(
+                lawyer=lawyer, conversation=conversation, notification_type=NotificationType.NEW_MESSAGE,
+                title='Nuevo mensaje', message=message, count=count,
+            )
+            for message, count in (('Primero', 2), ('Segundo', 3))
+        ]
+        sent = Notification.objects.create(
+            lawyer=lawyer, conversation=conversation, notification_type=NotificationType.NEW_MESSAGE,
+            title='Nuevo mensaje', message='Enviado', is_sent=True,
+        )
+
+        self.migration.merge_pending_duplicates(apps, None)
+
+        self.assertEqual(set(Notification.objects.values_list('pk', flat=True)), {oldest.pk, sent.pk})
+        oldest.refresh_from_db()
+        self.assertEqual((oldest.count, oldest.message), (5, 'Segundo'))
@@ -5,3 +5,6 @@ class PlatformsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.platforms'
     verbose_name = 'Plataformas'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -2,7 +2,10 @@
 Custom API Key authentication for AvocadoLegal.
 Platforms authenticate using their unique API key.
 """
+from functools import wraps
+from django.http import JsonResponse
 from rest_framework import authentication, exceptions, permissions
+from apps.platforms.cache import platform_cache
 from apps.platforms.models import Platform
 
 
@@ -13,6 +16,41 @@ class APIKeyAuthentication(authentication.BaseAuthentication):
     """
 
     def authenticate(self, request):
+        api_key = self.get_api_key(request)
+        if api_key is None:
+            return None
+
+        platform = platform_cache.get(api_key)
+        if platform is None:
+            generation = platform_cache.generation()
+            try:
+                platform = Platform.objects.get(api_key=api_key, is_active=True)
+            except Platform.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid API Key')
+            platform_cache.set(api_key, platform, generation)
+
+        request.platform = platform
+        return (None, platform)
+
+    async def aauthenticate(self, request):
+        """Same as authenticate(), for async views; only a cache miss touches the database."""
+        api_key = self.get_api_key(request)
+        if api_key is None:
+            return None
+
+        platform = platform_cache.get(api_key)
+        if platform is None:
+            generation = platform_cache.generation()
+            try:
+                platform = await Platform.objects.aget(api_key=api_key, is_active=True)
+            except Platform.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid API Key')
+            platform_cache.set(api_key, platform, generation)
+
+        request.platform = platform
+        return (None, platform)
+
+    def get_api_key(self, request):
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
 
         if not auth_header:
@@ -25,14 +63,7 @@ class APIKeyAuthentication(authentication.BaseAuthentication):
 
         if auth_type.lower() != 'api-key':
             return None
-
-        try:
-            platform = Platform.objects.get(api_key=api_key, is_active=True)
-        except Platform.DoesNotExist:
-            raise exceptions.AuthenticationFailed('Invalid API Key')
-
-        request.platform = platform
-        return (None, platform)
+        return api_key
 
     def authenticate_header(self, request):
         return 'Api-Key'
@@ -45,9 +76,32 @@ class PlatformPermission(permissions.BasePermission):
         return hasattr(request, 'platform') and request.platform is not None
 
     def has_object_permission(self, request, view, obj):
-        # Check if the object belongs to the requesting platform
-        if hasattr(obj, 'platform'):
-            return obj.platform == request.platform
-        if hasattr(obj, 'client') and hasattr(obj.client, 'platform'):
-            return obj.client.platform == request.platform
-        return True
\ No newline at end of file
+        # Check if the object belongs to the requesting platform, by id so no related row is loaded
+        if hasattr(obj, 'platform_id'):
+            return obj.platform_id == request.platform.pk
+        if hasattr(obj, 'client') and hasattr(obj.client, 'platform_id'):
+            return obj.client.platform_id == request.platform.pk
+        return True
+
+
+def async_platform_required(view):
+    """
+    APIKeyAuthentication + PlatformPermission for plain async Django views, answering
+    with the same 401 bodies DRF would. The view gets request.platform set.
+    """
+    authenticator = APIKeyAuthentication()
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            authenticated = await authenticator.aauthenticate(request)
+        except exceptions.AuthenticationFailed as exc:
+            authenticated, detail = None, exc.detail
+        else:
+            detail = exceptions.NotAuthenticated.default_detail
+        if authenticated is None:
+            response = JsonResponse({'detail': str(detail)}, status=401)
+            response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            return response
+        return await view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,126 @@
+"""
+Bulk client upsert for a platform.
+A row matches an existing client by external_id, or by cedula when it has no
+external_id match. Like the loan upsert, each row carries the client's full data,
+except that a blank external_id or cedula never clears the stored one.
+"""
+import time
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from .ingest import bulk_summary, chunked, count_results
+from .models import Client
+from .serializers import ClientBulkRowSerializer
+
+DEFAULT_CHUNK_SIZE = 1000
+UPDATE_FIELDS = [
+    'external_id', 'name', 'cedula', 'phone', 'email', 'address', 'additional_data', 'updated_at',
+]
+KEY_FIELDS = ('external_id', 'cedula')
+
+
+def upsert_clients(platform, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Upsert (row_number, data, error) tuples for a platform.
+    Returns a bulk_summary() with one timing summary per chunk under 'batches'.
+    """
+    summary = bulk_summary()
+    batches = []
+    for number, chunk in enumerate(chunked(rows, chunk_size), start=1):
+        start = time.perf_counter()
+        chunk_results = _upsert_chunk(platform, chunk)
+        batch = {'batch': number, 'rows': len(chunk), 'created': 0, 'updated': 0, 'skipped': 0, 'error': 0}
+        for result in chunk_results:
+            batch[result['status']] += 1
+        batch['seconds'] = round(time.perf_counter() - start, 4)
+        batches.append(batch)
+        count_results(summary, chunk_results)
+    summary['batches'] = batches
+    return summary
+
+
+def _error(row_number, values, errors, status='error'):
+    return {'row': row_number, 'status': status, 'external_id': values.get('external_id'), 'errors': errors}
+
+
+def _upsert_chunk(platform, chunk):
+    results = {}
+    serializer = ClientBulkRowSerializer()
+    latest = {}
+    winners = {}
+    for row_number, data, error in chunk:
+        if error:
+            results[row_number] = _error(row_number, {}, {'non_field_errors': [error]})
+            continue
+        try:
+            values = serializer.run_validation(data)
+        except ValidationError as exc:
+            results[row_number] = _error(row_number, data, exc.detail)
+            continue
+        keys = [(field, values[field]) for field in KEY_FIELDS if values.get(field)]
+        if not keys:
+            results[row_number] = _error(row_number, values, {'non_field_errors': ['external_id or cedula is required.']})
+            continue
+        # A later row with the same external_id or cedula replaces the earlier one
+        for key in keys:
+            superseded = winners.get(key)
+            if superseded is not None and superseded in latest:
+                results[superseded] = _error(
+                    superseded, latest.pop(superseded),
+                    {'non_field_errors': [f'Superseded by row {row_number}.']}, status='skipped',
+                )
+        for key in keys:
+            winners[key] = row_number
+        latest[row_number] = values
+
+    if latest:
+        try:
+            results.update(_write(platform, latest))
+        except IntegrityError:
+            # A concurrent import inserted one of these clients; the retry sees it as an update
+            results.update(_write(platform, latest))
+    return [results[row_number] for row_number, _, _ in chunk]
+
+
+def _write(platform, latest):
+    results = {}
+    with transaction.atomic():
+        lookup = Q()
+        for field in KEY_FIELDS:
+            wanted = {values[field] for values in latest.values() if values.get(field)}
+            if wanted:
+                lookup |= Q(**{f'{field}__in': wanted})
+        by_key = {}
+        for client in Client.objects.select_for_update().filter(lookup, platform=platform).only('pk', *KEY_FIELDS):
+            for field in KEY_FIELDS:
+                value = getattr(client, field)
+                if value:
+                    by_key.setdefault((field, value), client)
+
+        clients = []
+        for row_number, values in latest.items():
+            matches = {by_key.get((field, values.get(field))) for field in KEY_FIELDS if values.get(field)} - {None}
+            if len(matches) > 1:
+                results[row_number] = _error(
+                    row_number, values,
+                    {'non_field_errors': ['external_id and cedula belong to different clients.']},
+                )
+                continue
+            if matches:
+                existing = matches.pop()
+                client = Client(pk=existing.pk, platform=platform, **values)
+                client.external_id = client.external_id or existing.external_id
+                client.cedula = client.cedula or existing.cedula
+                status = 'updated'
+            else:
+                client = Client(platform=platform, **values)
+                status = 'created'
+            clients.append(client)
+            results[row_number] = {
+                'row': row_number, 'status': status, 'id': str(client.pk), 'external_id': client.external_id,
+            }
+        if clients:
+            Client.objects.bulk_create(
+                clients, update_conflicts=True, unique_fields=['id'], update_fields=UPDATE_FIELDS,
+            )
+    return results
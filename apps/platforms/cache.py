@@ -0,0 +1,86 @@
+"""In-process cache of active platforms resolved by API key."""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+
+class PlatformCache:
+    """
+    Bounded LRU cache with per-entry TTL mapping API keys to active platforms.
+    Entries are evicted explicitly when a platform changes (see signals.py); the
+    TTL bounds staleness for changes made in other processes. Every eviction bumps a
+    generation: a lookup takes generation() before reading the database and passes it to
+    set(), which drops the row if an eviction ran meanwhile, since it may predate the change.
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._generation = 0
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get(self, api_key):
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[api_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(api_key)
+            self.hits += 1
+            # Hand out a copy so per-request mutations never leak between requests
+            return copy.copy(entry[0])
+
+    def set(self, api_key, platform, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[api_key] = (copy.copy(platform), time.monotonic() + self.ttl)
+            self._entries.move_to_end(api_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_platform(self, platform_id):
+        """Drop every entry for a platform, whatever key it was cached under."""
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, (platform, _) in self._entries.items() if platform.pk == platform_id]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+platform_cache = PlatformCache(
+    max_size=getattr(settings, 'API_KEY_CACHE_MAX_SIZE', 1024),
+    ttl=getattr(settings, 'API_KEY_CACHE_TTL', 60),
+)
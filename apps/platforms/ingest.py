@@ -0,0 +1,126 @@
+"""Helpers for bulk ingestion endpoints (JSON array, NDJSON or CSV request bodies)."""
+import codecs
+import csv
+import json
+from itertools import islice
+from rest_framework.exceptions import ParseError
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+# Rows listed in a bulk response; the counts still cover every row
+MAX_REPORTED_ROWS = 1000
+
+
+def media_type(request):
+    return request.content_type.split(';')[0].strip().lower()
+
+
+def is_ndjson(request):
+    return media_type(request) in NDJSON_CONTENT_TYPES
+
+
+def is_csv(request):
+    return media_type(request) in CSV_CONTENT_TYPES
+
+
+def iter_request_rows(request):
+    """
+    Yield (row_number, data, error) for each row of the request body.
+    NDJSON and CSV bodies are read line by line from the underlying stream, so they
+    are never buffered in memory; anything else is parsed by DRF and must be a JSON array.
+    """
+    if is_ndjson(request):
+        yield from iter_ndjson(request._request)
+        return
+    if is_csv(request):
+        yield from iter_csv(request._request)
+        return
+
+    rows = request.data
+    if not isinstance(rows, list):
+        raise ParseError('Expected a JSON array or an NDJSON body.')
+    for row_number, data in enumerate(rows, start=1):
+        if isinstance(data, dict):
+            yield row_number, data, None
+        else:
+            yield row_number, None, 'Expected a JSON object.'
+
+
+def iter_ndjson(stream):
+    row_number = 0
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        row_number += 1
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            yield row_number, None, f'Invalid JSON: {exc}'
+            continue
+        if isinstance(data, dict):
+            yield row_number, data, None
+        else:
+            yield row_number, None, 'Expected a JSON object.'
+
+
+def iter_csv(stream):
+    """
+    Rows of a UTF-8 CSV body with a header line. Empty cells are left out so the
+    serializer applies the field defaults.
+    """
+    reader = csv.reader(codecs.iterdecode(stream, 'utf-8-sig'))
+    try:
+        header = [name.strip() for name in next(reader)]
+    except StopIteration:
+        return
+    except (csv.Error, UnicodeDecodeError) as exc:
+        raise ParseError(f'Invalid CSV header: {exc}')
+    row_number = 0
+    while True:
+        try:
+            values = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            row_number += 1
+            yield row_number, None, f'Invalid CSV: {exc}'
+            continue
+        except UnicodeDecodeError as exc:
+            # The decoder cannot resume after bad bytes; report it and stop reading
+            yield row_number + 1, None, f'Invalid CSV encoding: {exc}'
+            return
+        if not any(values):
+            continue
+        row_number += 1
+        if len(values) > len(header):
+            yield row_number, None, f'Expected {len(header)} columns, got {len(values)}.'
+            continue
+        yield row_number, {name: value for name, value in zip(header, values) if value != ''}, None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def bulk_summary():
+    """Running totals of a bulk upsert, filled chunk by chunk with count_results()."""
+    return {'total': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'error': 0, 'results': [], 'results_truncated': False}
+
+
+def count_results(summary, results):
+    """
+    Add one chunk's per-row results to the summary. Only rows that were not written are
+    kept, up to MAX_REPORTED_ROWS, so a large upload never holds a result per row.
+    """
+    for result in results:
+        summary['total'] += 1
+        summary[result['status']] += 1
+        if result['status'] not in ('error', 'skipped'):
+            continue
+        if len(summary['results']) < MAX_REPORTED_ROWS:
+            summary['results'].append(result)
+        else:
+            summary['results_truncated'] = True
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('platforms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['platform', 'cedula'], name='client_platform_cedula_idx'),
+        ),
+    ]
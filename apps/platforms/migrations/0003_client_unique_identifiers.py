@@ -0,0 +1,95 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:42
+
+from collections import defaultdict
+from django.db import migrations, models
+from apps.platforms.normalization import normalize_cedula, normalize_phone
+
+BATCH_SIZE = 1000
+# Copied from a merged duplicate onto the surviving client when the survivor has them blank
+MERGED_FIELDS = ('external_id', 'cedula', 'phone', 'email', 'address')
+KEY_FIELDS = ('external_id', 'cedula')
+
+
+def duplicate_groups(Client, key, normalize=str):
+    """Lists of client ids, oldest first, that share (platform, normalize(key))."""
+    groups = defaultdict(list)
+    rows = Client.objects.exclude(**{key: ''}).order_by('created_at', 'pk').values_list('pk', 'platform_id', key)
+    for pk, platform_id, value in rows.iterator(chunk_size=BATCH_SIZE):
+        groups[(platform_id, normalize(value))].append(pk)
+    return [ids for ids in groups.values() if len(ids) > 1]
+
+
+def merge_clients(apps, ids):
+    """Fold the clients in `ids` into the first one; their loans and conversations move with them."""
+    Client = apps.get_model('platforms', 'Client')
+    Loan = apps.get_model('loans', 'Loan')
+    Conversation = apps.get_model('conversations', 'Conversation')
+    clients = Client.objects.in_bulk(ids)
+    survivor, duplicate_ids = clients[ids[0]], ids[1:]
+    for pk in duplicate_ids:
+        duplicate = clients[pk]
+        for field in MERGED_FIELDS:
+            value = getattr(duplicate, field)
+            if getattr(survivor, field) or not value:
+                continue
+            # A key is only taken over if no client outside the group already has it
+            if field in KEY_FIELDS and Client.objects.filter(
+                platform_id=survivor.platform_id, **{field: value}
+            ).exclude(pk__in=ids).exists():
+                continue
+            setattr(survivor, field, value)
+        survivor.additional_data = {**duplicate.additional_data, **survivor.additional_data}
+    Loan.objects.filter(client_id__in=duplicate_ids).update(client_id=survivor.pk)
+    Conversation.objects.filter(client_id__in=duplicate_ids).update(client_id=survivor.pk)
+    Client.objects.filter(pk__in=duplicate_ids).delete()
+    survivor.save()
+
+
+def normalize_clients(Client):
+    changed = []
+    for client in Client.objects.only('cedula', 'phone').iterator(chunk_size=BATCH_SIZE):
+        cedula, phone = normalize_cedula(client.cedula), normalize_phone(client.phone)
+        if (cedula, phone) != (client.cedula, client.phone):
+            client.cedula, client.phone = cedula, phone
+            changed.append(client)
+    Client.objects.bulk_update(changed, ['cedula', 'phone'], batch_size=BATCH_SIZE)
+
+
+def normalize_and_merge_clients(apps, schema_editor):
+    """
+    Merge the clients the unique constraints below would reject, comparing cedulas in
+    canonical form, then store every cedula and phone normalized so the widget's
+    normalized lookups find legacy rows.
+    """
+    Client = apps.get_model('platforms', 'Client')
+    for ids in duplicate_groups(Client, 'cedula', normalize_cedula):
+        merge_clients(apps, ids)
+    normalize_clients(Client)
+    for ids in duplicate_groups(Client, 'external_id'):
+        merge_clients(apps, ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('platforms', '0002_client_platform_cedula_index'),
+        ('loans', '0002_loan_client_status_overdue_index'),
+        ('conversations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_and_merge_clients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='client',
+            constraint=models.UniqueConstraint(condition=models.Q(('external_id', ''), _negated=True), fields=('platform', 'external_id'), name='client_platform_external_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='client',
+            constraint=models.UniqueConstraint(condition=models.Q(('cedula', ''), _negated=True), fields=('platform', 'cedula'), name='client_platform_cedula_uniq'),
+        ),
+        # Dropped after the unique constraint exists, so cedula lookups stay indexed
+        migrations.RemoveIndex(
+            model_name='client',
+            name='client_platform_cedula_idx',
+        ),
+    ]
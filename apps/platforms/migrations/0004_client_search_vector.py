@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return  # Other databases leave search_vector empty and search with icontains
+    schema_editor.execute(
+        'CREATE TRIGGER platforms_client_search_vector_trg BEFORE INSERT OR UPDATE OF name ON platforms_client '
+        "FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.spanish', name)"
+    )
+    schema_editor.execute("UPDATE platforms_client SET search_vector = to_tsvector('pg_catalog.spanish', name)")
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP TRIGGER IF EXISTS platforms_client_search_vector_trg ON platforms_client')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('platforms', '0003_client_unique_identifiers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+        migrations.AddIndex(
+            model_name='client',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='client_search_vector_idx'),
+        ),
+    ]
@@ -4,6 +4,8 @@ Represents external SaaS platforms that integrate with the API.
 """
 import uuid
 import secrets
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 
@@ -81,11 +83,29 @@ class Client(models.Model):
     additional_data = models.JSONField(default=dict, blank=True, verbose_name='Datos Adicionales')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Spanish tsvector of the name, kept by a PostgreSQL trigger (see conversations/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Cliente'
         verbose_name_plural = 'Clientes'
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='client_search_vector_idx'),
+        ]
+        constraints = [
+            # Upsert keys for bulk imports; blank identifiers are not deduplicated
+            models.UniqueConstraint(
+                fields=['platform', 'external_id'],
+                condition=~models.Q(external_id=''),
+                name='client_platform_external_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['platform', 'cedula'],
+                condition=~models.Q(cedula=''),
+                name='client_platform_cedula_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} - {self.cedula}'
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""Canonical forms for client identifiers, so imports and the widget match the same client."""
+import re
+
+NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_cedula(value):
+    """Dominican cedulas (11 digits) become 000-0000000-0; other ids are only trimmed."""
+    value = (value or '').strip()
+    digits = NON_DIGITS.sub('', value)
+    if len(digits) == 11:
+        return f'{digits[:3]}-{digits[3:10]}-{digits[10]}'
+    return value
+
+
+def normalize_phone(value):
+    """NANP numbers (809/829/849 and the rest) become +1XXXXXXXXXX; others are only trimmed."""
+    value = (value or '').strip()
+    digits = NON_DIGITS.sub('', value)
+    if len(digits) == 10:
+        return f'+1{digits}'
+    if len(digits) == 11 and digits.startswith('1'):
+        return f'+{digits}'
+    return value
@@ -0,0 +1,235 @@
+"""
+Pagination for the platform API.
+Page-number pagination stays the default; platforms can opt into keyset
+(cursor) pagination per request with ?pagination=cursor, and into an
+estimated count with ?count=estimate.
+"""
+import base64
+import binascii
+import datetime
+import decimal
+import json
+import uuid
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import BooleanField, Expression, F, Q, Value
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """Planner row estimate on PostgreSQL (no table scan), exact COUNT elsewhere."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))[0]['Plan']
+    return int(plan['Plan Rows'])
+
+
+class EstimatedPage(Page):
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Django paginator that reports the planner estimate instead of running COUNT(*).
+    The estimate can be off, so page bounds and has_next come from fetching one extra row.
+    """
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        return EstimatedPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+
+class RowComparison(Expression):
+    """
+    `(a, b, ...) < (%s, %s, ...)` as one SQL row-value comparison, which PostgreSQL
+    turns into a single range scan over a composite index on the same columns.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, fields, operator, values):
+        super().__init__()
+        self.lhs = [F(field) for field in fields]
+        self.rhs = [Value(value) for value in values]
+        self.operator = operator
+
+    def get_source_expressions(self):
+        return [*self.lhs, *self.rhs]
+
+    def set_source_expressions(self, exprs):
+        self.lhs, self.rhs = exprs[:len(self.lhs)], exprs[len(self.lhs):]
+
+    def as_sql(self, compiler, connection):
+        sides, params = [], []
+        for side in (self.lhs, self.rhs):
+            sqls = []
+            for expression in side:
+                sql, expression_params = compiler.compile(expression)
+                sqls.append(sql)
+                params.extend(expression_params)
+            sides.append(f"({', '.join(sqls)})")
+        return f'{sides[0]} {self.operator} {sides[1]}', params
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, decimal.Decimal)):
+        return str(value)
+    return value
+
+
+class PlatformAPIPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset mode.
+    In keyset mode the page is selected by comparing against the cursor row on the
+    view's `keyset_ordering` plus `id` as tiebreaker (see keyset_filter), so with an
+    index on those columns deep pages cost the same as the first one, and no COUNT(*)
+    is run unless ?count=estimate or ?count=exact is given. Cursors go both ways:
+    `next_cursor` after the last row, `previous_cursor` before the first one.
+    The ordering fields must be non-nullable.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    default_keyset_ordering = ('-created_at',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count_mode = request.query_params.get(self.count_query_param)
+        self.use_keyset = self.use_keyset_for(request)
+        if not self.use_keyset:
+            self.django_paginator_class = EstimatedCountPaginator if self.count_mode == 'estimate' else Paginator
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request, view)
+
+    def use_keyset_for(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_query_param in request.query_params
+        )
+
+    def get_ordering(self, view):
+        ordering = tuple(getattr(view, 'keyset_ordering', self.default_keyset_ordering))
+        tiebreaker = '-id' if ordering[-1].startswith('-') else 'id'
+        return ordering + (tiebreaker,)
+
+    def paginate_keyset(self, queryset, request, view):
+        self.ordering = self.get_ordering(view)
+        self.keyset_page_size = self.get_page_size(request)
+        self.total = None
+        if self.count_mode == 'estimate':
+            self.total = estimate_count(queryset)
+        elif self.count_mode == 'exact':
+            self.total = queryset.count()
+
+        queryset = queryset.order_by(*self.ordering)
+        encoded = request.query_params.get(self.cursor_query_param)
+        position, reverse = None, False
+        if encoded:
+            position, reverse = self.decode_cursor(encoded, queryset.model)
+            queryset = queryset.filter(self.keyset_filter(position, reverse))
+        if reverse:
+            # Walk back from the cursor and flip the page, so it reads in the usual order
+            queryset = queryset.reverse()
+
+        page = list(queryset[:self.keyset_page_size + 1])
+        has_more = len(page) > self.keyset_page_size
+        page = page[:self.keyset_page_size]
+        if reverse:
+            page.reverse()
+        has_next, has_previous = (True, has_more) if reverse else (has_more, position is not None)
+        self.next_cursor = self.encode_cursor(page[-1]) if has_next and page else None
+        self.previous_cursor = self.encode_cursor(page[0], reverse=True) if has_previous and page else None
+        return page
+
+    def keyset_filter(self, values, reverse=False):
+        """
+        Rows after (va, vb, vid) in the ordering's direction (before it with `reverse`).
+        When every field sorts the same way this is the row comparison
+        `(a, b, id) < (va, vb, vid)`; mixed directions need an OR of equal prefixes.
+        """
+        descending = [field.startswith('-') != reverse for field in self.ordering]
+        names = [field.lstrip('-') for field in self.ordering]
+        if all(descending) or not any(descending):
+            return RowComparison(names, '<' if descending[0] else '>', values)
+        condition = Q()
+        equal_prefix = Q()
+        for name, is_descending, value in zip(names, descending, values):
+            lookup = 'lt' if is_descending else 'gt'
+            condition |= equal_prefix & Q(**{f'{name}__{lookup}': value})
+            equal_prefix &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, obj, reverse=False):
+        """A list of the row's ordering values; a previous-page cursor wraps it as {"before": [...]}."""
+        values = [_encode_value(getattr(obj, field.lstrip('-'))) for field in self.ordering]
+        if reverse:
+            values = {'before': values}
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, encoded, model):
+        """The cursor's values as Python objects, and whether it points backwards."""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            reverse = isinstance(values, dict)
+            if reverse:
+                values = values.get('before')
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ], reverse
+        except (ValueError, TypeError, binascii.Error, ValidationError):
+            raise NotFound('Invalid cursor')
+
+    def get_paginated_response(self, data):
+        if not self.use_keyset:
+            response = super().get_paginated_response(data)
+            if self.count_mode == 'estimate':
+                response.data['count_is_estimate'] = True
+            return response
+
+        url = replace_query_param(self.request.build_absolute_uri(), self.mode_query_param, 'cursor')
+        payload = {
+            'next': replace_query_param(url, self.cursor_query_param, self.next_cursor) if self.next_cursor else None,
+            'previous': (
+                replace_query_param(url, self.cursor_query_param, self.previous_cursor) if self.previous_cursor else None
+            ),
+            'next_cursor': self.next_cursor,
+            'previous_cursor': self.previous_cursor,
+            'results': data,
+        }
+        if self.total is not None:
+            payload['count'] = self.total
+            payload['count_is_estimate'] = self.count_mode == 'estimate'
+        return Response(payload)
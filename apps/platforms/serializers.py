@@ -1,6 +1,7 @@
 ﻿"""Serializers for platforms app."""
 from rest_framework import serializers
 from .models import Platform, PlatformUser, Client
+from .normalization import normalize_cedula, normalize_phone
 
 
 class PlatformSerializer(serializers.ModelSerializer):
@@ -33,8 +34,14 @@ class ClientSerializer(serializers.ModelSerializer):
         fields = ['id', 'external_id', 'name', 'cedula', 'phone', 'email', 'address', 'additional_data', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+    def validate_cedula(self, value):
+        return normalize_cedula(value)
 
-class ClientCreateSerializer(serializers.ModelSerializer):
+    def validate_phone(self, value):
+        return normalize_phone(value)
+
+
+class ClientCreateSerializer(ClientSerializer):
     """Serializer for creating a Client."""
     class Meta:
         model = Client
@@ -46,4 +53,10 @@ class ClientCreateSerializer(serializers.ModelSerializer):
             'email': {'required': False, 'allow_blank': True},
             'address': {'required': False, 'allow_blank': True},
             'additional_data': {'required': False},
-        }
\ No newline at end of file
+        }
+
+
+class ClientBulkRowSerializer(ClientCreateSerializer):
+    """Validates and normalizes one row of a bulk client import without touching the database."""
+    class Meta(ClientCreateSerializer.Meta):
+        validators = []
\ No newline at end of file
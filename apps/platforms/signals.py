@@ -0,0 +1,18 @@
+"""Signal handlers for platforms app."""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .cache import platform_cache
+from .models import Platform
+
+
+@receiver(post_save, sender=Platform)
+@receiver(post_delete, sender=Platform)
+def invalidate_platform_cache(sender, instance, **kwargs):
+    """
+    Covers regenerate_api_key, deactivation and deletion. Runs after commit, so a request
+    that misses the cache afterwards reads the new row; one that read the old row before
+    the commit carries an older cache generation, and set() refuses to store it.
+    """
+    platform_id = instance.pk
+    transaction.on_commit(lambda: platform_cache.invalidate_platform(platform_id))
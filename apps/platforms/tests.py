@@ -1,3 +1,337 @@
+import json
+import uuid
+from importlib import import_module
+from unittest import mock, skipUnless
+from django.apps import apps
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from apps.conversations.models import Conversation
+from apps.loans.models import Loan
+from config.testing import QueryScalingMixin
+from .cache import platform_cache
+from .models import Client, Platform, PlatformUser
+from .normalization import normalize_cedula, normalize_phone
+from .pagination import EstimatedCountPaginator, PlatformAPIPagination
 
-# Create your tests here.
+
+class NormalizationTests(TestCase):
+    def test_cedula(self):
+        self.assertEqual(normalize_cedula(' 00100000011 '), '001-0000001-1')
+        self.assertEqual(normalize_cedula('001 0000001 1'), '001-0000001-1')
+        self.assertEqual(normalize_cedula('PA-12345'), 'PA-12345')
+
+    def test_phone(self):
+        self.assertEqual(normalize_phone('(809) 555-1234'), '+18095551234')
+        self.assertEqual(normalize_phone('1-849-555-0000'), '+18495550000')
+        self.assertEqual(normalize_phone('555'), '555')
+
+
+class BulkClientUpsertTests(TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+
+    def post(self, body, content_type):
+        return self.api.generic('POST', '/api/v1/platforms/clients/bulk/', body, content_type=content_type)
+
+    def test_csv_matches_by_cedula_and_external_id(self):
+        by_cedula = Client.objects.create(platform=self.platform, name='Juan', cedula='001-0000001-1')
+        by_external = Client.objects.create(platform=self.platform, name='Ana', external_id='E1', cedula='402-1234567-8')
+        body = (
+            'external_id,name,cedula,phone\n'
+            ',Juan Perez,00100000011,(809) 555-1234\n'
+            'E1,Ana Gomez,,\n'
+            'E2,Luis,003 0000003 3,\n'
+            'E3,Luis Bis,00300000033,\n'
+            ',Sin Clave,,\n'
+        )
+        response = self.post(body, 'text/csv')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [response.data[status] for status in ('total', 'created', 'updated', 'skipped', 'error')], [5, 1, 2, 1, 1],
+        )
+        self.assertEqual(
+            [(result['row'], result['status']) for result in response.data['results']], [(3, 'skipped'), (5, 'error')],
+        )
+        self.assertEqual(response.data['batches'][0]['rows'], 5)
+        by_cedula.refresh_from_db()
+        self.assertEqual((by_cedula.name, by_cedula.phone), ('Juan Perez', '+18095551234'))
+        by_external.refresh_from_db()
+        self.assertEqual((by_external.name, by_external.cedula), ('Ana Gomez', '402-1234567-8'))
+        self.assertEqual(Client.objects.get(cedula='003-0000003-3').external_id, 'E3')
+
+    def test_conflicting_keys_are_reported(self):
+        Client.objects.create(platform=self.platform, name='Juan', cedula='001-0000001-1')
+        Client.objects.create(platform=self.platform, name='Ana', external_id='E1')
+        body = json.dumps({'external_id': 'E1', 'name': 'Ana', 'cedula': '001-0000001-1'})
+        response = self.post(body, 'application/x-ndjson')
+        self.assertEqual(response.data['results'][0]['status'], 'error')
+
+    @mock.patch('apps.platforms.ingest.MAX_REPORTED_ROWS', 2)
+    def test_only_a_bounded_list_of_failed_rows_is_returned(self):
+        body = '\n'.join(['{not json'] * 3 + [json.dumps({'external_id': 'E1', 'name': 'Ana'})])
+        response = self.post(body, 'application/x-ndjson')
+        self.assertEqual((response.data['total'], response.data['created'], response.data['error']), (4, 1, 3))
+        self.assertEqual([result['row'] for result in response.data['results']], [1, 2])
+        self.assertTrue(response.data['results_truncated'])
+
+    def test_single_create_rejects_duplicate_cedula(self):
+        Client.objects.create(platform=self.platform, name='Juan', cedula='001-0000001-1')
+        response = self.api.post('/api/v1/platforms/clients/', {'name': 'Juan', 'cedula': '00100000011'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_normalizes_cedula_and_phone(self):
+        client = Client.objects.create(platform=self.platform, name='Juan')
+        response = self.api.patch(
+            f'/api/v1/platforms/clients/{client.pk}/', {'cedula': '00100000011', 'phone': '(809) 555-1234'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        client.refresh_from_db()
+        self.assertEqual((client.cedula, client.phone), ('001-0000001-1', '+18095551234'))
+
+
+class ClientMergeMigrationTests(TestCase):
+    """The data step platforms 0003 runs before adding the unique constraints."""
+    migration = import_module('apps.platforms.migrations.0003_client_unique_identifiers')
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+
+    def test_legacy_cedulas_are_normalized_and_merged(self):
+        # Un-normalized legacy rows slip past the constraint, which compares stored values
+        oldest = Client.objects.create(platform=self.platform, name='Juan', cedula='00100000011', phone='(809) 555-1234')
+        duplicate = Client.objects.create(
+            platform=self.platform, name='Juan P.', cedula='001-0000001-1', external_id='E1',
+            email='juan@example.com', additional_data={'source': 'legacy'},
+        )
+        loan = Loan.objects.create(client=duplicate, external_id='P1', amount=1000, balance=500)
+        conversation = Conversation.objects.create(platform=self.platform, client=duplicate, loan=loan)
+        other_platform = Platform.objects.create(name='Otra', domain='otra.do')
+        unrelated = Client.objects.create(platform=other_platform, name='Juan', cedula='00100000011')
+
+        self.migration.normalize_and_merge_clients(apps, None)
+
+        self.assertFalse(Client.objects.filter(pk=duplicate.pk).exists())
+        oldest.refresh_from_db()
+        self.assertEqual(
+            (oldest.name, oldest.cedula, oldest.phone, oldest.external_id, oldest.email),
+            ('Juan', '001-0000001-1', '+18095551234', 'E1', 'juan@example.com'),
+        )
+        self.assertEqual(oldest.additional_data, {'source': 'legacy'})
+        loan.refresh_from_db()
+        conversation.refresh_from_db()
+        self.assertEqual((loan.client_id, conversation.client_id), (oldest.pk, oldest.pk))
+        unrelated.refresh_from_db()
+        self.assertEqual(unrelated.cedula, '001-0000001-1')
+
+
+class PaginationTests(TestCase):
+    url = '/api/v1/platforms/clients/'
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        Client.objects.bulk_create([Client(platform=self.platform, name=f'Cliente {i}') for i in range(7)])
+        # Five rows share created_at, so only the id tiebreaker orders them
+        self.tied_at = timezone.now()
+        Client.objects.filter(pk__in=Client.objects.order_by('pk').values('pk')[:5]).update(created_at=self.tied_at)
+        self.expected = list(Client.objects.order_by('-created_at', '-id').values_list('name', flat=True))
+
+    def names(self, response):
+        return [row['name'] for row in response.data['results']]
+
+    def test_cursor_pages_forward_and_back(self):
+        response = self.api.get(self.url, {'pagination': 'cursor', 'page_size': 3})
+        pages = [self.names(response)]
+        self.assertIsNone(response.data['previous_cursor'])
+        self.assertNotIn('count', response.data)
+        while response.data['next']:
+            response = self.api.get(response.data['next'])
+            pages.append(self.names(response))
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        backwards = []
+        while response.data['previous']:
+            response = self.api.get(response.data['previous'])
+            backwards.insert(0, self.names(response))
+        self.assertEqual(backwards, pages[:-1])
+        self.assertIsNone(response.data['previous_cursor'])
+        self.assertIsNotNone(response.data['next_cursor'])
+
+    def test_cursor_with_mixed_directions(self):
+        view = type('View', (), {'keyset_ordering': ('name', '-created_at')})()
+        pagination = PlatformAPIPagination()
+        queryset = Client.objects.all()
+        names, cursor = [], None
+        while True:
+            params = {'pagination': 'cursor', 'page_size': 2, **({'cursor': cursor} if cursor else {})}
+            request = Request(APIRequestFactory().get(self.url, params))
+            names += [client.name for client in pagination.paginate_queryset(queryset, request, view)]
+            cursor = pagination.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(names, sorted(self.expected))
+
+    def test_cursor_counts_on_request(self):
+        response = self.api.get(self.url, {'pagination': 'cursor', 'count': 'exact'})
+        self.assertEqual((response.data['count'], response.data['count_is_estimate']), (7, False))
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-base64!', 'WzFd', 'eyJiZWZvcmUiOiAxfQ=='):
+            response = self.api.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+    def test_estimated_count(self):
+        response = self.api.get(self.url, {'count': 'estimate', 'page_size': 5})
+        self.assertTrue(response.data['count_is_estimate'])
+        self.assertIsNotNone(response.data['next'])
+        names = self.names(response)
+        response = self.api.get(response.data['next'])
+        self.assertIsNone(response.data['next'])
+        # Page-number mode orders by created_at alone, so tied rows come in any order
+        self.assertEqual((len(names), sorted(names + self.names(response))), (5, sorted(self.expected)))
+        self.assertEqual(self.api.get(self.url, {'count': 'estimate', 'page': 3}).status_code, 404)
+
+    def test_estimated_paginator_pages_by_fetching_one_extra_row(self):
+        paginator = EstimatedCountPaginator(Client.objects.order_by('-created_at', '-id'), 3)
+        with self.assertNumQueries(1):
+            page = paginator.page(3)
+        self.assertEqual(([client.name for client in page], page.has_next()), (self.expected[6:], False))
+        self.assertTrue(paginator.page(2).has_next())
+
+
+class PlatformCacheInvalidationTests(TestCase):
+    url = '/api/v1/platforms/clients/'
+
+    def setUp(self):
+        platform_cache.clear()
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+
+    def get(self, api_key):
+        return APIClient().get(self.url, HTTP_AUTHORIZATION=f'Api-Key {api_key}')
+
+    def test_regenerated_key_revokes_the_old_one(self):
+        old_key = self.platform.api_key
+        self.assertEqual(self.get(old_key).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            new_key = self.platform.regenerate_api_key()
+        self.assertEqual(self.get(old_key).status_code, 401)
+        self.assertEqual(self.get(new_key).status_code, 200)
+
+    def test_deactivation_revokes_access(self):
+        self.assertEqual(self.get(self.platform.api_key).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.platform.is_active = False
+            self.platform.save()
+        self.assertEqual(self.get(self.platform.api_key).status_code, 401)
+
+    def test_eviction_waits_for_commit(self):
+        self.get(self.platform.api_key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Platform.objects.get(pk=self.platform.pk).delete()
+            self.assertIsNotNone(platform_cache.get(self.platform.api_key))
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertIsNone(platform_cache.get(self.platform.api_key))
+
+    def test_row_read_before_eviction_is_not_cached(self):
+        generation = platform_cache.generation()
+        stale = Platform.objects.get(pk=self.platform.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.platform.regenerate_api_key()
+        platform_cache.set(stale.api_key, stale, generation)
+        self.assertIsNone(platform_cache.get(stale.api_key))
+        self.assertEqual(self.get(stale.api_key).status_code, 401)
+
+
+class PlatformQueryScalingTests(QueryScalingMixin, TestCase):
+    clients_url = '/api/v1/platforms/clients/'
+    users_url = '/api/v1/platforms/users/'
+
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        platform_cache.set(self.platform.api_key, self.platform)
+
+    def clients(self, size):
+        Client.objects.bulk_create([
+            Client(platform=self.platform, name=f'Cliente {i}', cedula=uuid.uuid4().hex[:13]) for i in range(size)
+        ])
+
+    def client_with_loans(self, size):
+        """A client with `size` loans, each discussed in a conversation."""
+        client = Client.objects.create(platform=self.platform, name='Juan', cedula=uuid.uuid4().hex[:13])
+        loans = Loan.objects.bulk_create([
+            Loan(client=client, external_id=f'P{i}', amount=1000, balance=500) for i in range(size)
+        ])
+        Conversation.objects.bulk_create([
+            Conversation(platform=self.platform, client=client, loan=loan) for loan in loans
+        ])
+        return client
+
+    def users(self, size):
+        PlatformUser.objects.bulk_create([
+            PlatformUser(platform=self.platform, external_id=uuid.uuid4().hex, name=f'Operador {i}')
+            for i in range(size)
+        ])
+
+    def user_with_cases(self, size):
+        user = PlatformUser.objects.create(platform=self.platform, external_id=uuid.uuid4().hex, name='Operador')
+        Conversation.objects.bulk_create([
+            Conversation(platform=self.platform, platform_user=user) for _ in range(size)
+        ])
+        return user
+
+    def test_client_actions(self):
+        detail = lambda client: f'{self.clients_url}{client.pk}/'
+        actions = {
+            'list': (self.clients, lambda _: self.api.get(self.clients_url)),
+            'create': (self.clients, lambda _: self.api.post(
+                self.clients_url, {'name': 'Maria', 'cedula': uuid.uuid4().hex[:11]}, format='json',
+            )),
+            'retrieve': (self.client_with_loans, lambda client: self.api.get(detail(client))),
+            'update': (self.client_with_loans, lambda client: self.api.put(
+                detail(client), {'name': 'Juan Perez', 'cedula': client.cedula}, format='json',
+            )),
+            'partial_update': (self.client_with_loans, lambda client: self.api.patch(
+                detail(client), {'phone': '8095551234'}, format='json',
+            )),
+            'destroy': (self.client_with_loans, lambda client: self.api.delete(detail(client))),
+            'loans': (self.client_with_loans, lambda client: self.api.get(f'{detail(client)}loans/')),
+        }
+        for action, (seed, request) in actions.items():
+            with self.subTest(action):
+                self.assertConstantQueries(seed, request)
+
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite splits bulk INSERTs at its parameter limit')
+    def test_client_bulk_upsert(self):
+        rows = lambda size: [{'name': f'Cliente {i}', 'external_id': uuid.uuid4().hex} for i in range(size)]
+        self.assertConstantQueries(rows, lambda rows: self.api.post(f'{self.clients_url}bulk/', rows, format='json'))
+
+    def test_platform_user_actions(self):
+        detail = lambda user: f'{self.users_url}{user.pk}/'
+        actions = {
+            'list': (self.users, lambda _: self.api.get(self.users_url)),
+            'create': (self.users, lambda _: self.api.post(
+                self.users_url, {'external_id': uuid.uuid4().hex, 'name': 'Operador'}, format='json',
+            )),
+            'retrieve': (self.user_with_cases, lambda user: self.api.get(detail(user))),
+            'update': (self.user_with_cases, lambda user: self.api.put(
+                detail(user), {'external_id': user.external_id, 'name': 'Supervisor'}, format='json',
+            )),
+            'partial_update': (self.user_with_cases, lambda user: self.api.patch(
+                detail(user), {'role': 'admin'}, format='json',
+            )),
+            'destroy': (self.user_with_cases, lambda user: self.api.delete(detail(user))),
+        }
+        for action, (seed, request) in actions.items():
+            with self.subTest(action):
+                self.assertConstantQueries(seed, request)
@@ -1,13 +1,18 @@
 """API views for platforms app."""
+from django.db import IntegrityError, transaction
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from .bulk import upsert_clients
+from .ingest import iter_request_rows
 from .models import Platform, PlatformUser, Client
 from .serializers import (
     PlatformSerializer, PlatformRegistrationSerializer,
     PlatformUserSerializer, ClientSerializer, ClientCreateSerializer
 )
 from .authentication import APIKeyAuthentication, PlatformPermission
+from .pagination import PlatformAPIPagination
 
 
 class PlatformRegistrationViewSet(viewsets.ViewSet):
@@ -33,6 +38,8 @@ class PlatformUserViewSet(viewsets.ModelViewSet):
     serializer_class = PlatformUserSerializer
     authentication_classes = [APIKeyAuthentication]
     permission_classes = [PlatformPermission]
+    pagination_class = PlatformAPIPagination
+    keyset_ordering = ('-created_at',)
 
     def get_queryset(self):
         return PlatformUser.objects.filter(platform=self.request.platform)
@@ -45,6 +52,8 @@ class ClientViewSet(viewsets.ModelViewSet):
     """ViewSet for Client CRUD operations."""
     authentication_classes = [APIKeyAuthentication]
     permission_classes = [PlatformPermission]
+    pagination_class = PlatformAPIPagination
+    keyset_ordering = ('-created_at',)
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -55,7 +64,26 @@ class ClientViewSet(viewsets.ModelViewSet):
         return Client.objects.filter(platform=self.request.platform)
 
     def perform_create(self, serializer):
-        serializer.save(platform=self.request.platform)
+        self._save_unique(serializer, platform=self.request.platform)
+
+    def perform_update(self, serializer):
+        self._save_unique(serializer)
+
+    def _save_unique(self, serializer, **kwargs):
+        try:
+            with transaction.atomic():
+                serializer.save(**kwargs)
+        except IntegrityError:
+            raise ValidationError({'non_field_errors': ['A client with this external_id or cedula already exists.']})
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create or update many clients keyed by external_id, then cedula.
+        Accepts a JSON array, NDJSON (application/x-ndjson) or CSV with a header (text/csv).
+        Returns the counts per status and lists only the rows that were not written.
+        """
+        return Response(upsert_clients(request.platform, iter_request_rows(request)))
 
     @action(detail=True, methods=['get'])
     def loans(self, request, pk=None):
@@ -0,0 +1,87 @@
+"""
+Internal Prometheus endpoint (/internal/metrics/): per-view SQL totals from
+QueryBudgetMiddleware plus the stats() of the process-local components. Readable with
+`Authorization: Bearer <METRICS_TOKEN>` or from a staff session.
+"""
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from .query_budget import query_budget, view_query_stats
+
+PREFIX = 'avocado'
+
+VIEW_METRICS = (
+    # (name, type, help, value)
+    ('view_requests_total', 'counter', 'Requests served by the view.', lambda view: view['requests']),
+    ('view_queries_total', 'counter', 'SQL queries run by the view.', lambda view: view['queries']),
+    ('view_sql_seconds_total', 'counter', 'Time spent in SQL by the view.', lambda view: view['sql_seconds']),
+    ('view_max_queries', 'gauge', 'Most queries run by one request to the view.', lambda view: view['max_queries']),
+    ('view_query_budget_exceeded_total', 'counter', 'Requests over the view query budget.',
+     lambda view: view['over_budget']),
+)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def component_stats():
+    """(metric prefix, stats dict) of each component that keeps counters in this process."""
+    from apps.conversations.consumers import typing_stats
+    from apps.conversations.persistence import message_buffer
+    from apps.notifications.dispatch import backlog
+    from apps.platforms.cache import platform_cache
+    from config.postgresql_pool import pool_stats
+
+    components = [
+        ('platform_cache', platform_cache.stats()),
+        ('chat_write_buffer', message_buffer.stats()),
+        ('chat_typing', typing_stats()),
+        ('notifications', backlog()),
+    ]
+    pool = pool_stats()
+    if pool is not None:
+        components.append(('db_pool', pool))
+    return components
+
+
+def render_metrics():
+    lines = []
+    views = sorted(view_query_stats.snapshot().items())
+    for name, metric_type, help_text, value in VIEW_METRICS:
+        lines += [f'# HELP {PREFIX}_{name} {help_text}', f'# TYPE {PREFIX}_{name} {metric_type}']
+        lines += [f'{PREFIX}_{name}{{view="{escape_label(view_name)}"}} {value(view)}' for view_name, view in views]
+
+    lines += [
+        f'# HELP {PREFIX}_view_query_budget Query budget of the view.',
+        f'# TYPE {PREFIX}_view_query_budget gauge',
+    ]
+    lines += [
+        f'{PREFIX}_view_query_budget{{view="{escape_label(view_name)}"}} {query_budget(view_name)}'
+        for view_name, _ in views if query_budget(view_name) is not None
+    ]
+    lines += [
+        f'# HELP {PREFIX}_view_slowest_query_seconds Slowest SQL statement seen for the view.',
+        f'# TYPE {PREFIX}_view_slowest_query_seconds gauge',
+    ]
+    # Only the view as label: the statement itself is logged by ViewQueryStats.record
+    lines += [
+        f'{PREFIX}_view_slowest_query_seconds{{view="{escape_label(view_name)}"}} {view["slowest_seconds"]}'
+        for view_name, view in views
+    ]
+
+    for component, stats in component_stats():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                lines += [f'# TYPE {PREFIX}_{component}_{key} gauge', f'{PREFIX}_{component}_{key} {float(value)}']
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    authorized = (
+        token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    ) or request.user.is_staff
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
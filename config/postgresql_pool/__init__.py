@@ -0,0 +1,11 @@
+"""
+PostgreSQL backend with a per-process pool of psycopg2 connections (ENGINE
+'config.postgresql_pool', enabled with DB_POOL=true, see settings.py).
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def pool_stats(alias=DEFAULT_DB_ALIAS):
+    """ConnectionPool.stats() for the alias, or None when it is not pooled."""
+    pool = getattr(connections[alias], 'pool', None)
+    return pool.stats() if pool is not None else None
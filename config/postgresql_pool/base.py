@@ -0,0 +1,48 @@
+"""
+Django's PostgreSQL backend, taking connections from a ConnectionPool configured by
+DATABASES[alias]['POOL'] instead of opening one per request or consumer call.
+Closing the Django connection (end of request, close_old_connections) returns it.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from .pool import ConnectionPool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Pool the current connection was taken from; close_pool() may have replaced it since
+    connection_pool = None
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict.get('POOL')
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+
+        if self.alias not in self._connection_pools:
+            if self.settings_dict.get('CONN_MAX_AGE', 0) != 0:
+                raise ImproperlyConfigured("Pooling doesn't support persistent connections.")
+            connect_kwargs = self.get_connection_params()
+            pool = ConnectionPool(
+                connect=lambda: self.Database.connect(**connect_kwargs),
+                configure=self._configure_connection,
+                **pool_options,
+            )
+            # Threads racing to create the pool all end up using the first one stored
+            self._connection_pools.setdefault(self.alias, pool)
+        return self._connection_pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        self.connection_pool = self.pool
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.connection_pool is None:
+                return self.connection.close()
+            self.connection_pool.putconn(self.connection)
+            self.connection = None
+            self.connection_pool = None
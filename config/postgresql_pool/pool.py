@@ -0,0 +1,188 @@
+"""Thread-safe pool of psycopg2 connections shared by every thread of a process."""
+import logging
+import threading
+import time
+from collections import deque
+import psycopg2
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No connection became available within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    Keeps up to `size` connections open for reuse and lets up to `max_overflow`
+    more be opened under load; those are closed when returned. A connection that
+    sat idle longer than `check_idle` seconds is pinged before being handed out,
+    and one older than `max_lifetime` is replaced. Waiting for a free connection
+    raises PoolTimeout after `timeout` seconds.
+
+    Exposes the open/getconn/putconn/close interface of psycopg_pool.ConnectionPool,
+    which is what Django's PostgreSQL backend drives.
+    """
+
+    def __init__(self, connect, configure=None, size=10, max_overflow=10, timeout=10.0,
+                 check_idle=30.0, max_lifetime=1800.0):
+        self.connect = connect
+        self.configure = configure
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_lifetime = max_lifetime
+        self._idle = deque()  # (connection, opened_at, returned_at), most recently returned last
+        self._opened_at = {}  # id(connection) -> opened_at, for every open connection
+        self._open = 0
+        self._closed = False
+        self._available = threading.Condition()
+        self.checkouts = 0
+        self.created = 0
+        self.closed = 0
+        self.health_check_failures = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def open(self):
+        """Connections are opened on demand; kept for interface compatibility."""
+
+    def getconn(self):
+        started = time.monotonic()
+        while True:
+            connection, opened_at, returned_at = self._reserve(started)
+            if connection is None:
+                connection = self._new_connection()
+                break
+            if self._usable(connection, opened_at, returned_at):
+                break
+            self._discard(connection)
+
+        waited = time.monotonic() - started
+        with self._available:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return connection
+
+    def putconn(self, connection):
+        if connection.closed:
+            self._discard(connection)
+            return
+        if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                self._discard(connection)
+                return
+        with self._available:
+            opened_at = self._opened_at.get(id(connection), 0.0)
+            keep = (
+                not self._closed
+                and len(self._idle) < self.size
+                and time.monotonic() - opened_at < self.max_lifetime
+            )
+            if keep:
+                self._idle.append((connection, opened_at, time.monotonic()))
+                self._available.notify()
+                return
+        self._discard(connection)
+
+    def close(self):
+        """Close the idle connections; the ones in use are closed when returned."""
+        with self._available:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._available:
+            idle = len(self._idle)
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': idle,
+                'in_use': self._open - idle,
+                'checkouts': self.checkouts,
+                'created': self.created,
+                'reuse_ratio': 1 - self.created / self.checkouts if self.checkouts else 0.0,
+                'wait_seconds_total': self.wait_seconds,
+                'wait_seconds_avg': self.wait_seconds / self.checkouts if self.checkouts else 0.0,
+                'wait_seconds_max': self.max_wait_seconds,
+                'timeouts': self.timeouts,
+                'health_check_failures': self.health_check_failures,
+                'closed': self.closed,
+            }
+
+    def _reserve(self, started):
+        """Take an idle connection, or a slot to open one (returned as None), waiting if neither is free."""
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    return None, None, None
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f'No database connection available after {self.timeout}s '
+                        f'({self.size} + {self.max_overflow} in use)'
+                    )
+                self._available.wait(remaining)
+
+    def _new_connection(self):
+        connection = None
+        try:
+            connection = self.connect()
+            if self.configure is not None:
+                self.configure(connection)
+                # configure() may have run statements; leave the connection idle
+                if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.commit()
+        except Exception:
+            if connection is not None:
+                connection.close()
+            with self._available:
+                self._open -= 1
+                self._available.notify()
+            raise
+        with self._available:
+            self._opened_at[id(connection)] = time.monotonic()
+            self.created += 1
+        return connection
+
+    def _usable(self, connection, opened_at, returned_at):
+        now = time.monotonic()
+        if connection.closed or now - opened_at >= self.max_lifetime:
+            return False
+        if now - returned_at < self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            return True
+        except psycopg2.Error:
+            logger.warning('Dropping a pooled database connection that failed its health check')
+            with self._available:
+                self.health_check_failures += 1
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._available:
+            self._opened_at.pop(id(connection), None)
+            self._open -= 1
+            self.closed += 1
+            self._available.notify()
@@ -0,0 +1,73 @@
+from unittest import skipUnless
+import psycopg2
+from django.db import connection
+from django.test import SimpleTestCase
+from .base import DatabaseWrapper
+from .pool import ConnectionPool, PoolTimeout
+
+
+@skipUnless(connection.vendor == 'postgresql', 'The pool only wraps psycopg2')
+class ConnectionPoolTests(SimpleTestCase):
+    databases = {'default'}
+
+    def pool(self, **options):
+        params = connection.get_connection_params()
+        pool = ConnectionPool(connect=lambda: psycopg2.connect(**params), **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def backend_pid(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_reuses_and_bounds_connections(self):
+        pool = self.pool(size=1, max_overflow=1, timeout=0.05)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        overflow = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+
+        # Only `size` connections are kept idle; the one returned beyond that is closed
+        pool.putconn(first)
+        pool.putconn(overflow)
+        self.assertTrue(overflow.closed)
+        stats = pool.stats()
+        self.assertEqual((stats['open'], stats['idle'], stats['checkouts'], stats['created']), (1, 1, 3, 2))
+        self.assertAlmostEqual(stats['reuse_ratio'], 1 / 3)
+        self.assertEqual(stats['timeouts'], 1)
+
+    def test_returned_transactions_are_rolled_back(self):
+        pool = self.pool(size=1)
+        conn = pool.getconn()
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        pool.putconn(conn)
+        self.assertEqual(conn.get_transaction_status(), psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+    def test_health_check_replaces_dead_connections(self):
+        pool = self.pool(size=1, check_idle=0)
+        conn = pool.getconn()
+        pid = self.backend_pid(conn)
+        conn.rollback()
+        pool.putconn(conn)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+
+        with self.assertLogs('config.postgresql_pool.pool', 'WARNING'):
+            replacement = pool.getconn()
+        self.assertNotEqual(self.backend_pid(replacement), pid)
+        self.assertEqual(pool.stats()['health_check_failures'], 1)
+        pool.putconn(replacement)
+
+    def test_django_connections_come_from_the_pool(self):
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'POOL': {'size': 2}}, alias='pooled')
+        self.addCleanup(wrapper.close_pool)
+        for _ in range(3):
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            wrapper.close()
+        stats = wrapper.pool.stats()
+        self.assertEqual((stats['checkouts'], stats['created'], stats['idle']), (3, 1, 1))
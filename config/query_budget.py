@@ -0,0 +1,156 @@
+"""
+Per-view SQL accounting. QueryBudgetMiddleware counts the queries each request runs,
+their total time and the slowest one, aggregates them by resolved view name (URL name,
+e.g. 'conversation-messages') for the metrics endpoint, and checks the count against
+QUERY_BUDGETS. Queries run while a streaming response is consumed happen after the
+middleware has returned and are not counted.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Recorder of the request being served; sync_to_async copies it into worker threads
+_current_recorder = ContextVar('query_recorder', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """A view ran more queries than its budget while QUERY_BUDGET_RAISE is set."""
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = ''
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if elapsed >= self.slowest_seconds:
+                self.slowest_seconds = elapsed
+                self.slowest_sql = sql
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # execute_wrappers lives on the DatabaseWrapper, which outlives reconnects
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ViewQueryStats:
+    """Totals per view name since the process started."""
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view_name, recorder, over_budget):
+        with self._lock:
+            view = self._views.setdefault(view_name, {
+                'requests': 0, 'queries': 0, 'sql_seconds': 0.0, 'max_queries': 0,
+                'slowest_seconds': 0.0, 'slowest_sql': '', 'over_budget': 0,
+            })
+            view['requests'] += 1
+            view['queries'] += recorder.count
+            view['sql_seconds'] += recorder.seconds
+            view['max_queries'] = max(view['max_queries'], recorder.count)
+            view['over_budget'] += over_budget
+            slower = recorder.slowest_seconds > view['slowest_seconds']
+            if slower:
+                view['slowest_seconds'] = recorder.slowest_seconds
+                view['slowest_sql'] = recorder.slowest_sql
+        if slower:
+            logger.info(
+                'Slowest query so far for %s: %.1f ms: %s', view_name, recorder.slowest_seconds * 1000,
+                recorder.slowest_sql[:300],
+            )
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(view) for name, view in self._views.items()}
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_query_stats = ViewQueryStats()
+
+
+def query_budget(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryBudgetMiddleware:
+    """Goes first in MIDDLEWARE so the session and user lookups count too."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported missed connection_created
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(None, connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        self.check(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        self.check(request, recorder)
+        return response
+
+    def check(self, request, recorder):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return  # 404 before any view ran
+        budget = query_budget(match.view_name)
+        over_budget = budget is not None and recorder.count > budget
+        view_query_stats.record(match.view_name, recorder, over_budget)
+        if not over_budget:
+            return
+        message = (
+            f'{match.view_name} ran {recorder.count} queries (budget {budget}) in '
+            f'{recorder.seconds * 1000:.1f} ms; slowest: {recorder.slowest_sql[:300]}'
+        )
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -82,11 +83,45 @@ DATABASES = {
     }
 }
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# DB_POOL=true keeps a per-process pool of PostgreSQL connections (config/postgresql_pool)
+# that HTTP requests and consumer database calls check out and return, instead of
+# connecting on every request. Up to DB_POOL_SIZE stay open; DB_POOL_MAX_OVERFLOW more
+# may be opened under load; connections idle for DB_POOL_CHECK_IDLE seconds are pinged
+# before reuse. Size it so workers x (size + overflow) stays under max_connections.
+if os.environ.get('DB_POOL', 'false').lower() == 'true':
+    DATABASES['default']['ENGINE'] = 'config.postgresql_pool'
+    DATABASES['default']['POOL'] = {
+        'size': int(os.environ.get('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', '10')),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        'check_idle': float(os.environ.get('DB_POOL_CHECK_IDLE', '30')),
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+    }
+
+# CHANNEL_LAYER=postgres fans out across Daphne processes through the main database
+# (apps/conversations/layers.py); the in-memory layer only works with a single process
+if os.environ.get('CHANNEL_LAYER') == 'postgres':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'apps.conversations.layers.PostgresChannelLayer'
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
     }
-}
+
+# ChatConsumer writes messages in batches (apps/conversations/persistence.py): a flush
+# runs once CHAT_WRITE_BATCH_SIZE messages are pending or every CHAT_WRITE_FLUSH_INTERVAL seconds
+CHAT_WRITE_BATCH_SIZE = int(os.environ.get('CHAT_WRITE_BATCH_SIZE', '100'))
+CHAT_WRITE_FLUSH_INTERVAL = float(os.environ.get('CHAT_WRITE_FLUSH_INTERVAL', '0.25'))
+
+# Typing indicators: at most one start/stop per connection every CHAT_TYPING_MIN_INTERVAL
+# seconds; a start without a stop or refresh within CHAT_TYPING_TIMEOUT seconds ends
+CHAT_TYPING_MIN_INTERVAL = float(os.environ.get('CHAT_TYPING_MIN_INTERVAL', '1.0'))
+CHAT_TYPING_TIMEOUT = float(os.environ.get('CHAT_TYPING_TIMEOUT', '6.0'))
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -121,6 +156,61 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# In-process cache of platforms resolved by API key (apps/platforms/cache.py).
+# Saving a platform evicts it once the transaction commits, but only in the process
+# that saved it: other workers keep accepting a regenerated key or a deactivated
+# platform until their entry expires, up to API_KEY_CACHE_TTL seconds.
+API_KEY_CACHE_MAX_SIZE = int(os.environ.get('API_KEY_CACHE_MAX_SIZE', '1024'))
+API_KEY_CACHE_TTL = int(os.environ.get('API_KEY_CACHE_TTL', '60'))
+
+# Seconds a lawyer's dashboard counters are cached; case changes drop them sooner
+LAWYER_DASHBOARD_CACHE_TTL = int(os.environ.get('LAWYER_DASHBOARD_CACHE_TTL', '30'))
+
+# Outgoing email (lawyer notifications)
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False').lower() == 'true'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'notificaciones@jcjconsultings.com')
+
+# Notification dispatcher (python manage.py dispatch_notifications): rows per batch,
+# delivery attempts before giving up, and the first retry delay in seconds (doubles each time)
+NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE', '100'))
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', '5'))
+NOTIFICATION_RETRY_BASE = int(os.environ.get('NOTIFICATION_RETRY_BASE', '30'))
+# Seconds a dispatcher may take to deliver the rows it claimed before another worker retries them
+NOTIFICATION_CLAIM_LEASE = int(os.environ.get('NOTIFICATION_CLAIM_LEASE', '300'))
+# New-message notifications wait this many seconds; messages arriving meanwhile fold into them
+NOTIFICATION_COALESCE_WINDOW = int(os.environ.get('NOTIFICATION_COALESCE_WINDOW', '60'))
+
+# SQL queries allowed per request, by URL name (config/query_budget.py). A request over
+# its view's budget is logged with its slowest statement; QUERY_BUDGET_RAISE=true makes
+# it an error instead, e.g. `QUERY_BUDGET_RAISE=true python manage.py test`.
+QUERY_BUDGETS = {
+    # POST creates the client, the case, a welcome message and the assignment, each in an
+    # atomic block (a SAVEPOINT pair apiece under TestCase, where budgets are enforced)
+    'conversation-list': 18,
+    'conversation-detail': 8,  # PUT/PATCH/DELETE also lock the case and move the lawyer counters
+    'conversation-messages': 4,  # API key cache miss plus the ?after= cursor lookup
+    'conversation-send-message': 10,  # the first message of a burst inserts its notification in a SAVEPOINT
+    'conversation-read': 6,
+    'conversation-search': 4,  # API key cache miss, COUNT and the page
+    'loan-list': 4,
+    'client-list': 8,
+    'platformuser-list': 4,
+    'lawyers:dashboard': 8,
+    'lawyers:conversation_list': 6,
+    'lawyers:conversation_detail': 10,
+    'lawyers:queue': 6,
+    'lawyers:search': 6,
+    'lawyers:send_message': 10,
+}
+QUERY_BUDGET_DEFAULT = int(os.environ.get('QUERY_BUDGET_DEFAULT', '50'))
+QUERY_BUDGET_RAISE = os.environ.get('QUERY_BUDGET_RAISE', 'false').lower() == 'true'
+# Bearer token Prometheus sends to /internal/metrics/; staff sessions can read it too
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
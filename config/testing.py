@@ -0,0 +1,34 @@
+"""Test helpers shared by the apps' test suites."""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Related rows seeded before each measured request
+SCALING_SIZES = (1, 10, 100)
+
+
+class QueryScalingMixin:
+    """
+    assertConstantQueries catches N+1 regressions: a request must run as many queries
+    whether the data behind it has 1, 10 or 100 rows.
+    """
+
+    def assertConstantQueries(self, seed, request):
+        """
+        For each size, seed(size) creates that many related rows and returns what
+        request(target) needs; only the request is counted. Streaming responses are
+        consumed inside the count.
+        """
+        counts = {}
+        for size in SCALING_SIZES:
+            target = seed(size)
+            with CaptureQueriesContext(connection) as queries:
+                response = request(target)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, response.content if not response.streaming else '')
+            counts[size] = len(queries)
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f'Query count grows with the data (rows: queries): {counts}\n' + '\n'.join(q['sql'] for q in queries),
+        )
+        return counts[SCALING_SIZES[0]]
@@ -0,0 +1,54 @@
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework.test import APIClient
+from apps.conversations.models import Conversation, Message, SenderType
+from apps.platforms.models import Platform
+from .query_budget import QueryBudgetExceeded, view_query_stats
+
+
+@override_settings(METRICS_TOKEN='s3cret')
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name='Prestamos RD', domain='prestamos.do')
+        conversation = Conversation.objects.create(platform=self.platform)
+        Message.objects.create(conversation=conversation, sender_type=SenderType.LAWYER, content='Hola')
+        self.url = f'/api/v1/conversations/{conversation.pk}/messages/'
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.platform.api_key}')
+        view_query_stats.clear()
+
+    def test_counts_queries_per_view(self):
+        with self.assertLogs('config.query_budget', 'INFO') as logs:
+            self.api.get(self.url)
+        self.assertIn('Slowest query so far for conversation-messages', logs.output[0])
+        self.api.get('/api/v1/conversations/')
+        stats = view_query_stats.snapshot()
+        self.assertEqual(stats['conversation-messages']['requests'], 1)
+        # Platform lookup on a cache miss, the conversation and its messages
+        self.assertEqual(stats['conversation-messages']['queries'], 3)
+        self.assertIn('SELECT', stats['conversation-list']['slowest_sql'])
+
+    async def test_counts_queries_of_async_views(self):
+        await AsyncClient().get(self.url, headers={'Authorization': f'Api-Key {self.platform.api_key}'})
+        self.assertGreaterEqual(view_query_stats.snapshot()['conversation-messages']['queries'], 2)
+
+    def test_over_budget_logs_or_raises(self):
+        with override_settings(QUERY_BUDGETS={'conversation-messages': 1}, QUERY_BUDGET_RAISE=False):
+            with self.assertLogs('config.query_budget', 'WARNING') as logs:
+                self.api.get(self.url)
+            self.assertIn('conversation-messages ran', logs.output[0])
+            with override_settings(QUERY_BUDGET_RAISE=True), self.assertRaises(QueryBudgetExceeded):
+                self.api.get(self.url)
+        self.assertEqual(view_query_stats.snapshot()['conversation-messages']['over_budget'], 2)
+
+    def test_metrics_endpoint(self):
+        self.api.get(self.url)
+        self.assertEqual(self.client.get('/internal/metrics/').status_code, 403)
+        response = self.client.get('/internal/metrics/', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('avocado_view_queries_total{view="conversation-messages"} 3', body)
+        self.assertIn('avocado_view_query_budget{view="conversation-messages"} 4', body)
+        self.assertRegex(body, r'avocado_view_slowest_query_seconds\{view="conversation-messages"\} [0-9.e-]+\n')
+        self.assertNotIn('SELECT', body)
+        self.assertIn('avocado_platform_cache_hit_ratio ', body)
+        self.assertIn('avocado_notifications_backlog 0.0', body)
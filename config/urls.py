@@ -5,6 +5,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView, RedirectView
 from django.views.decorators.clickjacking import xframe_options_exempt
+from config.metrics import metrics_view
 
 
 # Widget embed view that allows iframe embedding from any origin
@@ -24,6 +25,7 @@ urlpatterns = [
     path('demo/', TemplateView.as_view(template_name='demo.html'), name='demo'),
     path('platforms/register/', TemplateView.as_view(template_name='platforms/register.html'), name='platform_register'),
     path('widget/embed/', widget_embed_view, name='widget_embed'),
+    path('internal/metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG: